@@ -0,0 +1,272 @@
+"""NumPy column store for cross-user workout analytics.
+
+``WorkoutAnalytics`` keeps the columns of ``workout_records`` (id, user id,
+category id, date ordinal, duration, calories, difficulty) in contiguous
+NumPy arrays. The dashboard's global aggregates (trend, leaderboard,
+percentile, category comparison) are then computed with boolean masks and
+``np.bincount`` group-bys instead of SQL scans.
+
+New rows are appended incrementally by reading ``id > last_id`` once a
+commit has signalled new records. The ids of records updated or deleted
+through the session are collected at flush and, once committed, re-read by
+id on the next refresh: rows are overwritten in place (ids stay sorted, so
+a row is found with a binary search) or dropped if the record is gone. Only
+a rollup rebuild triggers a full reload. Refreshes and reads share one lock,
+so a read never sees the columns mid-resize from another request or from
+the background refresher.
+
+Enable it with ``app.config['ANALYTICS_BACKEND'] = 'numpy'``; the default
+backend runs the same aggregates as SQL over ``workout_daily_rollups``.
+"""
+import threading
+from datetime import date
+from functools import wraps
+
+import numpy as np
+from sqlalchemy import event, select
+
+from models import db, WorkoutRecord
+from percentile import percentile_from_rank
+from ranges import bucket_start, bucket_starts
+from rollup import rollup_changed, rollup_rebuilt
+
+COLUMNS = (
+    ('id', np.int64),
+    ('user_id', np.int64),
+    ('category_id', np.int64),
+    ('day', np.int32),
+    ('duration', np.float64),
+    ('calories', np.float64),
+    ('difficulty', np.float64),
+)
+CHUNK_ROWS = 50_000
+
+_SELECT = select(
+    WorkoutRecord.id,
+    WorkoutRecord.user_id,
+    WorkoutRecord.category_id,
+    WorkoutRecord.date,
+    WorkoutRecord.duration_min,
+    WorkoutRecord.calories_burn,
+    WorkoutRecord.difficulty
+)
+
+
+def _rows(rows):
+    """Selected rows as a float64 matrix in COLUMNS order."""
+    return np.array([
+        (rid, uid, cid, day.toordinal(), duration or 0, calories or 0, difficulty or 0)
+        for rid, uid, cid, day, duration, calories, difficulty in rows
+    ], dtype=np.float64)
+
+
+def _locked(method):
+    """Run a read under the engine lock, so a concurrent refresh cannot resize or compact the columns."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class WorkoutAnalytics:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._changed = set()
+        self._reset()
+        rollup_changed.connect(self._on_change, weak=False)
+        rollup_rebuilt.connect(self._on_rebuild, weak=False)
+        event.listen(db.session, 'after_flush', self._on_flush)
+        event.listen(db.session, 'after_commit', self._on_commit)
+        event.listen(db.session, 'after_rollback', self._on_rollback)
+
+    def _reset(self):
+        self.size = 0
+        self.last_id = 0
+        self._arrays = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+        self._new_rows = True
+        self._reload = False
+
+    def _on_change(self, sender, deltas, **kwargs):
+        # Edits and deletes were collected by id at flush; this only flags inserts
+        self._new_rows = True
+
+    def _on_flush(self, session, flush_context):
+        changed = [
+            obj.id for obj in session.deleted if isinstance(obj, WorkoutRecord)
+        ] + [
+            obj.id for obj in session.dirty if isinstance(obj, WorkoutRecord) and session.is_modified(obj)
+        ]
+        if changed:
+            session.info.setdefault('analytics_changed', set()).update(changed)
+
+    def _on_commit(self, session):
+        changed = session.info.pop('analytics_changed', None)
+        if changed:
+            with self._lock:
+                self._changed.update(changed)
+
+    def _on_rollback(self, session):
+        session.info.pop('analytics_changed', None)
+
+    def _on_rebuild(self, sender):
+        self._reload = True
+        self._new_rows = True
+
+    def column(self, name):
+        return self._arrays[name][:self.size]
+
+    def _append(self, chunk):
+        needed = self.size + len(chunk)
+        capacity = len(self._arrays['day'])
+        if needed > capacity:
+            capacity = max(needed, capacity * 2, 1024)
+            for name, dtype in COLUMNS:
+                grown = np.empty(capacity, dtype=dtype)
+                grown[:self.size] = self._arrays[name][:self.size]
+                self._arrays[name] = grown
+        data = _rows(chunk)
+        for i, (name, _) in enumerate(COLUMNS):
+            self._arrays[name][self.size:needed] = data[:, i]
+        self.last_id = int(data[-1, 0])
+        self.size = needed
+
+    def _update(self, ids):
+        """Re-read loaded rows by id, overwriting them in place or dropping deleted ones."""
+        ids = np.array(sorted(i for i in ids if i <= self.last_id), dtype=np.int64)
+        loaded = self.column('id')
+        positions = np.searchsorted(loaded, ids)
+        present = positions < self.size
+        present[present] = loaded[positions[present]] == ids[present]
+        ids, positions = ids[present], positions[present]
+        if not len(ids):
+            return 0
+        found = {
+            row[0]: row for row in db.session.execute(_SELECT.where(WorkoutRecord.id.in_(ids.tolist())))
+        }
+        kept = np.array([int(i) in found for i in ids], dtype=bool)
+        if kept.any():
+            data = _rows([found[int(i)] for i in ids[kept]])
+            for i, (name, _) in enumerate(COLUMNS):
+                self._arrays[name][positions[kept]] = data[:, i]
+        if not kept.all():
+            keep = np.ones(self.size, dtype=bool)
+            keep[positions[~kept]] = False
+            size = int(np.count_nonzero(keep))
+            for name, _ in COLUMNS:
+                self._arrays[name][:size] = self.column(name)[keep]
+            self.size = size
+        return len(ids)
+
+    def refresh(self):
+        """Apply committed edits by id and load rows added since the last refresh (or everything
+        after a reload); returns the number of rows read."""
+        with self._lock:
+            if self._reload:
+                self._reset()
+                self._changed.clear()
+            loaded = 0
+            if self._changed:
+                loaded += self._update(self._changed)
+                self._changed.clear()
+            if not self._new_rows:
+                return loaded
+            self._new_rows = False
+            stmt = _SELECT.where(WorkoutRecord.id > self.last_id).order_by(WorkoutRecord.id)
+            result = db.session.execute(stmt.execution_options(yield_per=CHUNK_ROWS))
+            for partition in result.partitions():
+                self._append(partition)
+                loaded += len(partition)
+            return loaded
+
+    def _mask(self, rng):
+        day = self.column('day')
+        return (day >= rng.start.toordinal()) & (day <= rng.end.toordinal())
+
+    @_locked
+    def user_totals(self, rng):
+        """Return (user_ids, calories, minutes) for every user with records in the range."""
+        mask = self._mask(rng)
+        users = self.column('user_id')[mask]
+        # User ids are small positive integers, so bincount groups without sorting
+        counts = np.bincount(users)
+        ids = np.nonzero(counts)[0]
+        calories = np.bincount(users, weights=self.column('calories')[mask])[ids]
+        minutes = np.bincount(users, weights=self.column('duration')[mask])[ids]
+        return ids, calories, minutes
+
+    def _bucketed(self, rng):
+        """Return (bucket starts, mask of the rows in the range, bucket index of each of them)."""
+        starts = bucket_starts(rng)
+        first = starts[0].toordinal()
+        # Map each day offset in the range to its bucket index
+        index = {d: i for i, d in enumerate(starts)}
+        lookup = np.array([
+            index[bucket_start(date.fromordinal(o), rng.bucket)]
+            for o in range(first, rng.end.toordinal() + 1)
+        ], dtype=np.int64)
+
+        mask = self._mask(rng)
+        return starts, mask, lookup[self.column('day')[mask] - first]
+
+    def _average(self, starts, buckets, duration, user_count):
+        if not user_count:
+            return [0.0] * len(starts)
+        return (np.bincount(buckets, weights=duration, minlength=len(starts)) / user_count).tolist()
+
+    @_locked
+    def average_trend(self, rng, user_count):
+        """Return (bucket_starts, average_minutes) over all ``user_count`` users."""
+        starts, mask, buckets = self._bucketed(rng)
+        return starts, self._average(starts, buckets, self.column('duration')[mask], user_count)
+
+    @_locked
+    def trend(self, user_id, rng, user_count):
+        """Return (bucket_starts, your_minutes, average_minutes) like record.trend_series."""
+        starts, mask, buckets = self._bucketed(rng)
+        duration = self.column('duration')[mask]
+        mine = self.column('user_id')[mask] == user_id
+        yours = np.bincount(buckets[mine], weights=duration[mine], minlength=len(starts))
+        return starts, yours.tolist(), self._average(starts, buckets, duration, user_count)
+
+    @_locked
+    def top(self, rng, limit):
+        ids, calories, minutes = self.user_totals(rng)
+        # Same order as the SQL path: calories descending, then user id
+        ordered = np.lexsort((ids, -calories))[:limit]
+        return [(int(ids[i]), float(calories[i]), float(minutes[i])) for i in ordered]
+
+    @_locked
+    def percentile(self, user_id, rng, user_count):
+        ids, _, minutes = self.user_totals(rng)
+        pos = np.searchsorted(ids, user_id)
+        if pos >= len(ids) or ids[pos] != user_id or minutes[pos] <= 0:
+            return percentile_from_rank(0, user_count)
+        below = int(np.count_nonzero(minutes < minutes[pos]))
+        return percentile_from_rank(user_count - len(ids) + below, user_count)
+
+    @_locked
+    def global_difficulty(self, rng):
+        """Return {category_id: average difficulty across all users}."""
+        mask = self._mask(rng)
+        return _averages(self.column('category_id')[mask], self.column('difficulty')[mask])
+
+    @_locked
+    def category_difficulty(self, user_id, rng):
+        """Return ({category_id: your average}, {category_id: global average})."""
+        mask = self._mask(rng)
+        categories = self.column('category_id')[mask]
+        difficulty = self.column('difficulty')[mask]
+        mine = self.column('user_id')[mask] == user_id
+        return _averages(categories[mine], difficulty[mine]), _averages(categories, difficulty)
+
+
+def _averages(categories, difficulty):
+    if not len(categories):
+        return {}
+    sums = np.bincount(categories, weights=difficulty)
+    counts = np.bincount(categories)
+    return {int(c): float(sums[c] / counts[c]) for c in np.nonzero(counts)[0]}
+
+
+engine = WorkoutAnalytics()
@@ -7,8 +7,10 @@ from user_profile import profile_bp
 
 # Import blueprints
 from auth import auth_bp
-from record import record_bp, log_cardio, log_strength
+from record import record_bp, log_cardio, log_strength, log_workouts, refresher, start_aggregate_refresher
 from social.social import social_bp
+from importer import import_bp
+from categories import categories
 
 # Initialize Flask app
 app = Flask(__name__, static_folder='.', static_url_path='', template_folder='.')
@@ -35,6 +37,8 @@ app.config['SECRET_KEY'] = secret_key
 basedir = os.path.abspath(os.path.dirname(__file__))
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'app.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Refresh the record dashboard's global aggregates in a background thread of each serving process
+app.config['AGGREGATE_REFRESHER'] = True
 
 # Initialize extensions
 db.init_app(app)
@@ -44,15 +48,24 @@ csrf = CSRFProtect(app)
 app.register_blueprint(auth_bp)
 app.register_blueprint(record_bp)
 app.register_blueprint(social_bp)
+app.register_blueprint(import_bp)
 
 # register the user_profile blueprint
 app.register_blueprint(profile_bp)
 # register the plan blueprint
 # app.register_blueprint(plan_bp)
 
-# Exempt the log_cardio and log_strength routes from CSRF protection
+# Exempt the workout logging routes from CSRF protection
 csrf.exempt(log_cardio)
 csrf.exempt(log_strength)
+csrf.exempt(log_workouts)
+
+@app.before_request
+def ensure_aggregate_refresher():
+    # Started by the first request, so every serving process (python app.py, flask run,
+    # gunicorn workers) gets one, but not the reloader parent, CLI commands or tests
+    if app.config['AGGREGATE_REFRESHER'] and not app.testing and not refresher.running:
+        start_aggregate_refresher(app)
 
 @csrf.exempt  # Allow login page to render without CSRF token
 @app.route('/')
@@ -113,11 +126,20 @@ def my_plan_api():
         print('  SUCCESS: Plan added')
         return jsonify({'success': True})
 
+# Categories change only with a deploy or an admin edit, so browsers may reuse the list for a day
+SPORT_CATEGORIES_MAX_AGE = 24 * 60 * 60
+
 @app.route('/api/sport_categories')
 def get_sport_categories():
-    from models import SportsCategory
-    cats = SportsCategory.query.all()
-    return jsonify([{'id': c.id, 'name': c.name} for c in cats])
+    cats = categories()
+    if request.if_none_match.contains(cats.etag):
+        response = app.make_response(('', 304))
+    else:
+        response = jsonify([{'id': c.id, 'name': c.name} for c in cats.all])
+    response.set_etag(cats.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = SPORT_CATEGORIES_MAX_AGE
+    return response
 
 if __name__ == '__main__':
     with app.app_context():
@@ -0,0 +1,112 @@
+"""Compare the NumPy analytics engine with the original ORM loops.
+
+Usage: python benchmarks/bench_analytics.py [records]
+
+Seeds a temporary SQLite database with 1M workout records (by default) for
+1,000 users, then times:
+
+* the original dashboard pattern of loading every User and summing
+  ``u.records`` in Python for the leaderboard and percentile hours list;
+* a full ``WorkoutAnalytics.refresh()`` and an incremental one;
+* the vectorized leaderboard, trend, percentile and category comparison.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from models import db, User, SportsCategory, WorkoutRecord  # noqa: E402
+from analytics import WorkoutAnalytics  # noqa: E402
+from ranges import named_range  # noqa: E402
+
+USERS = 1_000
+CATEGORIES = [('Running', 9.8), ('Cycling', 7.5), ('Swimming', 8.0), ('Yoga', 3.0), ('Weightlifting', 6.0), ('HIIT', 10.0)]
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<44} {elapsed * 1000:>10.1f} ms')
+    return result, elapsed
+
+
+def seed(records, rng):
+    db.session.execute(SportsCategory.__table__.insert(), [
+        {'id': i + 1, 'name': name, 'met_value': met} for i, (name, met) in enumerate(CATEGORIES)
+    ])
+    db.session.execute(User.__table__.insert(), [
+        {'id': i + 1, 'username': f'user{i}', 'email': f'user{i}@example.com',
+         'password_hash': 'x', 'created_at': date.today()}
+        for i in range(USERS)
+    ])
+    today = date.today()
+    batch = []
+    for _ in range(records):
+        duration = rng.randint(20, 120)
+        batch.append({
+            'user_id': rng.randint(1, USERS),
+            'category_id': rng.randint(1, len(CATEGORIES)),
+            'date': today - timedelta(days=rng.randint(0, 730)),
+            'duration_min': duration,
+            'difficulty': rng.randint(1, 5),
+            'calories_burn': duration * 8.0,
+        })
+        if len(batch) == 100_000:
+            db.session.execute(WorkoutRecord.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(WorkoutRecord.__table__.insert(), batch)
+    db.session.commit()
+
+
+def orm_loops(start):
+    # The original record_leaderboard / record_metrics pattern
+    stats = []
+    for u in User.query.all():
+        total_cal = sum((r.calories_burn or 0) for r in u.records if r.date >= start)
+        total_hr = sum((r.duration_min or 0) for r in u.records if r.date >= start) / 60
+        stats.append((u.username, total_cal, total_hr))
+    stats.sort(key=lambda x: x[1], reverse=True)
+    return stats[:10]
+
+
+def main(records=1_000_000):
+    rng = random.Random(5505)
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        timed(f'seed {records:,} records', lambda: seed(records, rng))
+        year = named_range('year')
+
+        _, orm_time = timed('ORM loops: leaderboard over all users', lambda: orm_loops(year.start))
+        db.session.expunge_all()
+
+        engine = WorkoutAnalytics()
+        timed('NumPy: full load', engine.refresh)
+        _, np_time = timed('NumPy: leaderboard (top 10)', lambda: engine.top(year, 10))
+        timed('NumPy: trend (monthly buckets)', lambda: engine.trend(1, year, USERS))
+        timed('NumPy: percentile', lambda: engine.percentile(1, year, USERS))
+        timed('NumPy: category comparison', lambda: engine.category_difficulty(1, year))
+
+        db.session.execute(WorkoutRecord.__table__.insert(), [
+            {'user_id': 1, 'category_id': 1, 'date': date.today(), 'duration_min': 30,
+             'difficulty': 3, 'calories_burn': 240.0}
+            for _ in range(1_000)
+        ])
+        db.session.commit()
+        engine._new_rows = True
+        loaded, _ = timed('NumPy: incremental refresh (1,000 new rows)', engine.refresh)
+        print(f'leaderboard speedup over ORM loops: {orm_time / np_time:,.0f}x ({loaded} rows appended)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
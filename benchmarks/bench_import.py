@@ -0,0 +1,80 @@
+"""Time the streaming CSV importer on a large generated file.
+
+Usage: python benchmarks/bench_import.py [rows]
+
+Writes a CSV of 1M workout records (by default) for 1,000 users, then
+imports it with ``import_records`` into a temporary SQLite database and
+prints the elapsed time, throughput and how much the peak RSS grew. One row
+in a thousand is invalid so the error path is exercised too.
+"""
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import resource
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from models import db, User, SportsCategory  # noqa: E402
+from importer import import_records, read_rows  # noqa: E402
+
+USERS = 1_000
+CATEGORIES = [('Running', 9.8), ('Cycling', 7.5), ('Swimming', 8.0), ('Yoga', 3.0), ('Weightlifting', 6.0), ('HIIT', 10.0)]
+
+
+def write_csv(path, rows, rng):
+    today = date.today()
+    with open(path, 'w', newline='') as f:
+        out = csv.writer(f)
+        out.writerow(['user_id', 'category', 'date', 'duration_min', 'difficulty', 'calories_burn'])
+        for i in range(rows):
+            duration = rng.randint(20, 120) if i % 1000 else 'n/a'
+            out.writerow([
+                rng.randint(1, USERS),
+                rng.choice(CATEGORIES)[0],
+                (today - timedelta(days=rng.randint(0, 730))).isoformat(),
+                duration,
+                rng.randint(1, 5),
+                rng.randint(100, 1200),
+            ])
+
+
+def main(rows=1_000_000):
+    rng = random.Random(5505)
+    workdir = tempfile.mkdtemp()
+    source = os.path.join(workdir, 'records.csv')
+    write_csv(source, rows, rng)
+    print(f'CSV size: {os.path.getsize(source) / 1e6:.1f} MB')
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(SportsCategory.__table__.insert(), [
+            {'name': name, 'met_value': met} for name, met in CATEGORIES
+        ])
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x'}
+            for i in range(USERS)
+        ])
+        db.session.commit()
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        with open(source, 'rb') as f:
+            result = import_records(read_rows(f, source))
+        elapsed = time.perf_counter() - start
+        rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+
+    print(f'imported {result.imported:,} rows, {result.failed:,} failed in {elapsed:.1f} s '
+          f'({result.imported / elapsed:,.0f} rows/s)')
+    print(f'peak RSS growth during import: {rss_growth / 1024:.1f} MB')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,65 @@
+"""Compare the histogram percentile with the exact computation.
+
+Usage: python benchmarks/bench_percentile.py [users]
+
+Builds per-user weekly minute totals for 100k users (by default), then for a
+sample of users compares the original approach (sort every total, index the
+caller) with ``MinutesHistogram.count_below``. Prints timings and the
+observed percentile error next to the documented bound.
+"""
+import os
+import random
+import sys
+import time
+from bisect import bisect_left
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from percentile import MinutesHistogram, percentile_from_rank  # noqa: E402
+
+
+def main(users=100_000, samples=1_000, seed=5505):
+    rng = random.Random(seed)
+    # A quarter of users idle, the rest roughly log-normal between minutes and days
+    minutes = [0 if rng.random() < 0.25 else int(rng.lognormvariate(5.5, 0.9)) for _ in range(users)]
+    probes = rng.sample(range(users), samples)
+
+    start = time.perf_counter()
+    hist = MinutesHistogram(max_minutes=8 * 24 * 60)
+    active = [m for m in minutes if m > 0]
+    for m in active:
+        hist.add(m)
+    build = time.perf_counter() - start
+    idle = users - hist.total
+
+    start = time.perf_counter()
+    exact = []
+    for i in probes:
+        ordered = sorted(minutes)
+        exact.append(percentile_from_rank(bisect_left(ordered, minutes[i]), users))
+    exact_time = (time.perf_counter() - start) / samples
+
+    start = time.perf_counter()
+    approx = []
+    for i in probes:
+        m = minutes[i]
+        below = idle + hist.count_below(m) if m > 0 else 0
+        approx.append(percentile_from_rank(below, users))
+    approx_time = (time.perf_counter() - start) / samples
+
+    errors = [abs(a - e) for a, e in zip(approx, exact)]
+    bound = max(
+        100 * (hist._counts[hist._bucket(minutes[i])] - 1) / (users - 1)
+        for i in probes if minutes[i] > 0
+    )
+    print(f'users={users} samples={samples} buckets={hist.buckets}')
+    print(f'histogram build: {build * 1000:.1f} ms for {hist.total} active users')
+    print(f'exact (sort + index) per query: {exact_time * 1000:.3f} ms')
+    print(f'histogram per query:            {approx_time * 1000:.4f} ms')
+    print(f'speedup: {exact_time / approx_time:,.0f}x')
+    print(f'max error: {max(errors)} points, mean error: {sum(errors) / len(errors):.3f} points')
+    print(f'documented bound for the sampled buckets: {bound:.3f} points (+1 for integer truncation)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
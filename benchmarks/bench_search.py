@@ -0,0 +1,108 @@
+"""Time FTS5 post search against a LIKE scan on a large generated corpus.
+
+Usage: python benchmarks/bench_search.py [posts]
+
+Seeds a temporary SQLite database with 1M posts (by default) from 1,000
+users plus one comment per ten posts, all indexed by the search triggers as
+they are inserted. Then, for a rare word, a common word, a two-word query and
+a word found through stemming, it times the first page and the next page of ``search_posts``
+against a ``LIKE '%word%'`` scan that finds every post mentioning the
+(first) word, which is what a search without the index has to read.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from models import db, User  # noqa: E402
+from social.search import SEARCH_CANDIDATES, decode_cursor, match_expression, search_posts  # noqa: E402
+
+USERS = 1_000
+BATCH = 50_000
+PAGE = 20
+# Zipf-like vocabulary: a few words are everywhere, most are rare
+COMMON = ['run', 'today', 'great', 'workout', 'morning', 'gym', 'feeling', 'strong', 'legs', 'day']
+RARE = [f'word{i}' for i in range(20_000)]
+QUERIES = [('rare', 'word12345'), ('common', 'workout'), ('two words', 'morning run'), ('stemmed', 'mornings')]
+
+
+def sentence(rng, length):
+    return ' '.join(rng.choice(COMMON) if rng.random() < 0.6 else rng.choice(RARE) for _ in range(length))
+
+
+def seed(posts, rng):
+    start = datetime.utcnow()
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x'}
+        for i in range(USERS)
+    ])
+    connection = db.session.connection()
+    for offset in range(0, posts, BATCH):
+        count = min(BATCH, posts - offset)
+        connection.exec_driver_sql(
+            'INSERT INTO posts (user_id, content, created_at, like_count, comment_count, bookmark_count) '
+            'VALUES (?, ?, ?, 0, 0, 0)',
+            [(rng.randint(1, USERS), sentence(rng, rng.randint(5, 30)),
+              (start - timedelta(minutes=offset + i)).isoformat(' ')) for i in range(count)])
+        connection.exec_driver_sql(
+            'INSERT INTO comments (user_id, post_id, content) VALUES (?, ?, ?)',
+            [(rng.randint(1, USERS), offset + i + 1, sentence(rng, rng.randint(3, 12)))
+             for i in range(0, count, 10)])
+        db.session.commit()
+        connection = db.session.connection()
+
+
+def timed(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def like_scan(word):
+    """Every post mentioning word: what any ranking over a LIKE search has to read first."""
+    pattern = f'%{word}%'
+    return db.session.execute(text(
+        'SELECT id FROM posts WHERE content LIKE :p '
+        'UNION SELECT post_id FROM comments WHERE content LIKE :p'
+    ), {'p': pattern}).all()
+
+
+def main(posts=1_000_000):
+    rng = random.Random(5505)
+    workdir = tempfile.mkdtemp()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        seed(posts, rng)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(os.path.join(workdir, 'bench.db')) / 1e6
+        print(f'seeded and indexed {posts:,} posts + {posts // 10:,} comments in {elapsed:.1f} s '
+              f'(database {size:.0f} MB)')
+
+        print(f'BM25 ranks at most the {SEARCH_CANDIDATES:,} newest matching rows per search')
+        print(f"{'query':<10} {'matches':>9} {'page 1 ms':>10} {'page 2 ms':>10} {'LIKE ms':>9}")
+        for label, query in QUERIES:
+            first_ms, (hits, cursor) = timed(lambda: search_posts(query, PAGE))
+            second_ms = timed(lambda: search_posts(query, PAGE, decode_cursor(cursor)))[0] if cursor else 0
+            like_ms, _ = timed(lambda: like_scan(query.split()[0]), repeat=1)
+            matches = db.session.execute(
+                text('SELECT count(*) FROM search_index WHERE search_index MATCH :q'),
+                {'q': match_expression(query)},
+            ).scalar()
+            print(f'{label:<10} {matches:>9,} {first_ms:>10.1f} {second_ms:>10.1f} {like_ms:>9.1f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,122 @@
+"""Weigh fan-out-on-write cost against home timeline read latency.
+
+Usage: python benchmarks/bench_timeline.py [users]
+
+Seeds a temporary SQLite database with 5,000 users (by default) who follow
+40 accounts each on average, picked with Zipf-like popularity so that a few
+authors gather thousands of followers, and ten posts per user. For pure
+fan-out on read, the hybrid default and pure fan-out on write it refills the
+timelines with ``rebuild_timelines``, then times creating posts (the rows
+each one writes, on average and for the most followed author) and reading
+the first two pages of random users' home timelines.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from models import db, Post, TimelineEntry, User  # noqa: E402
+from social import timeline  # noqa: E402
+
+FOLLOWS_PER_USER = 40
+POSTS_PER_USER = 10
+WRITES = 500
+READS = 300
+PAGE = 20
+
+
+def seed(users, rng):
+    start = datetime.utcnow()
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x'}
+        for i in range(users)
+    ])
+    connection = db.session.connection()
+    ids = list(range(1, users + 1))
+    popularity = [1 / rank ** 1.1 for rank in ids]
+    follows = set()
+    for follower in ids:
+        for followee in rng.choices(ids, popularity, k=rng.randint(1, 2 * FOLLOWS_PER_USER)):
+            if followee != follower:
+                follows.add((follower, followee))
+    connection.exec_driver_sql('INSERT INTO follows (follower_id, followee_id) VALUES (?, ?)', list(follows))
+    connection.exec_driver_sql(
+        'INSERT INTO posts (user_id, content, created_at, like_count, comment_count, bookmark_count) '
+        'VALUES (?, ?, ?, 0, 0, 0)',
+        [(rng.choice(ids), f'post {i}', (start - timedelta(minutes=i)).isoformat(' '))
+         for i in range(users * POSTS_PER_USER)])
+    db.session.commit()
+    return len(follows)
+
+
+def percentile(samples, fraction):
+    return sorted(samples)[int(fraction * (len(samples) - 1))]
+
+
+def time_writes(authors):
+    elapsed, rows = [], []
+    for author_id in authors:
+        start = time.perf_counter()
+        post = Post(user_id=author_id, content='benchmark post')
+        db.session.add(post)
+        db.session.flush()
+        rows.append(timeline.fan_out(post))
+        db.session.commit()
+        elapsed.append((time.perf_counter() - start) * 1000)
+    return elapsed, rows
+
+
+def time_reads(readers):
+    first, second = [], []
+    for reader in readers:
+        start = time.perf_counter()
+        rows = timeline.home_timeline(reader, PAGE + 1)
+        first.append((time.perf_counter() - start) * 1000)
+        cursor = (rows[PAGE - 1].created_at, rows[PAGE - 1].id) if len(rows) > PAGE else None
+        start = time.perf_counter()
+        timeline.home_timeline(reader, PAGE + 1, cursor)
+        second.append((time.perf_counter() - start) * 1000)
+    return first, second
+
+
+def main(users=5_000):
+    rng = random.Random(5505)
+    workdir = tempfile.mkdtemp()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        follows = seed(users, rng)
+        ids = list(range(1, users + 1))
+        print(f'{users:,} users, {follows:,} follows, {users * POSTS_PER_USER:,} posts')
+
+        scenarios = [('on read', -1), ('hybrid', timeline.FANOUT_FOLLOWER_LIMIT), ('on write', users)]
+        print(f"{'fan-out':<9} {'limit':>6} {'backfill s':>10} {'entries':>10} "
+              f"{'rows/post':>9} {'top rows':>8} {'write ms':>8} {'top ms':>7} "
+              f"{'read p50':>8} {'read p95':>8} {'page 2 p95':>10}")
+        for label, limit in scenarios:
+            timeline.FANOUT_FOLLOWER_LIMIT = limit
+            start = time.perf_counter()
+            timeline.rebuild_timelines()
+            db.session.commit()
+            backfill = time.perf_counter() - start
+            entries = TimelineEntry.query.count()
+
+            elapsed, rows = time_writes([rng.choice(ids) for _ in range(WRITES)])
+            top_ms, top_rows = time_writes([1] * 5)
+            first, second = time_reads([rng.choice(ids) for _ in range(READS)])
+            print(f'{label:<9} {limit:>6} {backfill:>10.1f} {entries:>10,} '
+                  f'{statistics.mean(rows):>9.1f} {top_rows[-1]:>8,} {statistics.mean(elapsed):>8.2f} '
+                  f'{statistics.median(top_ms):>7.2f} {percentile(first, 0.5):>8.2f} '
+                  f'{percentile(first, 0.95):>8.2f} {percentile(second, 0.95):>10.2f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5_000)
@@ -0,0 +1,99 @@
+"""In-memory registry of sports categories.
+
+Categories are reference data that almost never change, yet every workout
+log, import and dashboard request used to query ``sports_categories``.
+``categories()`` returns an immutable ``CategorySnapshot`` loaded with one
+query on first use; the registry is invalidated when a session commits an
+ORM insert, update or delete of a ``SportsCategory`` (and when the tables are
+recreated), and the next call reloads it.
+
+Like the other in-memory aggregates, the registry is per process. Category
+rows written with Core statements or by another process are only picked up
+after ``invalidate()`` or a restart.
+"""
+import threading
+import zlib
+from collections import namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from models import db, SportsCategory
+from versions import bump
+
+# Categories with a MET value at or above this count as aerobic on the dashboard
+AEROBIC_MET = 6.0
+
+Category = namedtuple('Category', 'id name met_value aerobic')
+
+
+class CategorySnapshot:
+    def __init__(self, rows):
+        self.all = tuple(
+            Category(cid, name, met, met is not None and met >= AEROBIC_MET)
+            for cid, name, met in sorted(rows)
+        )
+        self.by_id = {c.id: c for c in self.all}
+        self.by_name = {c.name: c for c in self.all}
+        self._by_lower_name = {c.name.lower(): c for c in self.all}
+        # Content hash, so every process derives the same ETag for the same categories
+        self.etag = format(zlib.crc32(repr(self.all).encode()), 'x')
+
+    def find(self, name):
+        """Look a category up by name, ignoring case and surrounding spaces."""
+        return self._by_lower_name.get(str(name).strip().lower())
+
+    def met_by_id(self):
+        return {c.id: c.met_value for c in self.all}
+
+
+class CategoryRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    rows = db.session.query(SportsCategory.id, SportsCategory.name, SportsCategory.met_value).all()
+                    self._snapshot = CategorySnapshot(rows)
+                snapshot = self._snapshot
+        return snapshot
+
+    def invalidate(self, *args, **kwargs):
+        self._snapshot = None
+
+
+registry = CategoryRegistry()
+
+
+def categories():
+    """The current CategorySnapshot, loading it if needed."""
+    return registry.get()
+
+
+@event.listens_for(SportsCategory, 'after_insert')
+@event.listens_for(SportsCategory, 'after_update')
+@event.listens_for(SportsCategory, 'after_delete')
+def _category_written(mapper, connection, target):
+    object_session(target).info['categories_changed'] = True
+    # Dashboard responses embed category names and MET classes
+    bump('record', connection=connection)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _reload_after_commit(session):
+    if session.info.pop('categories_changed', False):
+        registry.invalidate()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_category_changes(session):
+    session.info.pop('categories_changed', None)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _tables_created(target, connection, **kw):
+    registry.invalidate()
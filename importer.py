@@ -0,0 +1,351 @@
+"""Bulk import of workout records and plans from CSV or XLSX files.
+
+Files are read one row at a time (``csv`` over the byte stream, ``openpyxl``
+in read-only mode), so memory stays flat however long the file is. Category
+names and known user ids are loaded once, every row is validated on its own,
+and valid rows are written with Core ``executemany`` inserts in transactions
+of ``BATCH_ROWS`` rows. Invalid rows are counted and reported (the first
+``MAX_REPORTED_ERRORS`` of them) without stopping the import.
+
+Record columns: ``date``, ``duration_min``, ``category`` (or ``activity``,
+a category name) or ``category_id``, and optionally ``difficulty`` (1-5,
+default 1), ``calories_burn`` and ``user_id``. Plan columns: ``activity``
+(free text, as accepted by ``/api/my_plan``), ``start_time``, ``end_time``
+and optionally ``user_id``; times with an offset are stored as naive UTC,
+like every other datetime in the database. An ``id`` column, as in the
+shipped migration spreadsheets, is ignored.
+
+Records update ``workout_daily_rollups`` batch by batch through
+``stage_bulk_deltas``; streaks of the touched users are repaired at the end.
+
+Uploads through ``POST /api/import/<kind>`` always import for the logged-in
+user. The CLI (``flask import records FILE``) uses the ``user_id`` column
+unless ``--user-id`` is given.
+"""
+import csv
+import io
+import math
+import os
+from datetime import date, datetime, timezone
+
+import click
+from flask import Blueprint, jsonify, request, session
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, User, WorkoutPlan, WorkoutRecord
+from categories import categories
+from rollup import stage_bulk_deltas
+from streaks import repair_user_streaks
+
+import_bp = Blueprint('data_import', __name__, cli_group='import')
+
+BATCH_ROWS = 20_000
+MAX_REPORTED_ERRORS = 100
+
+RECORD_COLUMNS = ('user_id', 'category_id', 'date', 'duration_min', 'difficulty', 'calories_burn')
+PLAN_COLUMNS = ('user_id', 'activity', 'start_time', 'end_time')
+# How SQLAlchemy's DateTime stores values in SQLite, so imported rows sort with ORM-written ones
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+class ImportFormatError(ValueError):
+    """The file as a whole cannot be imported (unknown type or missing columns)."""
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def fail(self, line, message, rows=1):
+        self.failed += rows
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line, 'error': message})
+
+    def to_dict(self):
+        return {'imported': self.imported, 'failed': self.failed, 'errors': self.errors}
+
+
+def read_rows(stream, filename, required=()):
+    """Yield (line number, {column: value}) from a binary CSV or XLSX stream.
+
+    Raises ImportFormatError for an unsupported file, or once the header is
+    read if any ``required`` column is missing.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.csv':
+        rows = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    elif ext == '.xlsx':
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ImportFormatError('XLSX import requires openpyxl')
+        rows = _xlsx_rows(load_workbook(stream, read_only=True, data_only=True))
+    else:
+        raise ImportFormatError('Only .csv and .xlsx files can be imported')
+    return _rows_with_header(rows, required)
+
+
+def _xlsx_rows(workbook):
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        # Read-only workbooks keep the archive open until closed
+        workbook.close()
+
+
+def _rows_with_header(rows, required):
+    header = None
+    for line, values in enumerate(rows, start=1):
+        if header is None:
+            header = [str(v or '').strip().lower() for v in values]
+            missing = [c for c in required if c not in header]
+            if missing:
+                raise ImportFormatError(f"Missing columns: {', '.join(missing)}")
+            continue
+        # any() settles almost every row in C; the generator only runs for rows of falsy cells
+        if not any(values) and all(v is None or v == '' for v in values):
+            continue
+        yield line, dict(zip(header, values))
+
+
+# The parsers below run once per field of every row, so they try the common
+# case (a clean CSV string or a typed XLSX cell) before anything slower.
+
+def _text(row, field):
+    value = row.get(field)
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _number(row, field, kind, default=None, minimum=None, maximum=None):
+    raw = row.get(field)
+    if raw is None or raw == '':
+        if default is None and kind is int:
+            raise ValueError(f'{field} is required')
+        return default
+    try:
+        value = kind(raw)
+    except (TypeError, ValueError, OverflowError):
+        try:
+            # Spreadsheets often write whole numbers as "25.0"
+            value = kind(float(raw))
+        except (TypeError, ValueError, OverflowError):
+            # int() of inf or of a float literal past 1e308
+            raise ValueError(f'{field} must be a finite number')
+    # NaN passes every comparison, and SQLite would store it as NULL
+    if kind is float and not math.isfinite(value):
+        raise ValueError(f'{field} must be a finite number')
+    if kind is int and not -2 ** 63 <= value < 2 ** 63:
+        raise ValueError(f'{field} is out of range')
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        raise ValueError(f'{field} is out of range')
+    return value
+
+
+def _date(row, field):
+    value = row.get(field)
+    if type(value) is str:
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            pass
+    elif isinstance(value, datetime):
+        return value.date()
+    elif isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(_text(row, field)[:10])
+    except ValueError:
+        raise ValueError(f'{field} must be a date (YYYY-MM-DD)')
+
+
+def _datetime(row, field):
+    """A naive datetime; values with an offset are converted to UTC."""
+    value = row.get(field)
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(_text(row, field))
+        except ValueError:
+            raise ValueError(f'{field} must be a date and time (YYYY-MM-DD HH:MM)')
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _insert_many(table, columns, rows):
+    """executemany straight on the driver: skips per-row bind processing for large batches."""
+    sql = f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    db.session.connection().exec_driver_sql(sql, rows)
+
+
+class _Lookups:
+    """Category registry snapshot and user ids, taken once per import."""
+
+    def __init__(self, user_id):
+        self.categories = categories()
+        self.user_id = user_id
+        self.user_ids = None if user_id else set(db.session.scalars(db.select(User.id)))
+
+    def user(self, row):
+        if self.user_id:
+            return self.user_id
+        user_id = _number(row, 'user_id', int)
+        if user_id not in self.user_ids:
+            raise ValueError(f'Unknown user_id {user_id}')
+        return user_id
+
+    def category(self, row, *fields):
+        for field in fields:
+            name = row.get(field)
+            if name:
+                match = self.categories.find(name)
+                if match is None:
+                    raise ValueError(f'Unknown category {name!r}')
+                return match.id, match.name
+        category_id = _number(row, 'category_id', int)
+        if category_id not in self.categories.by_id:
+            raise ValueError(f'Unknown category_id {category_id}')
+        return category_id, None
+
+
+def _run_import(rows, parse, write):
+    result = ImportResult()
+    batch, first_line = [], None
+
+    def flush():
+        try:
+            write(batch)
+            result.imported += len(batch)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            result.fail(first_line, f'Batch of {len(batch)} rows failed: {e.__class__.__name__}', len(batch))
+
+    for line, row in rows:
+        try:
+            values = parse(row)
+        except ValueError as e:
+            result.fail(line, str(e))
+            continue
+        if not batch:
+            first_line = line
+        batch.append(values)
+        if len(batch) >= BATCH_ROWS:
+            flush()
+            batch = []
+    if batch:
+        flush()
+    return result
+
+
+def import_records(rows, user_id=None):
+    """Import workout records from (line, row) pairs; returns an ImportResult."""
+    lookups = _Lookups(user_id)
+    touched = set()
+
+    def parse(row):
+        return (
+            lookups.user(row),
+            lookups.category(row, 'category', 'activity')[0],
+            _date(row, 'date'),
+            _number(row, 'duration_min', int, minimum=1),
+            _number(row, 'difficulty', int, default=1, minimum=1, maximum=5),
+            _number(row, 'calories_burn', float, minimum=0),
+        )
+
+    def write(batch):
+        deltas = {}
+        for user_id, category_id, day, minutes, difficulty, calories in batch:
+            delta = deltas.setdefault((user_id, day, category_id), [0, 0.0, 0, 0])
+            delta[0] += minutes
+            delta[1] += calories or 0
+            delta[2] += difficulty
+            delta[3] += 1
+        _insert_many(WorkoutRecord.__table__, RECORD_COLUMNS, [
+            (user_id, category_id, day.isoformat(), minutes, difficulty, calories)
+            for user_id, category_id, day, minutes, difficulty, calories in batch
+        ])
+        stage_bulk_deltas(db.session, deltas)
+        db.session.commit()
+        touched.update(key[0] for key in deltas)
+
+    result = _run_import(rows, parse, write)
+    if touched:
+        repair_user_streaks(db.session.connection(), touched)
+        db.session.commit()
+    return result
+
+
+def import_plans(rows, user_id=None):
+    """Import workout plans from (line, row) pairs; returns an ImportResult."""
+    lookups = _Lookups(user_id)
+
+    def parse(row):
+        start, end = _datetime(row, 'start_time'), _datetime(row, 'end_time')
+        if end <= start:
+            raise ValueError('end_time must be after start_time')
+        # Plans take any activity, like /api/my_plan
+        activity = _text(row, 'activity')
+        if not activity:
+            raise ValueError('activity is required')
+        return lookups.user(row), activity, start.strftime(DATETIME_FORMAT), end.strftime(DATETIME_FORMAT)
+
+    def write(batch):
+        _insert_many(WorkoutPlan.__table__, PLAN_COLUMNS, batch)
+        db.session.commit()
+
+    return _run_import(rows, parse, write)
+
+
+IMPORTERS = {'records': import_records, 'plans': import_plans}
+REQUIRED_COLUMNS = {'records': ('date', 'duration_min'), 'plans': ('activity', 'start_time', 'end_time')}
+
+
+@import_bp.route('/api/import/<kind>', methods=['POST'])
+def import_upload(kind):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if kind not in IMPORTERS:
+        return jsonify({'error': 'Unknown import type'}), 404
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    try:
+        rows = read_rows(upload.stream, upload.filename, REQUIRED_COLUMNS[kind])
+        result = IMPORTERS[kind](rows, user_id=user_id)
+    except ImportFormatError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result.to_dict())
+
+
+def _import_command(kind, path, user_id):
+    if user_id and db.session.get(User, user_id) is None:
+        raise click.BadParameter(f'no user with id {user_id}', param_hint='--user-id')
+    try:
+        with open(path, 'rb') as f:
+            result = IMPORTERS[kind](read_rows(f, path, REQUIRED_COLUMNS[kind]), user_id=user_id)
+    except ImportFormatError as e:
+        raise click.ClickException(str(e))
+    print(f'Imported {result.imported} {kind}, {result.failed} rows failed.')
+    for error in result.errors:
+        print(f"  row {error['row']}: {error['error']}")
+
+
+@import_bp.cli.command('records')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', type=int, help='Import every row for this user instead of the user_id column.')
+def import_records_command(path, user_id):
+    """Import workout records from a CSV or XLSX file."""
+    _import_command('records', path, user_id)
+
+
+@import_bp.cli.command('plans')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', type=int, help='Import every row for this user instead of the user_id column.')
+def import_plans_command(path, user_id):
+    """Import workout plans from a CSV or XLSX file."""
+    _import_command('plans', path, user_id)
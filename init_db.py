@@ -13,8 +13,13 @@ from models import (
     Comment,
     Like,
     Bookmark,
-    Post
+    Post,
+    Follow
 )
+from rollup import rebuild_rollups
+from streaks import repair_streaks
+from social.social import reconcile_post_counts
+from social.timeline import rebuild_timelines
 from werkzeug.security import generate_password_hash
 from datetime import datetime, date, timedelta
 import os
@@ -170,6 +175,19 @@ def init_db():
             db.session.add(Comment(user_id=commenter.id, post_id=post.id, content=text, created_at=datetime.utcnow() - timedelta(hours=random.randint(0, 48))))
     db.session.commit()
 
+    # Each user follows a few others
+    for u in users:
+        for followee in random.sample([other for other in users if other is not u], 3):
+            db.session.add(Follow(follower_id=u.id, followee_id=followee.id))
+    db.session.commit()
+
+    # Backfill the dashboard rollup and streaks from the seeded records
+    rebuild_rollups()
+    repair_streaks()
+    # The seeded likes, bookmarks and comments bypass the endpoints that maintain post counters
+    reconcile_post_counts()
+    # Follower counts and home timelines for the seeded follows and posts
+    rebuild_timelines()
     db.session.commit()
     print("Database initialized with mock data.")
 
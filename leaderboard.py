@@ -0,0 +1,204 @@
+"""In-memory leaderboards for the record dashboard.
+
+A ``RangeBoard`` keeps per-user calorie and minute totals over a sliding
+window of days (the last week or month) together with a sorted index of
+``(-calories, user_id)`` keys. The top N is a slice of that index and a
+user's rank is a bisect, so neither read touches other users' rows. Each
+board also keeps a ``MinutesHistogram`` of the same totals so the dashboard
+percentile is a Fenwick-tree lookup (see ``percentile.py`` for the error bound).
+
+Boards are loaded from ``workout_daily_rollups`` on first use, updated from
+the ``rollup_changed`` signal after every commit, and drop whole days as the
+window slides past them. Like the SQL ranges the window ends today: rows
+dated later are held aside and join the totals once their day arrives. They are reset whenever the rollup is rebuilt and
+reloaded by the background aggregate refresher (see ``refresher.py``).
+
+A load reads the ``record`` data version (see ``versions.py``) in the same
+statement as the rollup rows, and deltas carry the version their commit
+wrote, so a delta whose signal arrives after a load that already saw its
+commit is skipped instead of being counted twice.
+
+The state is per process: with several worker processes each board only
+sees the writes made by its own process until it is reloaded.
+"""
+import threading
+from bisect import bisect_left, insort
+from datetime import date, timedelta
+
+from sqlalchemy import func, literal, select, true
+
+from models import db, WorkoutDailyRollup
+from percentile import MinutesHistogram, percentile_from_rank
+from rollup import rollup_changed, rollup_rebuilt
+from versions import committed_version
+
+
+class RangeBoard:
+    """Calorie leaderboard over the records dated on or after ``today - days``."""
+
+    def __init__(self, days):
+        self.days = days
+        self._lock = threading.RLock()
+        self._minutes = MinutesHistogram(max_minutes=(days + 1) * 24 * 60)
+        self._reset()
+
+    def _reset(self):
+        self._start = None
+        self._end = None
+        self._version = None  # record version the loaded rows include
+        self._by_day = {}    # date -> {user_id: [calories, minutes, count]}
+        self._ahead = {}     # the same, for days after the window's end
+        self._totals = {}    # user_id -> [calories, minutes, count]
+        self._order = []     # sorted (-calories, user_id)
+        self._minutes.clear()
+
+    def reset(self):
+        with self._lock:
+            self._reset()
+
+    def reload(self, today=None):
+        """Reload the window from the rollup, dropping any drift from missed deltas."""
+        with self._lock:
+            today = today or date.today()
+            self._load(today - timedelta(days=self.days), today)
+
+    def _shift(self, user_id, calories, minutes, count):
+        old = self._totals.get(user_id)
+        if old is not None:
+            del self._order[bisect_left(self._order, (-old[0], user_id))]
+            new = [old[0] + calories, old[1] + minutes, old[2] + count]
+        else:
+            new = [calories, minutes, count]
+        if new[2] <= 0:
+            if self._totals.pop(user_id, None) is not None:
+                self._minutes.remove(old[1])
+            return
+        if old is None:
+            self._minutes.add(new[1])
+        else:
+            self._minutes.move(old[1], new[1])
+        self._totals[user_id] = new
+        insort(self._order, (-new[0], user_id))
+
+    def _add(self, user_id, day, calories, minutes, count):
+        days = self._ahead if day > self._end else self._by_day
+        bucket = days.setdefault(day, {})
+        cell = bucket.setdefault(user_id, [0.0, 0, 0])
+        cell[0] += calories
+        cell[1] += minutes
+        cell[2] += count
+        if cell[2] <= 0:
+            del bucket[user_id]
+            if not bucket:
+                del days[day]
+        if days is self._by_day:
+            self._shift(user_id, calories, minutes, count)
+
+    def _load(self, start, end):
+        self._reset()
+        self._start = start
+        self._end = end
+        totals = (
+            select(
+                WorkoutDailyRollup.user_id,
+                WorkoutDailyRollup.date,
+                func.sum(WorkoutDailyRollup.total_calories).label('calories'),
+                func.sum(WorkoutDailyRollup.total_min).label('minutes'),
+                func.sum(WorkoutDailyRollup.record_count).label('count')
+            )
+            .where(WorkoutDailyRollup.date >= start)
+            .group_by(WorkoutDailyRollup.user_id, WorkoutDailyRollup.date)
+            .subquery()
+        )
+        # Rows after ``end`` are read too, and held aside by _add until their day arrives.
+        # One statement, so the version and the rows come from the same snapshot;
+        # the outer join still returns the version when the window is empty
+        version = select(func.coalesce(committed_version('record'), literal(0)).label('version')).subquery()
+        rows = db.session.execute(
+            select(version.c.version, totals).select_from(version.outerjoin(totals, true()))
+        ).all()
+        self._version = rows[0].version
+        for _, user_id, day, calories, minutes, count in rows:
+            if user_id is not None:
+                self._add(user_id, day, calories or 0, minutes or 0, count or 0)
+
+    def _ensure_window(self, today):
+        start = today - timedelta(days=self.days)
+        if self._start is None or start < self._start:
+            self._load(start, today)
+        elif start > self._start:
+            # Day rollover: subtract every day that fell out of the window
+            for day in [d for d in self._by_day if d < start]:
+                for user_id, (calories, minutes, count) in self._by_day.pop(day).items():
+                    self._shift(user_id, -calories, -minutes, -count)
+            self._start = start
+            # and add the days that entered it
+            self._end = today
+            for day in sorted(d for d in self._ahead if d <= today):
+                for user_id, (calories, minutes, count) in self._ahead.pop(day).items():
+                    if day >= start:
+                        self._add(user_id, day, calories, minutes, count)
+
+    def apply(self, deltas, version=None):
+        """Fold committed rollup deltas into a loaded board, unless the load already included them."""
+        with self._lock:
+            if self._start is None:
+                return
+            if version is not None and self._version is not None and version <= self._version:
+                return
+            for (user_id, day, _category_id), (minutes, calories, _difficulty, count) in deltas.items():
+                if day >= self._start:
+                    self._add(user_id, day, calories, minutes, count)
+
+    def top(self, n, today=None):
+        """Return [(user_id, calories, minutes)] for the n highest calorie totals."""
+        with self._lock:
+            self._ensure_window(today or date.today())
+            return [
+                (user_id, self._totals[user_id][0], self._totals[user_id][1])
+                for _, user_id in self._order[:n]
+            ]
+
+    def rank(self, user_id, today=None):
+        """Return (rank, calories, minutes); users without records share the last rank."""
+        with self._lock:
+            self._ensure_window(today or date.today())
+            totals = self._totals.get(user_id)
+            if totals is None:
+                return len(self._order) + 1, 0, 0
+            return bisect_left(self._order, (-totals[0], user_id)) + 1, totals[0], totals[1]
+
+    def percentile(self, user_id, user_count, today=None):
+        """Approximate share of the ``user_count`` users with fewer minutes than this one."""
+        with self._lock:
+            self._ensure_window(today or date.today())
+            totals = self._totals.get(user_id)
+            if totals is None or totals[1] <= 0:
+                return percentile_from_rank(0, user_count)
+            idle = max(user_count - self._minutes.total, 0)
+            return percentile_from_rank(idle + self._minutes.count_below(totals[1]), user_count)
+
+    def active_users(self, today=None):
+        with self._lock:
+            self._ensure_window(today or date.today())
+            return len(self._order)
+
+
+class Leaderboards:
+    """One RangeBoard per named range, kept in step with the rollup signals."""
+
+    def __init__(self, range_days):
+        self.boards = {name: RangeBoard(days) for name, days in range_days.items()}
+        rollup_changed.connect(self._on_change, weak=False)
+        rollup_rebuilt.connect(self._on_rebuild, weak=False)
+
+    def __getitem__(self, name):
+        return self.boards[name]
+
+    def _on_change(self, sender, deltas, version=None):
+        for board in self.boards.values():
+            board.apply(deltas, version)
+
+    def _on_rebuild(self, sender):
+        for board in self.boards.values():
+            board.reset()
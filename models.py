@@ -26,6 +26,10 @@ class User(db.Model):
     avatar = db.Column(db.LargeBinary)
     avatar_mimetype  = db.Column(db.String(50))
     coins = db.Column(db.Integer, default=0)
+    # Maintained by the follow endpoints; `flask social backfill-timelines` recomputes it
+    follower_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Set once the user has too many followers to copy each post into every home timeline
+    fanout_on_read = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
 
     records = db.relationship('WorkoutRecord', back_populates='user', cascade='all, delete-orphan')
     comments = db.relationship('Comment', back_populates='user', cascade='all, delete-orphan')
@@ -48,10 +52,45 @@ class WorkoutRecord(db.Model):
     duration_min = db.Column(db.Integer, nullable=False)
     difficulty = db.Column(db.Integer, nullable=False)
     calories_burn = db.Column(db.Float)
+    # Idempotency key sent by clients that sync queued workouts (see /api/log_workouts)
+    client_key = db.Column(db.String(64))
 
     user = db.relationship('User', back_populates='records')
     category = db.relationship('SportsCategory', back_populates='records')
 
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'client_key', name='uq_workout_records_client_key'),
+    )
+
+class WorkoutDailyRollup(db.Model):
+    # One row per (user, day, category), kept in sync with workout_records by rollup.py
+    __tablename__ = 'workout_daily_rollups'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('sports_categories.id', ondelete='CASCADE'), primary_key=True)
+    total_min = db.Column(db.Integer, nullable=False, default=0)
+    total_calories = db.Column(db.Float, nullable=False, default=0)
+    difficulty_sum = db.Column(db.Integer, nullable=False, default=0)
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_workout_daily_rollups_date', 'date'),
+    )
+
+class DataVersion(db.Model):
+    # Version counters behind the ETags of the read endpoints, bumped by versions.py with each write
+    __tablename__ = 'data_versions'
+    key = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class UserStreak(db.Model):
+    # Maintained by streaks.py whenever a user's workout days change
+    __tablename__ = 'user_streaks'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)
+    longest_streak = db.Column(db.Integer, nullable=False, default=0)
+    last_active_date = db.Column(db.Date)
+
 class FavoriteCollection(db.Model):
     __tablename__ = 'favorite_collections'
     id = db.Column(db.Integer, primary_key=True)
@@ -73,6 +112,10 @@ class BrowsingHistory(db.Model):
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        # Comment previews and the comments endpoint read a post's comments newest first
+        db.Index('ix_comments_post_id_created_at', 'post_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), nullable=False)
@@ -83,6 +126,10 @@ class Comment(db.Model):
 
 class Like(db.Model):
     __tablename__ = 'likes'
+    __table_args__ = (
+        # Counter reconciliation looks rows up by post
+        db.Index('ix_likes_post_id', 'post_id'),
+    )
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -91,6 +138,12 @@ class Like(db.Model):
 
 class Bookmark(db.Model):
     __tablename__ = 'bookmarks'
+    __table_args__ = (
+        # Counter reconciliation looks rows up by post
+        db.Index('ix_bookmarks_post_id', 'post_id'),
+        # A user's bookmarks, newest first, for the paginated bookmarks page
+        db.Index('ix_bookmarks_user_id_created_at', 'user_id', 'created_at', 'post_id'),
+    )
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -99,13 +152,48 @@ class Bookmark(db.Model):
 
 class Post(db.Model):
     __tablename__ = 'posts'
+    __table_args__ = (
+        # Serves the feed's keyset pagination on (created_at, id)
+        db.Index('ix_posts_created_at_id', 'created_at', 'id'),
+        # An author's posts newest first, for timeline backfills and fan-out on read
+        db.Index('ix_posts_user_id_created_at', 'user_id', 'created_at', 'id'),
+        # The trending endpoint reads the top of this index
+        db.Index('ix_posts_hot_score', 'hot_score', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Maintained by the social endpoints; `flask social reconcile-counts` recomputes them
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    bookmark_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Time-decayed engagement for trending, kept by social/trending.py; reconcile-counts recomputes it too
+    hot_score = db.Column(db.Float, nullable=False, default=0, server_default='0')
 
     user = db.relationship('User', backref='posts')
     comments = db.relationship('Comment', backref='post', cascade='all, delete-orphan', foreign_keys='Comment.post_id')
     likes = db.relationship('Like', backref='post', cascade='all, delete-orphan', foreign_keys='Like.post_id')
     bookmarks = db.relationship('Bookmark', backref='post', cascade='all, delete-orphan', foreign_keys='Bookmark.post_id')
 
+class Follow(db.Model):
+    __tablename__ = 'follows'
+    __table_args__ = (
+        # Fan-out on write reads an author's followers
+        db.Index('ix_follows_followee_id', 'followee_id', 'follower_id'),
+    )
+    follower_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    followee_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class TimelineEntry(db.Model):
+    # A post in a user's home timeline, written when the post is fanned out (social/timeline.py)
+    __tablename__ = 'timeline_entries'
+    __table_args__ = (
+        # A user's timeline newest first, for keyset pagination on (created_at, post_id)
+        db.Index('ix_timeline_entries_user_id_created_at', 'user_id', 'created_at', 'post_id'),
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+    # The post's created_at, copied so pages never join posts
+    created_at = db.Column(db.DateTime, nullable=False)
@@ -1,29 +1,49 @@
 // my_bookmarks.js
 // 只显示当前用户的bookmarks
 
-document.addEventListener('DOMContentLoaded', function() {
-    loadBookmarkedPosts();
-});
+// Cursor for the next page of bookmarks, or null once all are shown
+let nextBookmarkCursor = null;
 
-function loadBookmarkedPosts() {
-    fetch('/api/posts/bookmarked')
+function loadBookmarkedPosts(more = false) {
+    const url = more
+        ? `/api/posts/bookmarked?cursor=${encodeURIComponent(nextBookmarkCursor)}`
+        : '/api/posts/bookmarked';
+    fetch(url)
         .then(res => res.json())
-        .then(posts => {
-            if (posts.error) {
+        .then(page => {
+            if (page.error) {
                 document.getElementById('post-list').innerHTML = '<p>请先登录。</p>';
                 return;
             }
-            renderPosts(posts);
+            renderPosts(page.posts, more);
+            nextBookmarkCursor = page.next_cursor;
+            renderLoadMore();
         });
 }
 
+// "Load more" button below the list while there are more bookmarks
+function renderLoadMore() {
+    let button = document.getElementById('load-more-bookmarks');
+    if (!button) {
+        button = document.createElement('button');
+        button.id = 'load-more-bookmarks';
+        button.className = 'post-button';
+        button.textContent = 'Load more';
+        button.onclick = () => loadBookmarkedPosts(true);
+        document.getElementById('post-list').after(button);
+    }
+    button.style.display = nextBookmarkCursor ? '' : 'none';
+}
+
 // 复用social.js的renderPosts函数，如果未引入可复制一份
-function renderPosts(posts) {
+function renderPosts(posts, append = false) {
     const postList = document.getElementById('post-list');
-    postList.innerHTML = '';
-    if (!posts.length) {
-        postList.innerHTML = '<p>暂无收藏。</p>';
-        return;
+    if (!append) {
+        postList.innerHTML = '';
+        if (!posts.length) {
+            postList.innerHTML = '<p>暂无收藏。</p>';
+            return;
+        }
     }
     posts.forEach(post => {
         const postCard = document.createElement('div');
@@ -37,7 +57,7 @@ function renderPosts(posts) {
             <div class="post-content">${post.content}</div>
             <div class="post-actions" style="display: flex; gap: 20px; font-size: 18px;">
                 <span>❤️ ${post.likes}</span>
-                <span>💬 ${post.comments.length}</span>
+                <span>💬 ${post.comment_count}</span>
                 <span>🔖 ${post.bookmarks}</span>
             </div>
             <div class="post-comments" style="border-top: 1px solid #eee; padding-top: 10px;">
@@ -0,0 +1,79 @@
+"""Bucketed histogram of per-user workout minutes for percentile queries.
+
+``MinutesHistogram`` counts users per fixed-width bucket of minutes and keeps
+the counts in a Fenwick tree, so adding, moving or ranking a user costs
+O(log B) for B buckets, however many users there are.
+
+Error bound: ranks inside the caller's own bucket are interpolated linearly.
+The estimated number of users below the caller therefore differs from the
+exact count by at most ``c - 1``, where ``c`` is the number of users in the
+caller's bucket. The reported percentile is off by at most
+``100 * (c - 1) / (n - 1)`` percentage points for n users. Only users with
+the same total rounded to the bucket width (15 minutes by default) can be
+misordered. Totals above ``max_minutes`` share one overflow bucket.
+"""
+
+
+class MinutesHistogram:
+    def __init__(self, max_minutes, bucket_minutes=15):
+        self.bucket_minutes = bucket_minutes
+        self.buckets = max_minutes // bucket_minutes + 1
+        self._tree = [0] * (self.buckets + 1)
+        self._counts = [0] * self.buckets
+        self.total = 0
+
+    def _bucket(self, minutes):
+        return min(int(minutes // self.bucket_minutes), self.buckets - 1)
+
+    def _update(self, bucket, delta):
+        self._counts[bucket] += delta
+        self.total += delta
+        i = bucket + 1
+        while i <= self.buckets:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, bucket):
+        """Number of users in buckets strictly below ``bucket``."""
+        count, i = 0, bucket
+        while i > 0:
+            count += self._tree[i]
+            i -= i & -i
+        return count
+
+    def add(self, minutes):
+        self._update(self._bucket(minutes), 1)
+
+    def remove(self, minutes):
+        self._update(self._bucket(minutes), -1)
+
+    def move(self, old_minutes, new_minutes):
+        old, new = self._bucket(old_minutes), self._bucket(new_minutes)
+        if old != new:
+            self._update(old, -1)
+            self._update(new, 1)
+
+    def count_below(self, minutes):
+        """Estimate how many recorded users have strictly fewer minutes.
+
+        ``minutes`` must belong to a user counted in the histogram.
+        """
+        bucket = self._bucket(minutes)
+        below = self._prefix(bucket)
+        others = self._counts[bucket] - 1
+        if others > 0 and bucket < self.buckets - 1:
+            fraction = (minutes - bucket * self.bucket_minutes) / self.bucket_minutes
+            below += int(others * fraction)
+        return below
+
+    def clear(self):
+        self._tree = [0] * (self.buckets + 1)
+        self._counts = [0] * self.buckets
+        self.total = 0
+
+
+def percentile_from_rank(below, user_count):
+    """Percent of other users strictly below, matching the original dashboard formula."""
+    if user_count <= 1:
+        return 100
+    return int(below / (user_count - 1) * 100)
@@ -0,0 +1,85 @@
+"""Date ranges and time buckets for the record dashboard.
+
+Named ranges ('week', 'month', 'half_year', 'year') end today. A custom
+range comes from ``from``/``to`` query parameters (ISO dates, ``to``
+defaults to today). Every range picks a bucket size from its span so trend
+charts stay at a bounded number of points: daily up to 31 days, weekly
+(Monday-based) up to 26 weeks, monthly beyond that. ``bucket_expr`` groups
+in SQL with the same boundaries that ``bucket_start`` produces in Python.
+"""
+from collections import namedtuple
+from datetime import date, timedelta
+
+from sqlalchemy import func
+
+RANGE_DAYS = {'week': 7, 'month': 30, 'half_year': 182, 'year': 365}
+DAILY_MAX_SPAN = 31
+WEEKLY_MAX_SPAN = 183
+MAX_SPAN = 5 * 366
+
+DateRange = namedtuple('DateRange', 'name start end bucket')
+
+
+def pick_bucket(start, end):
+    span = (end - start).days + 1
+    if span <= DAILY_MAX_SPAN:
+        return 'day'
+    if span <= WEEKLY_MAX_SPAN:
+        return 'week'
+    return 'month'
+
+
+def named_range(name, today=None):
+    today = today or date.today()
+    name = name if name in RANGE_DAYS else 'week'
+    start = today - timedelta(days=RANGE_DAYS[name])
+    return DateRange(name, start, today, pick_bucket(start, today))
+
+
+def resolve_range(args, today=None):
+    """Build a DateRange from request args; returns None for an invalid custom range."""
+    today = today or date.today()
+    if not args.get('from') and not args.get('to'):
+        return named_range(args.get('range', 'week'), today)
+    try:
+        start = date.fromisoformat(args.get('from', ''))
+        end = date.fromisoformat(args['to']) if args.get('to') else today
+    except ValueError:
+        return None
+    if start > end or (end - start).days + 1 > MAX_SPAN:
+        return None
+    return DateRange('custom', start, end, pick_bucket(start, end))
+
+
+def bucket_expr(column, bucket):
+    """SQL expression giving the ISO start date of the bucket containing ``column``."""
+    if bucket == 'week':
+        return func.date(column, 'weekday 0', '-6 days')
+    if bucket == 'month':
+        return func.date(column, 'start of month')
+    return func.date(column)
+
+
+def bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def bucket_starts(rng):
+    """Every bucket start from the bucket containing rng.start up to rng.end."""
+    starts = []
+    current = bucket_start(rng.start, rng.bucket)
+    while current <= rng.end:
+        starts.append(current)
+        if rng.bucket == 'month':
+            current = (current + timedelta(days=32)).replace(day=1)
+        else:
+            current += timedelta(days=7 if rng.bucket == 'week' else 1)
+    return starts
+
+
+def bucket_label(day, bucket):
+    return day.strftime('%Y-%m' if bucket == 'month' else '%m-%d')
@@ -1,185 +1,559 @@
-from flask import Blueprint, jsonify, request, session
+import math
+
+from flask import Blueprint, current_app, jsonify, request, session
 from datetime import date, timedelta
-from sqlalchemy import func
-from models import db, User, WorkoutRecord, SportsCategory
+from sqlalchemy import case, func, literal
+from sqlalchemy.exc import IntegrityError
+from models import db, User, WorkoutRecord, WorkoutDailyRollup
+from categories import categories
+from rollup import rebuild_rollups
+from leaderboard import Leaderboards
+from streaks import current_streak, repair_streaks
+from snapshots import SnapshotCache
+from percentile import percentile_from_rank
+from versions import bump, conditional_get
+from refresher import AggregateRefresher
+from ranges import (
+    RANGE_DAYS, named_range, resolve_range, bucket_expr, bucket_start, bucket_starts, bucket_label
+)
 
 
 record_bp = Blueprint('record', __name__)
 
+@record_bp.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Backfill workout_daily_rollups from the existing workout records."""
+    rows = rebuild_rollups()
+    print(f'Rebuilt {rows} daily rollup rows.')
+
+@record_bp.cli.command('repair-streaks')
+def repair_streaks_command():
+    """Recompute every user's workout streaks from the daily rollup."""
+    users = repair_streaks()
+    print(f'Repaired streaks for {users} users.')
+
+# Named ranges that also keep an in-memory leaderboard and percentile histogram
+LIVE_RANGES = ('week', 'month')
+
+# Seconds a global aggregate may be served before it is recomputed
+GLOBAL_AGGREGATE_TTL = 60
+
+# Default seconds between background refreshes (app.config['AGGREGATE_REFRESH_INTERVAL'])
+AGGREGATE_REFRESH_INTERVAL = 60
+
+# Leaderboard rows kept per precomputed snapshot; larger limits are computed inline
+PRECOMPUTED_LEADERBOARD_SIZE = 100
+
+leaderboards = Leaderboards({name: RANGE_DAYS[name] for name in LIVE_RANGES})
+
+def window_touched(key, deltas):
+    """Whether rollup deltas fall inside the window of a (section, start, end, ...) aggregate key."""
+    return any(key[1] <= day <= key[2] for _, day, _ in deltas)
+
+global_aggregates = SnapshotCache(ttl=GLOBAL_AGGREGATE_TTL).connect(affected=window_touched)
+
+# Filled by the background refresher for every named range; not cleared by writes
+precomputed = SnapshotCache(ttl=3 * AGGREGATE_REFRESH_INTERVAL)
+refresher = AggregateRefresher()
+
+def start_aggregate_refresher(app):
+    """Warm the global dashboard aggregates now and refresh them in a background thread."""
+    interval = app.config.get('AGGREGATE_REFRESH_INTERVAL', AGGREGATE_REFRESH_INTERVAL)
+    # Snapshots older than three intervals mean the refresher stalled; handlers then compute inline
+    precomputed.ttl = 3 * interval
+    refresher.start(app, interval)
+
+def precomputed_snapshot(section, rng):
+    """Return (value, age in whole seconds) from the refresher, or (None, None) when not precomputed."""
+    value, age = precomputed.get_with_age((section, rng.name, rng.start))
+    return value, None if age is None else int(age)
+
 def get_current_user_id():
     return session.get('user_id')
 
-def parse_range(rng: str):
-    today = date.today()
-    if rng == 'month':
-        return today - timedelta(days=30)
-    return today - timedelta(days=7)
+def analytics_engine():
+    """The refreshed NumPy engine when ANALYTICS_BACKEND is 'numpy', otherwise None."""
+    if current_app.config.get('ANALYTICS_BACKEND') != 'numpy':
+        return None
+    from analytics import engine  # numpy is only required for this backend
+    engine.refresh()
+    return engine
+
+def live_board(rng):
+    """The in-memory board for a named live range ending today, else None."""
+    if rng.name in LIVE_RANGES and rng.end == date.today():
+        return leaderboards[rng.name]
+    return None
+
+def in_range(rng):
+    return (WorkoutDailyRollup.date >= rng.start, WorkoutDailyRollup.date <= rng.end)
+
+DASHBOARD_SECTIONS = ('metrics', 'trend', 'aeroAnaerobic', 'categoryComparison', 'leaderboard')
+
+def user_rollup_rows(user_id, rng):
+    """Load the caller's rollup rows in the range; the per-user dashboard parts are built from these."""
+    return (
+        db.session.query(
+            WorkoutDailyRollup.date,
+            WorkoutDailyRollup.category_id,
+            WorkoutDailyRollup.total_min,
+            WorkoutDailyRollup.total_calories,
+            WorkoutDailyRollup.difficulty_sum,
+            WorkoutDailyRollup.record_count
+        )
+        .filter(WorkoutDailyRollup.user_id == user_id, *in_range(rng))
+        .all()
+    )
+
+def user_totals_by_user(rng):
+    """Subquery of (user_id, calories, minutes) totals for every active user in the range."""
+    return (
+        db.session.query(
+            WorkoutDailyRollup.user_id.label('user_id'),
+            func.sum(WorkoutDailyRollup.total_calories).label('calories'),
+            func.sum(WorkoutDailyRollup.total_min).label('minutes')
+        )
+        .filter(*in_range(rng))
+        .group_by(WorkoutDailyRollup.user_id)
+        .subquery()
+    )
+
+def range_percentile(rng, your_minutes, user_count):
+    """Exact percentile for ranges without an in-memory histogram."""
+    if your_minutes <= 0:
+        return percentile_from_rank(0, user_count)
+    totals = user_totals_by_user(rng)
+    active, below = db.session.query(
+        func.count(totals.c.user_id),
+        func.sum(case((totals.c.minutes < your_minutes, 1), else_=0))
+    ).one()
+    return percentile_from_rank(user_count - active + (below or 0), user_count)
+
+def build_metrics(user_id, rng, rows):
+    streak, longest = current_streak(user_id)
+    total_cal = sum(r.total_calories or 0 for r in rows)
+    total_min = sum(r.total_min or 0 for r in rows)
+    user_count = User.query.count()
+    board = live_board(rng)
+    engine = analytics_engine() if board is None else None
+    if board is not None:
+        percentile = board.percentile(user_id, user_count)
+    elif engine is not None:
+        percentile = engine.percentile(user_id, rng, user_count)
+    else:
+        percentile = range_percentile(rng, total_min, user_count)
+
+    return {
+        'current_streak': streak,
+        'longest_streak': longest,
+        'total_calories': round(total_cal, 1),
+        'total_hours': round(total_min / 60, 1),
+        'percentile': percentile
+    }
+
+def bucketed_minutes(rng, user_id=None):
+    """Return {bucket start: (your minutes, average minutes per user)} for buckets with records.
+
+    A single grouped query over the rollup, bucketed in SQL, produces both
+    values; the user count used for the average comes from a scalar subquery
+    in the same statement. Without ``user_id`` your minutes are 0.
+    """
+    bucket = bucket_expr(WorkoutDailyRollup.date, rng.bucket)
+    user_count = db.session.query(func.count(User.id)).scalar_subquery()
+    mine = literal(0) if user_id is None else func.sum(
+        case((WorkoutDailyRollup.user_id == user_id, WorkoutDailyRollup.total_min), else_=0))
+    rows = (
+        db.session.query(bucket, mine, func.sum(WorkoutDailyRollup.total_min), user_count)
+        .filter(*in_range(rng))
+        .group_by(bucket)
+        .all()
+    )
+    return {
+        date.fromisoformat(key): (mine or 0, (total or 0) / users if users else 0)
+        for key, mine, total, users in rows
+    }
+
+def trend_series(user_id, rng):
+    """Return (bucket_starts, your_minutes, average_minutes) for every bucket of the range.
+
+    Buckets without records are filled with zeros.
+    """
+    by_bucket = bucketed_minutes(rng, user_id)
+    starts = bucket_starts(rng)
+    yours = [by_bucket.get(d, (0, 0))[0] for d in starts]
+    average = [by_bucket.get(d, (0, 0))[1] for d in starts]
+    return starts, yours, average
+
+def average_minutes_by_bucket(rng):
+    """Return {bucket start: average minutes per user}, from the same query as trend_series."""
+    engine = analytics_engine()
+    if engine is not None:
+        starts, average = engine.average_trend(rng, User.query.count())
+        return dict(zip(starts, average))
+    return {start: average for start, (_, average) in bucketed_minutes(rng).items()}
+
+def global_average_minutes(rng):
+    """Return ({bucket start: average minutes per user}, snapshot age in seconds)."""
+    average, age = precomputed_snapshot('trend', rng)
+    if average is None:
+        return average_minutes_by_bucket(rng), 0
+    return average, age
+
+def user_minutes_by_bucket(rng, rows):
+    mine = {}
+    for r in rows:
+        key = bucket_start(r.date, rng.bucket)
+        mine[key] = mine.get(key, 0) + r.total_min
+    return mine
+
+def build_trend(rng, starts, yours, average):
+    return {
+        'bucket': rng.bucket,
+        'labels': [bucket_label(d, rng.bucket) for d in starts],
+        'you': [round(m / 60, 2) for m in yours],
+        'average': [round(m / 60, 2) for m in average]
+    }
+
+def build_aero_anaerobic(rows, category_by_id):
+    aerobic = anaerobic = 0
+    for r in rows:
+        category = category_by_id.get(r.category_id)
+        if category is None or category.met_value is None:
+            continue
+        if category.aerobic:
+            aerobic += r.total_min
+        else:
+            anaerobic += r.total_min
+    return {
+        'aerobic': round(aerobic / 60, 2),
+        'anaerobic': round(anaerobic / 60, 2)
+    }
+
+def compute_global_difficulty(rng):
+    """Return {category_id: average difficulty across all users}, cached per range."""
+    engine = analytics_engine()
+    if engine is not None:
+        return engine.global_difficulty(rng)
+    key = ('categoryComparison', rng.start, rng.end)
+    everyone, generation = global_aggregates.lookup(key)
+    if everyone is None:
+        rows = (
+            db.session.query(
+                WorkoutDailyRollup.category_id,
+                func.sum(WorkoutDailyRollup.difficulty_sum),
+                func.sum(WorkoutDailyRollup.record_count)
+            )
+            .filter(*in_range(rng))
+            .group_by(WorkoutDailyRollup.category_id)
+            .all()
+        )
+        everyone = global_aggregates.put(key, {cid: total / count for cid, total, count in rows if count}, generation)
+    return everyone
+
+def global_difficulty_by_category(rng):
+    """Return ({category_id: average difficulty across all users}, snapshot age in seconds)."""
+    everyone, age = precomputed_snapshot('categoryComparison', rng)
+    if everyone is None:
+        return compute_global_difficulty(rng), 0
+    return everyone, age
+
+def category_difficulty(user_id, rng):
+    """Return ({category_id: your average}, {category_id: global average}, snapshot age).
+
+    With a precomputed or cached global snapshot only the caller's rows are
+    grouped; otherwise one conditional-aggregation query returns both halves
+    and refreshes the cache.
+    """
+    everyone, age = precomputed_snapshot('categoryComparison', rng)
+    engine = analytics_engine()
+    if engine is not None:
+        yours, computed = engine.category_difficulty(user_id, rng)
+        return (yours, computed, 0) if everyone is None else (yours, everyone, age)
+    key = ('categoryComparison', rng.start, rng.end)
+    if everyone is None:
+        everyone, generation = global_aggregates.lookup(key)
+        age = 0
+    mine = WorkoutDailyRollup.user_id == user_id
+    columns = [
+        WorkoutDailyRollup.category_id,
+        func.sum(case((mine, WorkoutDailyRollup.difficulty_sum), else_=0)),
+        func.sum(case((mine, WorkoutDailyRollup.record_count), else_=0))
+    ]
+    filters = list(in_range(rng))
+    if everyone is None:
+        columns += [func.sum(WorkoutDailyRollup.difficulty_sum), func.sum(WorkoutDailyRollup.record_count)]
+    else:
+        filters.append(mine)
+    rows = (
+        db.session.query(*columns)
+        .filter(*filters)
+        .group_by(WorkoutDailyRollup.category_id)
+        .all()
+    )
+    yours = {row[0]: row[1] / row[2] for row in rows if row[2]}
+    if everyone is None:
+        everyone = global_aggregates.put(key, {row[0]: row[3] / row[4] for row in rows if row[4]}, generation)
+    return yours, everyone, age
+
+def user_difficulty_by_category(rows):
+    sums = {}
+    for r in rows:
+        total, count = sums.get(r.category_id, (0, 0))
+        sums[r.category_id] = (total + r.difficulty_sum, count + r.record_count)
+    return {cid: total / count for cid, (total, count) in sums.items() if count}
+
+def build_category_comparison(categories, yours, everyone):
+    return {
+        'categories': [cat.name for cat in categories],
+        'you': [round(yours.get(cat.id, 0), 2) for cat in categories],
+        'average': [round(everyone.get(cat.id, 0), 2) for cat in categories]
+    }
+
+def compute_leaderboard_stats(rng, limit):
+    """Return [(user_id, calories, minutes)] for the top calorie totals in the range."""
+    engine = analytics_engine()
+    if engine is not None:
+        return engine.top(rng, limit)
+    key = ('leaderboard', rng.start, rng.end, limit)
+    stats, generation = global_aggregates.lookup(key)
+    if stats is None:
+        totals = user_totals_by_user(rng)
+        rows = (
+            db.session.query(totals.c.user_id, totals.c.calories, totals.c.minutes)
+            .order_by(totals.c.calories.desc(), totals.c.user_id)
+            .limit(limit)
+            .all()
+        )
+        stats = global_aggregates.put(key, [tuple(row) for row in rows], generation)
+    return list(stats)
+
+def leaderboard_stats(rng, limit):
+    """Return (top calorie totals, snapshot age); live boards are always current."""
+    board = live_board(rng)
+    if board is not None:
+        return board.top(limit), 0
+    stats, age = precomputed_snapshot('leaderboard', rng)
+    if stats is None or limit > PRECOMPUTED_LEADERBOARD_SIZE:
+        return compute_leaderboard_stats(rng, limit), 0
+    return stats[:limit], age
+
+def build_leaderboard(rng, limit=10):
+    """Return (leaderboard rows, snapshot age in seconds)."""
+    stats, age = leaderboard_stats(rng, limit)
+    ids = [uid for uid, _, _ in stats]
+    names = dict(db.session.query(User.id, User.username).filter(User.id.in_(ids)).all())
+    if len(stats) < limit:
+        # Fewer active users than requested: fill up with users who have no records
+        idle = (
+            db.session.query(User.id, User.username)
+            .filter(User.id.notin_(ids))
+            .order_by(User.id)
+            .limit(limit - len(stats))
+            .all()
+        )
+        names.update(idle)
+        stats += [(uid, 0, 0) for uid, _ in idle]
+
+    return [
+        {
+            'rank': idx + 1,
+            'username': names.get(uid),
+            'total_calories': round(cal, 1),
+            'total_hours': round(mins / 60, 2)
+        }
+        for idx, (uid, cal, mins) in enumerate(stats)
+    ], age
+
+def leaderboard_rank(user_id, rng):
+    """Return (rank, calories, minutes) for the user in the range."""
+    board = live_board(rng)
+    if board is not None:
+        return board.rank(user_id)
+    totals = user_totals_by_user(rng)
+    mine = db.session.query(totals.c.calories, totals.c.minutes).filter(totals.c.user_id == user_id).first()
+    if mine is None:
+        active = db.session.query(func.count(totals.c.user_id)).scalar()
+        return active + 1, 0, 0
+    ahead = (
+        db.session.query(func.count(totals.c.user_id))
+        .filter((totals.c.calories > mine.calories) |
+                ((totals.c.calories == mine.calories) & (totals.c.user_id < user_id)))
+        .scalar()
+    )
+    return ahead + 1, mine.calories, mine.minutes
+
+def leaderboard_limit():
+    return min(max(request.args.get('limit', 10, type=int), 1), 100)
+
+def invalid_range():
+    return jsonify({'error': 'Invalid date range'}), 400
+
+def with_snapshot_age(payload, age):
+    """JSON response whose X-Snapshot-Age header says how old its global aggregates are."""
+    response = jsonify(payload)
+    response.headers['X-Snapshot-Age'] = str(age)
+    return response
+
+@refresher.job
+def refresh_live_boards():
+    for name in LIVE_RANGES:
+        leaderboards[name].reload()
+
+@refresher.job
+def refresh_global_aggregates():
+    """Precompute the all-user parts of the dashboard for every named range."""
+    changed = False
+    for name in RANGE_DAYS:
+        rng = named_range(name)
+        snapshots = {
+            'trend': average_minutes_by_bucket(rng),
+            'categoryComparison': compute_global_difficulty(rng),
+        }
+        if name not in LIVE_RANGES:
+            snapshots['leaderboard'] = compute_leaderboard_stats(rng, PRECOMPUTED_LEADERBOARD_SIZE)
+        for section, value in snapshots.items():
+            key = (section, rng.name, rng.start)
+            changed = changed or precomputed.get(key) != value
+            precomputed.put(key, value)
+    if changed:
+        # Responses built from the previous snapshots must not be revalidated with a 304
+        bump('record')
+        db.session.commit()
 
 @record_bp.route('/api/record/metrics')
+@conditional_get('record')
 def record_metrics():
     user_id = get_current_user_id()
     if not user_id:
         return jsonify({'error': 'Unauthorized'}), 401
-    rng = request.args.get('range', 'week')
-    start = parse_range(rng)
-
-    recs = WorkoutRecord.query.filter(
-        WorkoutRecord.user_id == user_id,
-        WorkoutRecord.date >= start
-    ).all()
-
-    dates_set = {r.date for r in recs}
-    streak = 0
-    d = date.today()
-    while d in dates_set:
-        streak += 1
-        d -= timedelta(days=1)
-
-    total_cal = sum(r.calories_burn or 0 for r in recs)
-    total_hrs = sum(r.duration_min or 0 for r in recs) / 60
-
-    all_users = User.query.all()
-    hours_list = [
-        sum(rec.duration_min for rec in u.records if rec.date >= start) / 60
-        for u in all_users
-    ]
-    your_hours = next((h for uid, h in zip([u.id for u in all_users], hours_list) if uid == user_id), 0)
-    n = len(hours_list)
-    if n > 1:
-        sorted_hours = sorted(hours_list)
-        idx = sorted_hours.index(your_hours)
-        percentile = int(idx / (n - 1) * 100)
-    else:
-        percentile = 100
+    rng = resolve_range(request.args)
+    if rng is None:
+        return invalid_range()
 
-    return jsonify({
-        'current_streak': streak,
-        'total_calories': round(total_cal, 1),
-        'total_hours': round(total_hrs, 1),
-        'percentile': percentile
-    })
+    rows = user_rollup_rows(user_id, rng)
+    return jsonify(build_metrics(user_id, rng, rows))
 
 @record_bp.route('/api/record/trend')
+@conditional_get('record')
 def record_trend():
     user_id = get_current_user_id()
     if not user_id:
         return jsonify({'error': 'Unauthorized'}), 401
-    rng = request.args.get('range', 'week')
-    start = parse_range(rng)
-    today = date.today()
-    days = [start + timedelta(days=i) for i in range((today - start).days + 1)]
-    labels = [d.strftime('%m-%d') for d in days]
-
-    your_vals = []
-    for d in days:
-        hrs = (
-            WorkoutRecord.query
-            .filter_by(user_id=user_id, date=d)
-            .with_entities(func.sum(WorkoutRecord.duration_min))
-            .scalar() or 0
-        )
-        your_vals.append(round(hrs / 60, 2))
-
-    all_users = User.query.all()
-    avg_vals = []
-    for d in days:
-        total = 0
-        for u in all_users:
-            day_sum = (
-                WorkoutRecord.query
-                .filter_by(user_id=u.id, date=d)
-                .with_entities(func.sum(WorkoutRecord.duration_min))
-                .scalar() or 0
-            )
-            total += day_sum
-        avg = (total / 60 / len(all_users)) if all_users else 0
-        avg_vals.append(round(avg, 2))
-
-    return jsonify({'labels': labels, 'you': your_vals, 'average': avg_vals})
+    rng = resolve_range(request.args)
+    if rng is None:
+        return invalid_range()
+
+    average, age = precomputed_snapshot('trend', rng)
+    if average is not None:
+        starts = bucket_starts(rng)
+        mine = user_minutes_by_bucket(rng, user_rollup_rows(user_id, rng))
+        return with_snapshot_age(build_trend(
+            rng, starts, [mine.get(d, 0) for d in starts], [average.get(d, 0) for d in starts]), age)
+    engine = analytics_engine()
+    if engine is not None:
+        return with_snapshot_age(build_trend(rng, *engine.trend(user_id, rng, User.query.count())), 0)
+    return with_snapshot_age(build_trend(rng, *trend_series(user_id, rng)), 0)
 
 @record_bp.route('/api/record/aeroAnaerobic')
+@conditional_get('record')
 def record_aero_anaerobic():
     user_id = get_current_user_id()
     if not user_id:
         return jsonify({'error': 'Unauthorized'}), 401
-    rng = request.args.get('range', 'week')
-    start = parse_range(rng)
-
-    recs = (
-        WorkoutRecord.query
-        .join(SportsCategory)
-        .filter(
-            WorkoutRecord.user_id == user_id,
-            WorkoutRecord.date >= start
-        )
-        .all()
-    )
+    rng = resolve_range(request.args)
+    if rng is None:
+        return invalid_range()
 
-    aerobic = sum(r.duration_min for r in recs if r.category and r.category.met_value >= 6.0)
-    anaerobic = sum(r.duration_min for r in recs if r.category and r.category.met_value < 6.0)
-
-    return jsonify({
-        'aerobic': round(aerobic / 60, 2),
-        'anaerobic': round(anaerobic / 60, 2)
-    })
+    rows = user_rollup_rows(user_id, rng)
+    return jsonify(build_aero_anaerobic(rows, categories().by_id))
 
 @record_bp.route('/api/record/categoryComparison')
+@conditional_get('record')
 def record_category_comparison():
     user_id = get_current_user_id()
     if not user_id:
         return jsonify({'error': 'Unauthorized'}), 401
-    rng = request.args.get('range', 'week')
-    start = parse_range(rng)
-
-    categories = SportsCategory.query.all()
-    labels = [cat.name for cat in categories]
-    you_data = []
-    avg_data = []
-    for cat in categories:
-        your_avg = (
-            db.session.query(func.avg(WorkoutRecord.difficulty))
-            .filter(
-                WorkoutRecord.user_id == user_id,
-                WorkoutRecord.category_id == cat.id,
-                WorkoutRecord.date >= start
-            )
-            .scalar() or 0
-        )
-        avg_all = (
-            db.session.query(func.avg(WorkoutRecord.difficulty))
-            .filter(
-                WorkoutRecord.category_id == cat.id,
-                WorkoutRecord.date >= start
-            )
-            .scalar() or 0
-        )
-        you_data.append(round(your_avg, 2))
-        avg_data.append(round(avg_all, 2))
+    rng = resolve_range(request.args)
+    if rng is None:
+        return invalid_range()
 
-    return jsonify({'categories': labels, 'you': you_data, 'average': avg_data})
+    yours, everyone, age = category_difficulty(user_id, rng)
+    return with_snapshot_age(build_category_comparison(categories().all, yours, everyone), age)
 
 @record_bp.route('/api/record/leaderboard')
+@conditional_get('record')
 def record_leaderboard():
-    rng = request.args.get('range', 'week')
-    start = parse_range(rng)
+    rng = resolve_range(request.args)
+    if rng is None:
+        return invalid_range()
+    return with_snapshot_age(*build_leaderboard(rng, leaderboard_limit()))
+
+@record_bp.route('/api/record/leaderboard/rank')
+@conditional_get('record')
+def record_leaderboard_rank():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+    rng = resolve_range(request.args)
+    if rng is None:
+        return invalid_range()
 
-    stats = []
-    for u in User.query.all():
-        total_cal = sum((r.calories_burn or 0) for r in u.records if r.date >= start)
-        total_hr = sum((r.duration_min or 0) for r in u.records if r.date >= start) / 60
-        stats.append((u.username, total_cal, total_hr))
+    rank, cal, mins = leaderboard_rank(user_id, rng)
+    return jsonify({
+        'rank': rank,
+        'total_calories': round(cal, 1),
+        'total_hours': round(mins / 60, 2)
+    })
 
-    stats.sort(key=lambda x: x[1], reverse=True)
-    leaderboard = [
-        {
-            'rank': idx + 1,
-            'username': uname,
-            'total_calories': round(cal, 1),
-            'total_hours': round(hr, 2)
-        }
-        for idx, (uname, cal, hr) in enumerate(stats[:10])
-    ]
-    return jsonify(leaderboard)
+@record_bp.route('/api/record/dashboard')
+@conditional_get('record')
+def record_dashboard():
+    """All record dashboard sections in one response, built from one scan of the caller's rows.
+
+    ``sections`` is an optional comma separated subset of DASHBOARD_SECTIONS.
+    ``snapshot_age`` gives the age in seconds of each section's global aggregates.
+    """
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+    rng = resolve_range(request.args)
+    if rng is None:
+        return invalid_range()
+
+    requested = request.args.get('sections')
+    sections = [s for s in requested.split(',') if s] if requested else list(DASHBOARD_SECTIONS)
+    unknown = [s for s in sections if s not in DASHBOARD_SECTIONS]
+    if unknown:
+        return jsonify({'error': f"Unknown sections: {', '.join(unknown)}"}), 400
+
+    result = {
+        'range': rng.name,
+        'from': rng.start.isoformat(),
+        'to': rng.end.isoformat(),
+        'bucket': rng.bucket
+    }
+    rows = user_rollup_rows(user_id, rng) if set(sections) - {'leaderboard'} else []
+    registry = categories()
+
+    if 'metrics' in sections:
+        result['metrics'] = build_metrics(user_id, rng, rows)
+    ages = {}
+    if 'trend' in sections:
+        starts = bucket_starts(rng)
+        mine = user_minutes_by_bucket(rng, rows)
+        average, ages['trend'] = global_average_minutes(rng)
+        result['trend'] = build_trend(
+            rng, starts, [mine.get(d, 0) for d in starts], [average.get(d, 0) for d in starts])
+    if 'aeroAnaerobic' in sections:
+        result['aeroAnaerobic'] = build_aero_anaerobic(rows, registry.by_id)
+    if 'categoryComparison' in sections:
+        everyone, ages['categoryComparison'] = global_difficulty_by_category(rng)
+        result['categoryComparison'] = build_category_comparison(
+            registry.all, user_difficulty_by_category(rows), everyone)
+    if 'leaderboard' in sections:
+        result['leaderboard'], ages['leaderboard'] = build_leaderboard(rng, leaderboard_limit())
+    result['snapshot_age'] = ages
+    return jsonify(result)
 
 @record_bp.route('/api/log_cardio', methods=['POST'])
 def log_cardio():
@@ -199,7 +573,7 @@ def log_cardio():
         return jsonify({'error': 'Missing required fields'}), 400
 
     # Find the sports category by name
-    category = SportsCategory.query.filter_by(name=activity).first()
+    category = categories().by_name.get(activity)
     if not category:
         return jsonify({'error': 'Invalid activity type'}), 400
 
@@ -213,6 +587,7 @@ def log_cardio():
             calories_burn=float(calories)
         )
         db.session.add(record)
+        # rollup.py updates workout_daily_rollups as part of this commit
         db.session.commit()
         return jsonify({'success': True}), 200
     except Exception as e:
@@ -232,7 +607,7 @@ def log_strength():
     difficulty = request.form.get('difficulty', 1)
 
     # Find the sports category by name
-    category = SportsCategory.query.filter_by(name=activity).first()
+    category = categories().by_name.get(activity)
     if not category:
         return jsonify({'error': 'Invalid activity type'}), 400
 
@@ -246,8 +621,124 @@ def log_strength():
             calories_burn=float(calories)
         )
         db.session.add(record)
+        # rollup.py updates workout_daily_rollups as part of this commit
         db.session.commit()
         return jsonify({'success': True}), 200
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+# Most workouts accepted by one /api/log_workouts call
+BATCH_LOG_LIMIT = 500
+# Oldest workout date a batch may carry, for clients syncing a backlog logged offline
+BATCH_LOG_MAX_AGE_DAYS = 30
+
+def parse_workout(item, by_name):
+    """Validate one batch item; returns WorkoutRecord fields or raises ValueError."""
+    if not isinstance(item, dict):
+        raise ValueError('Workout must be an object')
+    activity = item.get('activity')
+    category = by_name.get(activity) if isinstance(activity, str) else None
+    if category is None:
+        raise ValueError('Invalid activity type')
+    try:
+        duration = float(item['duration'])
+        calories = float(item['calories'])
+        difficulty = int(item.get('difficulty', 1))
+        day = date.fromisoformat(item['date']) if item.get('date') else date.today()
+    except KeyError as e:
+        raise ValueError(f'Missing required field: {e.args[0]}')
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('Invalid field value')
+    # float() accepts "inf" and "nan", which no range check below would catch
+    if not (math.isfinite(duration) and math.isfinite(calories)):
+        raise ValueError('Invalid field value')
+    duration = int(duration)
+    if duration <= 0 or calories < 0 or not 1 <= difficulty <= 5:
+        raise ValueError('Field value out of range')
+    # A future date would sit on the live leaderboards and break the streak until that day
+    today = date.today()
+    if not today - timedelta(days=BATCH_LOG_MAX_AGE_DAYS) <= day <= today:
+        raise ValueError('Field value out of range')
+    return {
+        'category_id': category.id,
+        'date': day,
+        'duration_min': duration,
+        'difficulty': difficulty,
+        'calories_burn': calories
+    }
+
+def existing_client_keys(user_id, keys):
+    if not keys:
+        return {}
+    return dict(
+        db.session.query(WorkoutRecord.client_key, WorkoutRecord.id)
+        .filter(WorkoutRecord.user_id == user_id, WorkoutRecord.client_key.in_(keys))
+        .all()
+    )
+
+def log_workout_batch(user_id, items):
+    """Insert every new item in one transaction; returns one result dict per item."""
+    keys = [item.get('client_key') if isinstance(item, dict) else None for item in items]
+    existing = existing_client_keys(user_id, [k for k in keys if isinstance(k, str)])
+    by_name = categories().by_name
+
+    results, created = [], []
+    for item, key in zip(items, keys):
+        if not isinstance(key, str) or not 0 < len(key) <= 64:
+            results.append({'client_key': key, 'status': 'error', 'error': 'client_key must be a string of 1-64 characters'})
+            continue
+        if key in existing:
+            results.append({'client_key': key, 'status': 'duplicate', 'id': existing[key]})
+            continue
+        try:
+            record = WorkoutRecord(user_id=user_id, client_key=key, **parse_workout(item, by_name))
+        except ValueError as e:
+            results.append({'client_key': key, 'status': 'error', 'error': str(e)})
+            continue
+        # Later items repeating a key within the same batch are duplicates of this one
+        existing[key] = None
+        results.append({'client_key': key, 'status': 'created'})
+        created.append((results[-1], record))
+
+    db.session.add_all(record for _, record in created)
+    # rollup.py updates workout_daily_rollups for the whole batch as part of this commit
+    db.session.commit()
+    for result, record in created:
+        result['id'] = record.id
+        existing[record.client_key] = record.id
+    for result in results:
+        if result['status'] == 'duplicate' and result['id'] is None:
+            result['id'] = existing[result['client_key']]
+    return results
+
+@record_bp.route('/api/log_workouts', methods=['POST'])
+def log_workouts():
+    """Log a batch of workouts queued by a client, e.g. a phone syncing after being offline.
+
+    Body: {"workouts": [{"client_key", "activity", "duration", "calories",
+    "difficulty"?, "date"?}]}. Items whose client_key was already logged by
+    this user are reported as duplicates and not written again.
+    """
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+    data = request.get_json(silent=True) or {}
+    items = data.get('workouts')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'workouts must be a non-empty list'}), 400
+    if len(items) > BATCH_LOG_LIMIT:
+        return jsonify({'error': f'At most {BATCH_LOG_LIMIT} workouts per request'}), 400
+
+    try:
+        results = log_workout_batch(user_id, items)
+    except IntegrityError:
+        # A concurrent sync committed some of the same keys first; they now read as duplicates
+        db.session.rollback()
+        results = log_workout_batch(user_id, items)
+    return jsonify({
+        'results': results,
+        'created': sum(r['status'] == 'created' for r in results),
+        'duplicates': sum(r['status'] == 'duplicate' for r in results),
+        'failed': sum(r['status'] == 'error' for r in results)
+    })
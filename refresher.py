@@ -0,0 +1,66 @@
+"""Background refresh of the record dashboard's global aggregates.
+
+``AggregateRefresher`` runs registered jobs in a daemon thread inside an app
+context: once at startup to warm the caches, then every ``interval``
+seconds. Jobs write their results into a ``SnapshotCache`` that is not
+cleared by workout writes, so request handlers read a precomputed value and
+report its age instead of running the global queries themselves.
+
+``app.py`` starts the thread on the first request of each serving process
+when ``AGGREGATE_REFRESHER`` is set and the app is not testing; without it
+(tests, CLI commands) handlers compute the same aggregates inline.
+"""
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class AggregateRefresher:
+    def __init__(self):
+        self.jobs = []
+        self.interval = None
+        self._stop = threading.Event()
+        self._thread = None
+        # Concurrent first requests may all try to start the thread
+        self._start_lock = threading.Lock()
+
+    def job(self, func):
+        """Register a callable run on every refresh; usable as a decorator."""
+        self.jobs.append(func)
+        return func
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def run_once(self):
+        for func in self.jobs:
+            try:
+                func()
+            except Exception:
+                log.exception('Aggregate refresh job %s failed', func.__name__)
+
+    def _loop(self, app):
+        while True:
+            with app.app_context():
+                self.run_once()
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self, app, interval=60):
+        """Warm every job now and keep refreshing them every ``interval`` seconds."""
+        with self._start_lock:
+            if self.running:
+                return
+            self.interval = interval
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, args=(app,), name='aggregate-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._start_lock:
+            self._stop.set()
+            if self._thread is not None:
+                self._thread.join()
+                self._thread = None
@@ -0,0 +1,201 @@
+"""Daily rollup of workout records.
+
+``workout_daily_rollups`` holds one row per (user, date, category) with the
+total minutes, calories, difficulty sum and record count for that day. The
+rows are updated in the same transaction as the records themselves (see
+``_sync_rollups``), so the dashboard endpoints in ``record.py`` can read the
+rollup instead of rescanning ``workout_records``.
+
+Tables derived from the rollup (see ``streaks.py``) subscribe to
+``rollup_flushed``, which is sent inside the flush with the connection so they
+can update in the same transaction; ``rollup_staged`` is sent at the same
+point by flushes and bulk writers alike (see ``versions.py``). In-memory aggregates (see
+``leaderboard.py``) subscribe to ``rollup_changed``, which is sent with the
+same deltas once the transaction has committed, and to ``rollup_rebuilt``,
+which tells them to reload from the table.
+
+Core bulk inserts bypass the flush hook; their writers hand the deltas to
+``stage_bulk_deltas`` so the rollup and the after-commit signal still follow.
+"""
+from blinker import Namespace
+from sqlalchemy import bindparam, event, func, inspect
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, WorkoutRecord, WorkoutDailyRollup
+
+_signals = Namespace()
+# Sent inside the flush, after the rollup rows were updated, with connection= and deltas=
+rollup_flushed = _signals.signal('rollup-flushed')
+# Sent in the writing transaction by flushes and bulk writers, with connection= and deltas=;
+# receivers may return the data version the transaction commits (see versions.py)
+rollup_staged = _signals.signal('rollup-staged')
+# Sent after commit with deltas={(user_id, date, category_id): [min, cal, diff, count]}
+# and version=, the highest version returned by rollup_staged receivers (None without one)
+rollup_changed = _signals.signal('rollup-changed')
+# Sent after the rollup table was rebuilt or recreated from scratch
+rollup_rebuilt = _signals.signal('rollup-rebuilt')
+
+
+def _record_values(record, previous=False):
+    """Return (key, delta) for a record, optionally using its pre-flush values."""
+    state = inspect(record)
+
+    def value(attr):
+        hist = state.attrs[attr].history
+        if previous and hist.deleted:
+            return hist.deleted[0]
+        return getattr(record, attr)
+
+    key = (value('user_id'), value('date'), value('category_id'))
+    delta = (
+        value('duration_min') or 0,
+        value('calories_burn') or 0,
+        value('difficulty') or 0,
+        1,
+    )
+    return key, delta
+
+
+def _accumulate(deltas, key, delta, sign):
+    current = deltas.setdefault(key, [0, 0.0, 0, 0])
+    for i, v in enumerate(delta):
+        current[i] += sign * v
+
+
+ROLLUP_COLUMNS = ('user_id', 'date', 'category_id', 'total_min', 'total_calories', 'difficulty_sum', 'record_count')
+
+
+def apply_rollup_deltas(connection, deltas):
+    """Upsert a {(user_id, date, category_id): [min, cal, diff, count]} mapping."""
+    table = WorkoutDailyRollup.__table__
+    rows = [
+        (user_id, day.isoformat(), category_id, minutes, calories, difficulty, count)
+        for (user_id, day, category_id), (minutes, calories, difficulty, count) in deltas.items()
+        if count or minutes or calories or difficulty
+    ]
+    if not rows:
+        return
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.date, table.c.category_id],
+        set_={
+            'total_min': table.c.total_min + stmt.excluded.total_min,
+            'total_calories': table.c.total_calories + stmt.excluded.total_calories,
+            'difficulty_sum': table.c.difficulty_sum + stmt.excluded.difficulty_sum,
+            'record_count': table.c.record_count + stmt.excluded.record_count,
+        },
+    )
+    # One executemany on the driver for the whole mapping: bulk imports pass
+    # tens of thousands of keys and Core's per-row bind processing dominated.
+    # ROLLUP_COLUMNS is in table order, which is the order of the compiled placeholders.
+    compiled = stmt.compile(dialect=connection.dialect, column_keys=ROLLUP_COLUMNS)
+    connection.exec_driver_sql(compiled.string, rows)
+
+    # Only keys whose count went down can have emptied; avoids scanning the table
+    shrunk = [
+        {'b_user_id': user_id, 'b_date': day, 'b_category_id': category_id}
+        for (user_id, day, category_id), delta in deltas.items()
+        if delta[3] < 0
+    ]
+    if shrunk:
+        connection.execute(table.delete().where(
+            table.c.user_id == bindparam('b_user_id'),
+            table.c.date == bindparam('b_date'),
+            table.c.category_id == bindparam('b_category_id'),
+            table.c.record_count <= 0,
+        ), shrunk)
+
+
+def _stage(session, connection, deltas):
+    versions = [version for _, version in rollup_staged.send(session, connection=connection, deltas=deltas)
+                if version is not None]
+    if versions:
+        session.info['rollup_version'] = max(versions + [session.info.get('rollup_version', 0)])
+    session.info.setdefault('rollup_deltas', []).append(deltas)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _sync_rollups(session, flush_context):
+    # Runs inside the flush, so the rollup commits or rolls back with the records
+    deltas = {}
+    for obj in session.new:
+        if isinstance(obj, WorkoutRecord):
+            _accumulate(deltas, *_record_values(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, WorkoutRecord):
+            _accumulate(deltas, *_record_values(obj, previous=True), -1)
+    for obj in session.dirty:
+        if isinstance(obj, WorkoutRecord) and session.is_modified(obj):
+            _accumulate(deltas, *_record_values(obj, previous=True), -1)
+            _accumulate(deltas, *_record_values(obj), 1)
+    if deltas:
+        connection = session.connection()
+        apply_rollup_deltas(connection, deltas)
+        rollup_flushed.send(session, connection=connection, deltas=deltas)
+        _stage(session, connection, deltas)
+
+
+def stage_bulk_deltas(session, deltas):
+    """Apply deltas for rows written with Core statements in the session's transaction.
+
+    Like the flush hook, the rollup is updated and ``rollup_staged`` sent now,
+    and ``rollup_changed`` is sent once the session commits. ``rollup_flushed`` is not sent: bulk
+    writers repair derived tables (streaks) for the touched users themselves.
+    """
+    if not deltas:
+        return
+    connection = session.connection()
+    apply_rollup_deltas(connection, deltas)
+    _stage(session, connection, deltas)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_rollup_deltas(session):
+    pending = session.info.pop('rollup_deltas', None)
+    version = session.info.pop('rollup_version', None)
+    if not pending:
+        return
+    if len(pending) == 1:
+        merged = pending[0]
+    else:
+        merged = {}
+        for deltas in pending:
+            for key, delta in deltas.items():
+                _accumulate(merged, key, delta, 1)
+    rollup_changed.send(session, deltas=merged, version=version)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_rollup_deltas(session):
+    session.info.pop('rollup_deltas', None)
+    session.info.pop('rollup_version', None)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _rollup_table_created(target, connection, **kw):
+    rollup_rebuilt.send(target)
+
+
+def rebuild_rollups():
+    """Recompute the whole rollup table from workout_records. Returns the row count."""
+    table = WorkoutDailyRollup.__table__
+    source = db.session.query(
+        WorkoutRecord.user_id,
+        WorkoutRecord.date,
+        WorkoutRecord.category_id,
+        func.sum(WorkoutRecord.duration_min),
+        func.sum(func.coalesce(WorkoutRecord.calories_burn, 0)),
+        func.sum(WorkoutRecord.difficulty),
+        func.count(WorkoutRecord.id),
+    ).group_by(
+        WorkoutRecord.user_id, WorkoutRecord.date, WorkoutRecord.category_id
+    )
+    db.session.execute(table.delete())
+    db.session.execute(table.insert().from_select(
+        ['user_id', 'date', 'category_id', 'total_min', 'total_calories',
+         'difficulty_sum', 'record_count'],
+        source,
+    ))
+    db.session.commit()
+    rollup_rebuilt.send(table)
+    return db.session.query(func.count()).select_from(table).scalar()
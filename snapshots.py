@@ -0,0 +1,99 @@
+"""Short-lived cache for the global (all-user) parts of the record dashboard.
+
+Values are stored per key together with the time they were computed. An
+entry is served until it is older than the cache's ``ttl`` seconds or until
+workout records it covers change, whichever comes first. Keys include the
+window start date, so a new day never reuses yesterday's aggregates.
+
+A cache connected with an ``affected(key, deltas)`` predicate only drops the
+entries a commit's rollup deltas touch; without one every commit clears it.
+A value computed from the database is stored with the generation ``lookup``
+returned before the computation, and is dropped instead if a commit that
+affects its key happened in between, so a slow request cannot put back an
+aggregate that a write has already made stale.
+
+Caches filled by the background refresher are not connected: they keep
+serving the last snapshot between refreshes and report its age instead.
+"""
+import threading
+import time
+from collections import deque
+
+from rollup import rollup_changed, rollup_rebuilt
+
+# Commits remembered for checking puts; older puts are dropped
+MAX_CHANGES = 256
+
+
+class SnapshotCache:
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}   # key -> (computed_at, value)
+        self._affected = None
+        self._generation = 0
+        self._changes = deque()   # (generation, deltas) of recent commits, oldest first
+        # Puts computed before this generation may predate forgotten changes and are dropped
+        self._floor = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None when missing or expired."""
+        return self.get_with_age(key)[0]
+
+    def lookup(self, key):
+        """Return (cached value or None, generation to pass to ``put``)."""
+        with self._lock:
+            generation = self._generation
+        return self.get(key), generation
+
+    def get_with_age(self, key):
+        """Return (value, age in seconds), or (None, None) when missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None, None
+        age = time.monotonic() - entry[0]
+        if age > self.ttl:
+            return None, None
+        return entry[1], age
+
+    def put(self, key, value, generation=None):
+        """Store and return value; with a ``generation`` from ``lookup``, skip the store if key changed since."""
+        with self._lock:
+            if generation is None or not self._changed_since(key, generation):
+                self._entries[key] = (time.monotonic(), value)
+        return value
+
+    def _changed_since(self, key, generation):
+        if generation < self._floor:
+            return True
+        return any(
+            changed > generation and (deltas is None or self._affected(key, deltas))
+            for changed, deltas in self._changes
+        )
+
+    def invalidate(self, sender=None, deltas=None, **kwargs):
+        """Drop the entries that ``deltas`` affect, or every entry when there are no deltas."""
+        with self._lock:
+            self._generation += 1
+            if deltas is None or self._affected is None:
+                self._entries.clear()
+                self._changes.clear()
+                self._floor = self._generation
+                return
+            self._changes.append((self._generation, deltas))
+            if len(self._changes) > MAX_CHANGES:
+                self._floor = self._changes.popleft()[0]
+            for key in [key for key in self._entries if self._affected(key, deltas)]:
+                del self._entries[key]
+
+    def connect(self, affected=None):
+        """Drop entries whenever committed records change the rollup.
+
+        ``affected(key, deltas)`` tells whether rollup deltas change the value
+        at key; without it every change drops every entry.
+        """
+        self._affected = affected
+        rollup_changed.connect(self.invalidate, weak=False)
+        rollup_rebuilt.connect(self.invalidate, weak=False)
+        return self
@@ -0,0 +1,113 @@
+"""Bounded LRU caches for the social feed.
+
+The feed is rendered from two layers. Post fragments (author, content,
+timestamp, counters and comments) are the same for every viewer and are
+cached by post id; the social write endpoints invalidate the post they
+touch. Each viewer's overlay is the set of post ids they liked and the set
+they bookmarked, cached by user id and invalidated by that user's own
+toggles. A response copies each fragment and sets ``is_liked`` and
+``is_bookmarked`` from the overlay.
+
+Both caches count hits and misses (see ``stats()``). A value loaded from the
+database is only stored if its key was not invalidated while it was being
+loaded, so a slow reader cannot put back data that a write just replaced,
+while writes to other keys leave the fill alone.
+
+The state is per process, so each cache is also checked against the
+database's ``feed`` data version (see ``versions.py``) before it is read.
+Writes made by this process note the version they committed after
+invalidating what they touched; if the database version includes any
+version that was not noted, another process (a worker, or a CLI command
+such as ``flask social reconcile-counts``) wrote to the feed, and the cache
+is cleared.
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        # key: generation of its latest invalidation, oldest first; at most max_entries are kept
+        self._invalidated = OrderedDict()
+        # Puts loaded before this generation may miss forgotten invalidations and are dropped
+        self._floor = 0
+        # Last data version synced, and later versions written by this process
+        self._version = None
+        self._local = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """Return ({key: value} for the cached keys, generation to pass to ``put_many``)."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = value
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            return found, self._generation
+
+    def put_many(self, items, generation):
+        """Store values loaded since ``get_many`` returned ``generation``, except keys invalidated since."""
+        with self._lock:
+            if generation < self._floor:
+                return
+            for key, value in items.items():
+                if self._invalidated.get(key, -1) > generation:
+                    continue
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+                self._invalidated[key] = self._generation
+                self._invalidated.move_to_end(key)
+            while len(self._invalidated) > self.max_entries:
+                _, generation = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, generation)
+
+    def clear(self, *args, **kwargs):
+        with self._lock:
+            self._clear()
+            self._version = None
+            self._local.clear()
+
+    def _clear(self):
+        self._generation += 1
+        self._floor = self._generation
+        self._invalidated.clear()
+        self._entries.clear()
+
+    def note(self, version):
+        """Record a data version committed by this process, whose keys were invalidated here."""
+        with self._lock:
+            if self._version is not None and version > self._version:
+                self._local.add(version)
+
+    def sync(self, version):
+        """Clear the cache if the database's data ``version`` includes writes this process did not note."""
+        with self._lock:
+            if self._version is not None and version <= self._version:
+                return
+            if (self._version is None or version - self._version > len(self._local)
+                    or any(v not in self._local for v in range(self._version + 1, version + 1))):
+                self._clear()
+            self._local = {v for v in self._local if v > version}
+            self._version = version
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._entries), 'max_entries': self.max_entries}
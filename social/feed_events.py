@@ -0,0 +1,98 @@
+"""In-process change log of feed events, streamed to browsers as Server-Sent Events.
+
+The social write endpoints ``publish`` an event after their commit: ``post``
+for a new post (its feed fragment), ``counts`` when a like or bookmark
+changes a post's counters, and ``comment`` for a new comment. Events get
+increasing ids and the last ``MAX_EVENTS`` are kept, so a client that
+reconnects with ``Last-Event-ID`` receives exactly the events it missed.
+When it has fallen further behind than the log reaches, or the id comes
+from an earlier process (ids carry a boot token, as ETags do in
+``versions.py``), it gets a single ``reset`` event and reloads the feed.
+
+The log and its waiters live in this process; nothing outside it is needed,
+but clients only see writes made by the process serving their stream. Each
+open stream holds one server thread.
+"""
+import json
+import os
+import threading
+from collections import deque
+
+# Events kept for clients resuming with Last-Event-ID
+MAX_EVENTS = 1000
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15
+# Milliseconds the browser waits before reconnecting
+RETRY_MS = 3000
+
+
+class FeedEventLog:
+    def __init__(self, max_events=MAX_EVENTS):
+        self.boot = os.urandom(4).hex()
+        self._events = deque(maxlen=max_events)   # (seq, kind, data)
+        self._last_seq = 0
+        self._changed = threading.Condition()
+
+    def publish(self, kind, data):
+        with self._changed:
+            self._last_seq += 1
+            self._events.append((self._last_seq, kind, data))
+            self._changed.notify_all()
+            return self._last_seq
+
+    def position(self, last_event_id=None):
+        """The sequence number to resume after, or None when ``last_event_id`` cannot be resumed."""
+        with self._changed:
+            if not last_event_id:
+                return self._last_seq
+            boot, _, seq = last_event_id.partition('-')
+            if boot != self.boot or not seq.isdigit() or int(seq) > self._last_seq:
+                return None
+            seq = int(seq)
+            oldest = self._events[0][0] if self._events else self._last_seq + 1
+            # Events after seq must still all be in the log
+            return seq if seq >= oldest - 1 else None
+
+    def wait(self, after, timeout):
+        """Events after sequence ``after``, waiting up to ``timeout`` seconds for one.
+
+        Returns None when ``after`` has dropped out of the log.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._last_seq > after, timeout)
+            if self._events and self._events[0][0] > after + 1:
+                return None
+            return [event for event in self._events if event[0] > after]
+
+    def event_id(self, seq):
+        return f'{self.boot}-{seq}'
+
+    def stream(self, last_event_id=None, heartbeat=HEARTBEAT_INTERVAL):
+        """The text/event-stream body for a client resuming after ``last_event_id``.
+
+        The resume position is taken now, so events published before the
+        body starts being sent are not lost.
+        """
+        return self._stream(self.position(last_event_id), heartbeat)
+
+    def _stream(self, after, heartbeat):
+        yield f'retry: {RETRY_MS}\n\n'
+        if after is None:
+            after = self.position()
+            yield self._format(after, 'reset', {})
+        while True:
+            events = self.wait(after, heartbeat)
+            if events is None:
+                after = self.position()
+                yield self._format(after, 'reset', {})
+            elif not events:
+                yield ': keep-alive\n\n'
+            for seq, kind, data in events or ():
+                yield self._format(seq, kind, data)
+                after = seq
+
+    def _format(self, seq, kind, data):
+        return f'id: {self.event_id(seq)}\nevent: {kind}\ndata: {json.dumps(data)}\n\n'
+
+
+feed_events = FeedEventLog()
@@ -0,0 +1,218 @@
+"""Full-text search over posts and comments with SQLite FTS5.
+
+``search_index`` is an FTS5 table holding the text of every post and
+comment. Rowids keep the two apart (``2 * id`` for a post, ``2 * id + 1``
+for a comment) and ``post_id`` says which post a row belongs to. Triggers on
+``posts`` and ``comments`` keep it in step with every insert, update and
+delete, including Core and raw SQL writes. The table and triggers are
+created with the other tables and filled from existing rows the first time;
+``flask social rebuild-search`` refills it from scratch.
+
+A search matches posts and comments alike and returns each post once, at the
+BM25 rank of its best matching row, best first. Scoring costs a few
+microseconds per matching row, so only the ``SEARCH_CANDIDATES`` matching
+rows with the highest rowids (roughly the newest) are ranked: a common word costs the same on a million posts
+as on ten thousand, and older matches drop out of such searches. Only the
+rows on a page get a highlighted snippet.
+
+BM25 scores depend on statistics of the whole index, so any post or comment
+written between two page requests moves every score. The first page
+therefore ranks the whole candidate window once and keeps the ranked list
+in memory under a token carried by the cursor, and later pages are slices
+of that list: no result is repeated or skipped, and rows written after the
+first page do not appear. When the list is no longer cached (it was evicted,
+or another process serves the request) the window, bounded by the rowids
+the first page saw, is ranked again; only then may writes in between shift
+the order.
+
+SQLite only: on other databases nothing is created and searching is not
+supported.
+"""
+import base64
+import html
+import re
+import secrets
+from array import array
+
+from sqlalchemy import event, text
+
+from models import db
+from social.feed_cache import LRUCache
+
+SEARCH_DDL = (
+    # Porter stemming lets "run" find "running" without costly prefix queries
+    """CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        body, post_id UNINDEXED,
+        tokenize = 'porter unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS search_posts_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO search_index (rowid, body, post_id) VALUES (2 * new.id, new.content, new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_posts_update AFTER UPDATE OF content ON posts BEGIN
+        UPDATE search_index SET body = new.content WHERE rowid = 2 * old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_posts_delete AFTER DELETE ON posts BEGIN
+        DELETE FROM search_index WHERE rowid = 2 * old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_comments_insert AFTER INSERT ON comments BEGIN
+        INSERT INTO search_index (rowid, body, post_id) VALUES (2 * new.id + 1, new.content, new.post_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_comments_update AFTER UPDATE OF content ON comments BEGIN
+        UPDATE search_index SET body = new.content WHERE rowid = 2 * old.id + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_comments_delete AFTER DELETE ON comments BEGIN
+        DELETE FROM search_index WHERE rowid = 2 * old.id + 1;
+    END""",
+)
+
+# Characters wrapped around matched terms in snippets before they are escaped
+_MARK_START, _MARK_END = '\x02', '\x03'
+SNIPPET_TOKENS = 16
+# Matching rows that are ranked per search, newest first; bounds the BM25 work for common words
+SEARCH_CANDIDATES = 10_000
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+# Ranked result lists kept for paging, one per first-page search
+RESULT_CACHE_SIZE = 128
+
+# Bare rowid next to min(rank) comes from the row holding the minimum (a SQLite guarantee)
+_RANKED = """
+    SELECT rowid, post_id, min(rank) AS score
+    FROM search_index WHERE search_index MATCH :query AND rowid BETWEEN :oldest AND :newest
+    GROUP BY post_id
+    ORDER BY score, post_id DESC
+"""
+# FTS5 walks matches in rowid order without scoring them, so this stays cheap
+_OLDEST_CANDIDATE = """
+    SELECT rowid FROM search_index WHERE search_index MATCH :query
+    ORDER BY rowid DESC LIMIT 1 OFFSET :offset
+"""
+_NEWEST_ROW = "SELECT max(rowid) FROM search_index"
+
+_SNIPPETS = f"""
+    SELECT rowid, snippet(search_index, 0, '{_MARK_START}', '{_MARK_END}', '…', {SNIPPET_TOKENS})
+    FROM search_index WHERE search_index MATCH :query AND rowid IN ({{rowids}})
+"""
+
+
+# token: (rowids, post_ids) of a search's ranked results, best first
+_results = LRUCache(RESULT_CACHE_SIZE)
+
+
+def is_supported(connection):
+    return connection.dialect.name == 'sqlite'
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_index(target, connection, **kw):
+    # Cached result lists point at rowids of the old tables
+    _results.clear()
+    if not is_supported(connection):
+        return
+    existed = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+    ).first()
+    for statement in SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+    if not existed:
+        rebuild_search_index(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    if is_supported(connection):
+        # The triggers go with their tables; the FTS table would otherwise outlive them
+        connection.exec_driver_sql('DROP TABLE IF EXISTS search_index')
+
+
+def rebuild_search_index(connection):
+    """Refill search_index from posts and comments; returns the number of rows indexed."""
+    connection.exec_driver_sql('DELETE FROM search_index')
+    posts = connection.exec_driver_sql(
+        'INSERT INTO search_index (rowid, body, post_id) SELECT 2 * id, content, id FROM posts')
+    comments = connection.exec_driver_sql(
+        'INSERT INTO search_index (rowid, body, post_id) '
+        'SELECT 2 * id + 1, content, post_id FROM comments WHERE content IS NOT NULL')
+    connection.exec_driver_sql("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    return posts.rowcount + comments.rowcount
+
+
+def match_expression(query):
+    """An FTS5 query matching every word of ``query``.
+
+    Words are quoted, so FTS5 operators typed by users are searched as text
+    instead of raising syntax errors. Returns None when there are no words.
+    """
+    terms = _TERM.findall(query)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def encode_cursor(token, offset, oldest, newest):
+    raw = f'{token}|{offset}|{oldest}|{newest}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (token, offset, oldest, newest candidate rowid); raises ValueError if the cursor is malformed."""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    token, offset, oldest, newest = raw.split('|')
+    return token, int(offset), int(oldest), int(newest)
+
+
+def _highlight(snippet):
+    return html.escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def _rank(expression, oldest, newest):
+    """(rowids, post_ids) of the best matching row of each post in the window, best first."""
+    rowids, post_ids = array('q'), array('q')
+    for rowid, post_id, _ in db.session.execute(
+        text(_RANKED), {'query': expression, 'oldest': oldest, 'newest': newest}
+    ):
+        rowids.append(rowid)
+        post_ids.append(post_id)
+    return rowids, post_ids
+
+
+def search_posts(query, limit, cursor=None):
+    """One page of (post_id, matched 'post' or 'comment', HTML snippet), best match first.
+
+    Returns (hits, next_cursor). ``cursor`` is a value from ``decode_cursor``.
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return [], None
+    if cursor:
+        token, offset, oldest, newest = cursor
+    else:
+        token, offset = secrets.token_urlsafe(9), 0
+        oldest = db.session.execute(
+            text(_OLDEST_CANDIDATE), {'query': expression, 'offset': SEARCH_CANDIDATES - 1}
+        ).scalar() or 0
+        newest = db.session.execute(text(_NEWEST_ROW)).scalar() or 0
+    found, generation = _results.get_many([token])
+    ranked = found.get(token)
+    if ranked is None:
+        ranked = _rank(expression, oldest, newest)
+        _results.put_many({token: ranked}, generation)
+
+    rowids, post_ids = ranked
+    end = offset + limit
+    next_cursor = encode_cursor(token, end, oldest, newest) if end < len(rowids) else None
+    page = list(zip(rowids[offset:end], post_ids[offset:end]))
+    if not page:
+        return [], None
+
+    # rowids are integers from the index, so inlining them is safe
+    snippets = dict(db.session.execute(
+        text(_SNIPPETS.format(rowids=', '.join(str(rowid) for rowid, _ in page))),
+        {'query': expression},
+    ).all())
+    hits = [
+        (post_id, 'comment' if rowid % 2 else 'post', _highlight(snippets.get(rowid, '')))
+        for rowid, post_id in page
+    ]
+    return hits, next_cursor
@@ -7,50 +7,131 @@ fetch('/api/csrf-token')
     })
     .catch(err => console.error('Failed to fetch CSRF token:', err));
 
-// Render posts to #post-list
+// Feed paging state: the cursor for the next page, or null once the end is reached
+let nextCursor = null;
+let feedLoading = false;
+let feedGeneration = 0;
+const feedPosts = {};
+
+// Build the card for one post
+function renderPost(post) {
+    const postCard = document.createElement('div');
+    postCard.className = 'card post-card';
+    postCard.style.marginBottom = '24px';
+    postCard.dataset.postId = post.id;
+    postCard.innerHTML = `
+        <div class="post-header">
+            <strong>${post.username}</strong>
+            <small style="margin-left: 8px; color: #777;">${post.timestamp}</small>
+        </div>
+        <div class="post-content">${post.content}</div>
+        <div class="post-actions" style="display: flex; gap: 20px; font-size: 18px;">
+            <span class="action-button" onclick="likePost(${post.id})">❤️ ${post.likes}</span>
+            <span>💬 ${post.comment_count}</span>
+            <span class="action-button" onclick="bookmarkPost(${post.id})">${post.is_bookmarked ? '🔖' : '📑'} ${post.bookmarks}</span>
+        </div>
+        <div class="post-comments" style="border-top: 1px solid #eee; padding-top: 10px;">
+            ${post.comments_cursor ? `<p class="action-button" style="color: #777;" onclick="loadEarlierComments(${post.id})">View earlier comments</p>` : ''}
+            ${post.comments.map(c => `<p><strong>${c.username}:</strong> ${c.text}</p>`).join('')}
+            <input type="text" class="comment-input" placeholder="Add a comment..." onkeydown="if(event.key==='Enter'){submitComment(${post.id}, this.value); this.value='';}">
+        </div>
+    `;
+    return postCard;
+}
+
+// Append a page of posts to #post-list
 function renderPosts(posts) {
     const postList = document.getElementById('post-list');
-    postList.innerHTML = '';
     posts.forEach(post => {
-        const postCard = document.createElement('div');
-        postCard.className = 'card post-card';
-        postCard.style.marginBottom = '24px';
-        postCard.innerHTML = `
-            <div class="post-header">
-                <strong>${post.username}</strong>
-                <small style="margin-left: 8px; color: #777;">${post.timestamp}</small>
-            </div>
-            <div class="post-content">${post.content}</div>
-            <div class="post-actions" style="display: flex; gap: 20px; font-size: 18px;">
-                <span class="action-button" onclick="likePost(${post.id})">❤️ ${post.likes}</span>
-                <span>💬 ${post.comments.length}</span>
-                <span class="action-button" onclick="bookmarkPost(${post.id})">${post.is_bookmarked ? '🔖' : '📑'} ${post.bookmarks}</span>
-            </div>
-            <div class="post-comments" style="border-top: 1px solid #eee; padding-top: 10px;">
-                ${post.comments.map(c => `<p><strong>${c.username}:</strong> ${c.text}</p>`).join('')}
-                <input type="text" class="comment-input" placeholder="Add a comment..." onkeydown="if(event.key==='Enter'){submitComment(${post.id}, this.value); this.value='';}">
-            </div>
-        `;
-        postList.appendChild(postCard);
+        feedPosts[post.id] = post;
+        postList.appendChild(renderPost(post));
     });
 }
 
-// Load posts from backend
-function loadPosts() {
-    fetch('/api/posts')
+// Re-render one post in place after a local change
+function refreshPost(postId) {
+    const card = document.querySelector(`#post-list [data-post-id="${postId}"]`);
+    if (card) card.replaceWith(renderPost(feedPosts[postId]));
+}
+
+// Prepend the next page of older comments to a post
+function loadEarlierComments(postId) {
+    const post = feedPosts[postId];
+    if (!post || !post.comments_cursor) return;
+    fetch(`/api/posts/${postId}/comments?cursor=${encodeURIComponent(post.comments_cursor)}`)
+        .then(res => {
+            if (!res.ok) throw new Error('Failed to load comments');
+            return res.json();
+        })
+        .then(page => {
+            // Pages come newest first; the card lists comments oldest first
+            post.comments = page.comments.reverse().concat(post.comments);
+            post.comments_cursor = page.next_cursor;
+            refreshPost(postId);
+        })
+        .catch(err => {
+            console.error('Error loading comments:', err);
+            alert('Failed to load comments. Please try again later.');
+        });
+}
+
+// Load posts from backend: the first page, or the next one when reset is false
+function loadPosts(reset = true) {
+    if (reset) {
+        feedGeneration++;
+        nextCursor = null;
+        feedLoading = false;
+    } else if (feedLoading || !nextCursor) {
+        return;
+    }
+    const generation = feedGeneration;
+    feedLoading = true;
+    const url = reset ? '/api/posts' : `/api/posts?cursor=${encodeURIComponent(nextCursor)}`;
+    fetch(url)
         .then(res => {
             if (!res.ok) throw new Error('Failed to load posts');
             return res.json();
         })
-        .then(posts => {
-            renderPosts(posts);
+        .then(page => {
+            // A newer reset started while this page was in flight
+            if (generation !== feedGeneration) return;
+            if (reset) {
+                document.getElementById('post-list').innerHTML = '';
+                Object.keys(feedPosts).forEach(id => delete feedPosts[id]);
+            }
+            renderPosts(page.posts);
+            nextCursor = page.next_cursor;
+            feedLoading = false;
+            observeFeedEnd();
         })
         .catch(err => {
+            if (generation === feedGeneration) feedLoading = false;
             console.error('Error loading posts:', err);
             alert('Failed to load posts. Please try again later.');
         });
 }
 
+// Infinite scroll: fetch the next page when the sentinel below the feed comes into view
+let feedObserver = null;
+function observeFeedEnd() {
+    const postList = document.getElementById('post-list');
+    if (!postList || !('IntersectionObserver' in window)) return;
+    let sentinel = document.getElementById('post-list-end');
+    if (!sentinel) {
+        sentinel = document.createElement('div');
+        sentinel.id = 'post-list-end';
+        postList.after(sentinel);
+    }
+    if (!feedObserver) {
+        feedObserver = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) loadPosts(false);
+        }, { rootMargin: '400px' });
+    }
+    // Re-observing fires a fresh callback, so a short page that leaves the sentinel visible keeps loading
+    feedObserver.unobserve(sentinel);
+    if (nextCursor) feedObserver.observe(sentinel);
+}
+
 // Submit a new post
 function submitPost(content) {
     fetch('/api/posts', {
@@ -99,7 +180,12 @@ function submitComment(postId, text) {
     })
     .then(data => {
         if (data.success) {
-            loadPosts();
+            const post = feedPosts[postId];
+            if (post) {
+                post.comments.push(data.comment);
+                post.comment_count += 1;
+                refreshPost(postId);
+            }
         } else {
             throw new Error(data.error || 'Failed to submit comment');
         }
@@ -112,27 +198,93 @@ function submitComment(postId, text) {
 
 // Like or unlike a post
 function likePost(postId) {
-    fetch(`/api/posts/${postId}/like`, {
+    const post = feedPosts[postId];
+    if (!post) return;
+    post.is_liked = !post.is_liked;
+    post.likes += post.is_liked ? 1 : -1;
+    refreshPost(postId);
+    queueReaction(postId, 'like', post.is_liked);
+}
+
+// Taps are applied to the card at once and sent in batches: only the final
+// state of each post within REACTION_FLUSH_MS reaches the server, in one request
+const REACTION_FLUSH_MS = 400;
+const pendingReactions = new Map();
+let reactionTimer = null;
+
+function queueReaction(postId, type, on) {
+    pendingReactions.set(`${type}:${postId}`, { post_id: postId, type, on });
+    clearTimeout(reactionTimer);
+    reactionTimer = setTimeout(flushReactions, REACTION_FLUSH_MS);
+}
+
+function flushReactions() {
+    const reactions = Array.from(pendingReactions.values());
+    pendingReactions.clear();
+    if (!reactions.length) return;
+    fetch('/api/reactions', {
         method: 'POST',
         headers: {
+            'Content-Type': 'application/json',
             'X-CSRFToken': csrfToken
-        }
+        },
+        body: JSON.stringify({ reactions })
     })
     .then(res => {
-        if (!res.ok) throw new Error('Failed to like/unlike post');
+        if (!res.ok) throw new Error('Failed to update reactions');
         return res.json();
     })
     .then(data => {
-        if (data.success) {
-            loadPosts();
-        } else {
-            throw new Error(data.error || 'Failed to like/unlike post');
-        }
+        // Newer taps still waiting will correct these counters when they flush
+        if (!pendingReactions.size) data.posts.forEach(applyCounts);
     })
     .catch(err => {
-        console.error('Error liking/unliking post:', err);
-        alert('Failed to update like. Please try again later.');
+        console.error('Error updating reactions:', err);
+        alert('Failed to update like or bookmark. Please try again later.');
+        loadPosts();
+    });
+}
+
+// Live updates: the server pushes new posts, counters and comments over Server-Sent Events.
+// The browser reconnects on its own and resumes from the last event id it saw.
+function connectFeedStream() {
+    if (!('EventSource' in window)) return;
+    const stream = new EventSource('/api/posts/stream');
+
+    stream.addEventListener('post', event => {
+        const post = JSON.parse(event.data);
+        const postList = document.getElementById('post-list');
+        if (!postList || feedPosts[post.id]) return;
+        feedPosts[post.id] = post;
+        postList.prepend(renderPost(post));
+    });
+
+    stream.addEventListener('counts', event => {
+        applyCounts(JSON.parse(event.data));
     });
+
+    stream.addEventListener('comment', event => {
+        const data = JSON.parse(event.data);
+        const post = feedPosts[data.post_id];
+        // Our own comments were already added when the POST returned
+        if (post && !post.comments.some(c => c.id === data.comment.id)) {
+            post.comments.push(data.comment);
+        }
+        applyCounts(data);
+    });
+
+    // The server could not replay everything we missed
+    stream.addEventListener('reset', () => loadPosts());
+}
+
+// Counters in events are absolute, so applying one twice is harmless
+function applyCounts(counts) {
+    const post = feedPosts[counts.post_id];
+    if (!post) return;
+    post.likes = counts.likes;
+    post.comment_count = counts.comment_count;
+    post.bookmarks = counts.bookmarks;
+    refreshPost(counts.post_id);
 }
 
 // Bind post button event
@@ -147,29 +299,15 @@ window.addEventListener('DOMContentLoaded', function() {
         };
     }
     loadPosts();
+    connectFeedStream();
 });
 
 // Bookmark or unbookmark a post
 function bookmarkPost(postId) {
-    fetch(`/api/posts/${postId}/bookmark`, {
-        method: 'POST',
-        headers: {
-            'X-CSRFToken': csrfToken
-        }
-    })
-    .then(res => {
-        if (!res.ok) throw new Error('Failed to bookmark/unbookmark post');
-        return res.json();
-    })
-    .then(data => {
-        if (data.success) {
-            loadPosts();
-        } else {
-            throw new Error(data.error || 'Failed to bookmark/unbookmark post');
-        }
-    })
-    .catch(err => {
-        console.error('Error bookmarking/unbookmarking post:', err);
-        alert('Failed to update bookmark. Please try again later.');
-    });
-}
\ No newline at end of file
+    const post = feedPosts[postId];
+    if (!post) return;
+    post.is_bookmarked = !post.is_bookmarked;
+    post.bookmarks += post.is_bookmarked ? 1 : -1;
+    refreshPost(postId);
+    queueReaction(postId, 'bookmark', post.is_bookmarked);
+}
@@ -1,32 +1,419 @@
-from flask import Blueprint, jsonify, request, session
+import base64
+
+from flask import Blueprint, Response, jsonify, request, session
 from models import db, Post, Comment, Like, Bookmark, User
 from datetime import datetime
+from sqlalchemy import Float, bindparam, delete, event, func, literal, or_, select, tuple_, union_all, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload
+from versions import bump, conditional_get, read_version
+from social.feed_cache import LRUCache
+from social.feed_events import feed_events
+from social import search, timeline, trending
 
 social_bp = Blueprint('social', __name__)
 
-@social_bp.route('/api/posts', methods=['GET'])
-def get_posts():
-    posts = Post.query.order_by(Post.created_at.desc()).all()
-    current_user_id = session.get('user_id')
-    
-    result = []
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 50
+
+# Newest comments embedded in each feed post
+COMMENT_PREVIEW_SIZE = 3
+
+# Reaction kinds: the table holding them and the Post counter they move
+REACTIONS = {'like': (Like, Post.like_count), 'bookmark': (Bookmark, Post.bookmark_count)}
+REACTION_BATCH_LIMIT = 200
+
+# Entry limits for the shared post fragments and the per-user like/bookmark overlays
+FRAGMENT_CACHE_SIZE = 5000
+OVERLAY_CACHE_SIZE = 10000
+
+fragments = LRUCache(FRAGMENT_CACHE_SIZE)
+overlays = LRUCache(OVERLAY_CACHE_SIZE)
+
+
+def bump_feed(*user_ids):
+    """``bump('feed')`` for a social write; once it commits the caches know it came from this process."""
+    version = bump('feed', *user_ids)['feed']
+    db.session.info.setdefault('feed_versions', []).append(version)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _feed_versions_committed(session):
+    for version in session.info.pop('feed_versions', ()):
+        fragments.note(version)
+        overlays.note(version)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _feed_versions_discarded(session):
+    session.info.pop('feed_versions', None)
+
+
+def encode_cursor(row):
+    """Opaque cursor pointing just past ``row`` (a post or comment) in (created_at, id) order."""
+    raw = f'{row.created_at.isoformat()}|{row.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id) from a cursor; raises ValueError if it is malformed."""
+    # binascii.Error and UnicodeDecodeError are both ValueErrors
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, row_id = raw.split('|')
+    return datetime.fromisoformat(created_at), int(row_id)
+
+
+def page_args(decode=decode_cursor):
+    """(limit, decoded cursor or None) from the query string; raises ValueError with the message to return."""
+    try:
+        limit = min(max(int(request.args.get('limit', FEED_PAGE_SIZE)), 1), FEED_MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError('limit must be a number')
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return limit, None
+    try:
+        return limit, decode(cursor)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+
+def keyset_page(query, columns, limit, cursor):
+    """Run ``query`` newest first on (created_at, id) ``columns`` from ``cursor``.
+
+    Returns (rows, next_cursor); one extra row tells whether there is a next page.
+    """
+    if cursor:
+        query = query.filter(tuple_(*columns) < tuple_(*cursor))
+    rows = query.order_by(*(column.desc() for column in columns)).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def comment_json(row):
+    return {
+        'id': row.id,
+        'username': row.username,
+        'text': row.content,
+        'timestamp': row.created_at.strftime('%Y-%m-%d %H:%M'),
+    }
+
+
+def load_comment_previews(post_ids):
+    """{post_id: newest COMMENT_PREVIEW_SIZE comment rows, oldest first} in one query."""
+    ranked = (
+        select(
+            Comment.id, Comment.post_id, Comment.user_id, Comment.content, Comment.created_at,
+            func.row_number().over(
+                partition_by=Comment.post_id,
+                order_by=(Comment.created_at.desc(), Comment.id.desc()),
+            ).label('position'),
+        )
+        .where(Comment.post_id.in_(post_ids))
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(ranked, User.username)
+        .join(User, User.id == ranked.c.user_id)
+        .where(ranked.c.position <= COMMENT_PREVIEW_SIZE)
+        .order_by(ranked.c.post_id, ranked.c.created_at, ranked.c.id)
+    )
+    previews = {}
+    for row in rows:
+        previews.setdefault(row.post_id, []).append(row)
+    return previews
+
+
+def load_fragments(post_ids):
+    """Viewer-independent feed JSON for the given posts, in two queries.
+
+    Only the newest comments are embedded; ``comments_cursor`` pages through
+    the older ones with ``GET /api/posts/<id>/comments``.
+    """
+    posts = Post.query.options(joinedload(Post.user)).filter(Post.id.in_(post_ids)).all()
+    previews = load_comment_previews(post_ids)
+    fragments = {}
     for post in posts:
-        post_data = {
+        comments = previews.get(post.id, [])
+        fragments[post.id] = {
             'id': post.id,
+            'user_id': post.user_id,
             'username': post.user.username,
             'content': post.content,
             'timestamp': post.created_at.strftime('%Y-%m-%d %H:%M'),
-            'likes': len(post.likes),
-            'comments': [{
-                'username': comment.user.username,
-                'text': comment.content
-            } for comment in post.comments],
-            'bookmarks': len(post.bookmarks),
-            'is_liked': any(like.user_id == current_user_id for like in post.likes),
-            'is_bookmarked': any(bookmark.user_id == current_user_id for bookmark in post.bookmarks)
+            'likes': post.like_count,
+            'comment_count': post.comment_count,
+            'comments': [comment_json(row) for row in comments],
+            'comments_cursor': encode_cursor(comments[0]) if post.comment_count > len(comments) else None,
+            'bookmarks': post.bookmark_count,
         }
-        result.append(post_data)
-    return jsonify(result)
+    return fragments
+
+
+def load_overlay(user_id):
+    """(liked post ids, bookmarked post ids) for one user, in one query."""
+    rows = db.session.execute(union_all(
+        select(Like.post_id, literal(True)).where(Like.user_id == user_id),
+        select(Bookmark.post_id, literal(False)).where(Bookmark.user_id == user_id),
+    ))
+    liked, bookmarked = set(), set()
+    for post_id, is_like in rows:
+        (liked if is_like else bookmarked).add(post_id)
+    return frozenset(liked), frozenset(bookmarked)
+
+
+def viewer_overlay(user_id):
+    if not user_id:
+        return frozenset(), frozenset()
+    cached, generation = overlays.get_many([user_id])
+    if user_id in cached:
+        return cached[user_id]
+    overlay = load_overlay(user_id)
+    overlays.put_many({user_id: overlay}, generation)
+    return overlay
+
+
+def render_posts(post_ids, user_id):
+    """Feed JSON for ``post_ids`` in order: cached fragments merged with the viewer's overlay."""
+    # Drops both caches if another process wrote to the feed since the last check
+    version = read_version('feed')
+    fragments.sync(version)
+    overlays.sync(version)
+    found, generation = fragments.get_many(post_ids)
+    missing = [post_id for post_id in post_ids if post_id not in found]
+    if missing:
+        loaded = load_fragments(missing)
+        fragments.put_many(loaded, generation)
+        found.update(loaded)
+    liked, bookmarked = viewer_overlay(user_id)
+    # A post deleted since its id was read is simply left out
+    return [
+        dict(found[post_id], is_liked=post_id in liked, is_bookmarked=post_id in bookmarked)
+        for post_id in post_ids if post_id in found
+    ]
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _tables_created(target, connection, **kw):
+    fragments.clear()
+    overlays.clear()
+
+
+def adjust_count(post_id, column, step):
+    """Add ``step`` to a post counter in SQL, so concurrent writers cannot lose updates.
+
+    Returns False if the post does not exist.
+    """
+    result = db.session.execute(
+        update(Post).where(Post.id == post_id).values({column: column + step}),
+        execution_options={'synchronize_session': False},
+    )
+    return result.rowcount > 0
+
+
+def post_counts(post_ids):
+    """{post_id: counters keyed like the feed JSON} for the given posts, in one query."""
+    if not post_ids:
+        return {}
+    rows = db.session.execute(
+        select(Post.id, Post.like_count, Post.comment_count, Post.bookmark_count)
+        .where(Post.id.in_(post_ids))
+    )
+    return {
+        post_id: {'post_id': post_id, 'likes': likes, 'comment_count': comments, 'bookmarks': bookmarks}
+        for post_id, likes, comments, bookmarks in rows
+    }
+
+
+def apply_reactions(user_id, reactions):
+    """Set or clear one user's likes and bookmarks; the caller commits.
+
+    ``reactions`` is [(kind, post_id, on)] and the last entry for a kind and
+    post wins. Rows are written with INSERT ... ON CONFLICT DO NOTHING and
+    plain DELETEs whose RETURNING says which rows really changed, so a
+    repeated request is a no-op and the counters only move for real changes.
+    Returns (ids of posts that changed, ids of posts that do not exist).
+    """
+    wanted = {}
+    for kind, post_id, on in reactions:
+        wanted[kind, post_id] = on
+    post_ids = {post_id for _, post_id in wanted}
+    known = set(db.session.scalars(select(Post.id).where(Post.id.in_(post_ids))))
+    now = datetime.utcnow()
+    deltas = {}
+    terms = {}   # post_id: ([terms added], [terms removed]) for the hot score
+    for kind, (model, counter) in REACTIONS.items():
+        table = model.__table__
+        add = [post_id for (k, post_id), on in wanted.items() if k == kind and on and post_id in known]
+        remove = [post_id for (k, post_id), on in wanted.items() if k == kind and not on and post_id in known]
+        changed = []
+        if add:
+            changed += [(post_id, 1, now) for post_id in db.session.scalars(
+                sqlite_insert(table)
+                .values([{'user_id': user_id, 'post_id': post_id, 'created_at': now} for post_id in add])
+                .on_conflict_do_nothing()
+                .returning(table.c.post_id)
+            )]
+        if remove:
+            # The removed row's created_at says which hot score term to take back
+            changed += [(post_id, -1, created_at or now) for post_id, created_at in db.session.execute(
+                delete(table)
+                .where(table.c.user_id == user_id, table.c.post_id.in_(remove))
+                .returning(table.c.post_id, table.c.created_at)
+            )]
+        for post_id, step, at in changed:
+            deltas.setdefault(post_id, {'like_count': 0, 'bookmark_count': 0})[counter.key] += step
+            added, removed = terms.setdefault(post_id, ([], []))
+            (removed if step < 0 else added).append(trending.term(kind, at))
+
+    if deltas:
+        posts = Post.__table__
+        db.session.execute(
+            update(posts).where(posts.c.id == bindparam('post')).values(
+                like_count=posts.c.like_count + bindparam('likes'),
+                bookmark_count=posts.c.bookmark_count + bindparam('bookmarks'),
+                hot_score=trending.scored(bindparam('added', type_=Float), bindparam('removed', type_=Float)),
+            ),
+            [{'post': post_id, 'likes': d['like_count'], 'bookmarks': d['bookmark_count'],
+              'added': trending.combine(terms[post_id][0]), 'removed': trending.combine(terms[post_id][1])}
+             for post_id, d in deltas.items()],
+        )
+        bump_feed(user_id)
+    return set(deltas), post_ids - known
+
+
+def reactions_committed(user_id, post_ids):
+    """Drop cached state and publish new counters once reactions to ``post_ids`` have committed."""
+    if not post_ids:
+        return
+    fragments.invalidate(*post_ids)
+    overlays.invalidate(user_id)
+    for counts in post_counts(post_ids).values():
+        feed_events.publish('counts', counts)
+
+
+def reconcile_post_counts():
+    """Recompute every post's counters and hot score from the likes, comments and bookmarks tables.
+
+    Returns the number of posts whose counters were wrong.
+    """
+    def actual(model):
+        return select(func.count()).where(model.post_id == Post.id).scalar_subquery()
+
+    counts = {
+        Post.like_count: actual(Like),
+        Post.comment_count: actual(Comment),
+        Post.bookmark_count: actual(Bookmark),
+    }
+    result = db.session.execute(
+        update(Post)
+        .where(or_(*(column != value for column, value in counts.items())))
+        .values(counts),
+        execution_options={'synchronize_session': False},
+    )
+    rescored = trending.rebuild_hot_scores()
+    if result.rowcount or rescored:
+        bump_feed()
+    db.session.commit()
+    fragments.clear()
+    return result.rowcount
+
+
+@social_bp.cli.command('reconcile-counts')
+def reconcile_counts_command():
+    """Recompute post like/comment/bookmark counters and hot scores from the source tables."""
+    fixed = reconcile_post_counts()
+    print(f'Fixed counters on {fixed} posts.')
+
+@social_bp.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Refill the full-text search index from posts and comments."""
+    rows = search.rebuild_search_index(db.session.connection())
+    db.session.commit()
+    print(f'Indexed {rows} posts and comments.')
+
+@social_bp.cli.command('backfill-timelines')
+def backfill_timelines_command():
+    """Recompute follower counts and refill every home timeline from the follows."""
+    entries = timeline.rebuild_timelines()
+    bump_feed()
+    db.session.commit()
+    print(f'Wrote {entries} timeline entries.')
+
+@social_bp.route('/api/posts', methods=['GET'])
+@conditional_get('feed')
+def get_posts():
+    try:
+        limit, cursor = page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Only the index is read here; the posts themselves come from the fragment cache
+    page, next_cursor = keyset_page(
+        db.session.query(Post.id, Post.created_at), (Post.created_at, Post.id), limit, cursor)
+    posts = render_posts([row.id for row in page], session.get('user_id'))
+    return jsonify({'posts': posts, 'next_cursor': next_cursor})
+
+@social_bp.route('/api/posts/<int:post_id>/comments', methods=['GET'])
+@conditional_get('feed')
+def get_comments(post_id):
+    """Comments on a post, newest first, paged like the feed."""
+    try:
+        limit, cursor = page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if db.session.get(Post, post_id) is None:
+        return jsonify({'error': 'Post not found'}), 404
+    query = (
+        db.session.query(Comment.id, Comment.content, Comment.created_at, User.username)
+        .join(User, User.id == Comment.user_id)
+        .filter(Comment.post_id == post_id)
+    )
+    rows, next_cursor = keyset_page(query, (Comment.created_at, Comment.id), limit, cursor)
+    return jsonify({'comments': [comment_json(row) for row in rows], 'next_cursor': next_cursor})
+
+@social_bp.route('/api/posts/search')
+@conditional_get('feed')
+def search_posts():
+    """Posts whose text or comments match ``q``, best BM25 match first, with a highlighted snippet."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    try:
+        limit, cursor = page_args(search.decode_cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    hits, next_cursor = search.search_posts(query, limit, cursor)
+    posts = {post['id']: post for post in render_posts([post_id for post_id, _, _ in hits], session.get('user_id'))}
+    results = [
+        dict(posts[post_id], matched=matched, snippet=snippet)
+        for post_id, matched, snippet in hits if post_id in posts
+    ]
+    return jsonify({'results': results, 'next_cursor': next_cursor})
+
+@social_bp.route('/api/posts/trending')
+@conditional_get('feed')
+def get_trending_posts():
+    """The ``limit`` posts with the highest hot score; see social/trending.py."""
+    try:
+        limit, _ = page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Reads the top of ix_posts_hot_score; scores move with every reaction, so there is no cursor
+    post_ids = db.session.scalars(
+        select(Post.id).order_by(Post.hot_score.desc(), Post.id.desc()).limit(limit)
+    ).all()
+    return jsonify({'posts': render_posts(post_ids, session.get('user_id'))})
+
+@social_bp.route('/api/posts/stream')
+def stream_feed():
+    """Live feed changes as Server-Sent Events; see social/feed_events.py."""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return Response(
+        feed_events.stream(last_event_id),
+        mimetype='text/event-stream',
+        # Proxies must not buffer or cache the stream
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
 @social_bp.route('/api/posts', methods=['POST'])
 def create_post():
@@ -39,9 +426,15 @@ def create_post():
     if not content:
         return jsonify({'error': 'Content is required'}), 400
     
-    post = Post(user_id=user_id, content=content)
+    now = datetime.utcnow()
+    post = Post(user_id=user_id, content=content, created_at=now, hot_score=trending.term('post', now))
     db.session.add(post)
+    db.session.flush()
+    timeline.fan_out(post)
+    bump_feed(user_id)
     db.session.commit()
+    # Nobody has liked or bookmarked it yet, so the anonymous rendering suits every viewer
+    feed_events.publish('post', render_posts([post.id], None)[0])
     return jsonify({'success': True})
 
 @social_bp.route('/api/posts/<int:post_id>/comments', methods=['POST'])
@@ -55,63 +448,160 @@ def add_comment(post_id):
     if not text:
         return jsonify({'error': 'Comment text is required'}), 400
     
-    comment = Comment(user_id=user_id, post_id=post_id, content=text)
+    if not adjust_count(post_id, Post.comment_count, 1):
+        db.session.rollback()
+        return jsonify({'error': 'Post not found'}), 404
+    now = datetime.utcnow()
+    trending.record(post_id, 'comment', now)
+    comment = Comment(user_id=user_id, post_id=post_id, content=text, created_at=now)
     db.session.add(comment)
+    bump_feed(user_id)
     db.session.commit()
-    return jsonify({'success': True})
+    fragments.invalidate(post_id)
+    comment_data = {
+        'id': comment.id,
+        'username': comment.user.username,
+        'text': comment.content,
+        'timestamp': comment.created_at.strftime('%Y-%m-%d %H:%M'),
+    }
+    feed_events.publish('comment', dict(post_counts([post_id])[post_id], comment=comment_data))
+    return jsonify({'success': True, 'comment': comment_data})
 
-@social_bp.route('/api/posts/<int:post_id>/like', methods=['POST'])
-def toggle_like(post_id):
+def set_reaction(kind, post_id, on):
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({'error': 'Unauthorized'}), 401
-    
-    like = Like.query.filter_by(user_id=user_id, post_id=post_id).first()
-    if like:
-        db.session.delete(like)
-    else:
-        like = Like(user_id=user_id, post_id=post_id)
-        db.session.add(like)
+    changed, missing = apply_reactions(user_id, [(kind, post_id, on)])
+    if missing:
+        db.session.rollback()
+        return jsonify({'error': 'Post not found'}), 404
+    db.session.commit()
+    reactions_committed(user_id, changed)
+    return jsonify(dict(post_counts([post_id])[post_id], success=True, changed=bool(changed), on=on))
+
+def toggle_reaction(kind, post_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+    # Clear first: if nothing was deleted the reaction was off, so set it
+    changed, missing = apply_reactions(user_id, [(kind, post_id, False)])
+    if missing:
+        db.session.rollback()
+        return jsonify({'error': 'Post not found'}), 404
+    if not changed:
+        changed, _ = apply_reactions(user_id, [(kind, post_id, True)])
     db.session.commit()
+    reactions_committed(user_id, changed)
     return jsonify({'success': True})
 
+@social_bp.route('/api/posts/<int:post_id>/like', methods=['PUT', 'DELETE'])
+def like_post(post_id):
+    """PUT likes the post and DELETE unlikes it; repeating either changes nothing."""
+    return set_reaction('like', post_id, request.method == 'PUT')
+
+@social_bp.route('/api/posts/<int:post_id>/bookmark', methods=['PUT', 'DELETE'])
+def bookmark_post(post_id):
+    """PUT bookmarks the post and DELETE removes the bookmark; repeating either changes nothing."""
+    return set_reaction('bookmark', post_id, request.method == 'PUT')
+
+@social_bp.route('/api/posts/<int:post_id>/like', methods=['POST'])
+def toggle_like(post_id):
+    return toggle_reaction('like', post_id)
+
 @social_bp.route('/api/posts/<int:post_id>/bookmark', methods=['POST'])
 def toggle_bookmark(post_id):
+    return toggle_reaction('bookmark', post_id)
+
+@social_bp.route('/api/reactions', methods=['POST'])
+def bulk_reactions():
+    """Apply a burst of likes and bookmarks in one transaction.
+
+    Body: {"reactions": [{"post_id", "type": "like" | "bookmark", "on": bool}]}.
+    The last entry for a post and type wins. Returns the counters of every
+    existing post named, and the ids of those that do not exist.
+    """
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({'error': 'Unauthorized'}), 401
-    
-    bookmark = Bookmark.query.filter_by(user_id=user_id, post_id=post_id).first()
-    if bookmark:
-        db.session.delete(bookmark)
-    else:
-        bookmark = Bookmark(user_id=user_id, post_id=post_id)
-        db.session.add(bookmark)
+    data = request.get_json(silent=True) or {}
+    items = data.get('reactions')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'reactions must be a non-empty list'}), 400
+    if len(items) > REACTION_BATCH_LIMIT:
+        return jsonify({'error': f'At most {REACTION_BATCH_LIMIT} reactions per request'}), 400
+    reactions = []
+    for i, item in enumerate(items):
+        if (not isinstance(item, dict) or item.get('type') not in REACTIONS
+                or type(item.get('post_id')) is not int or not isinstance(item.get('on'), bool)):
+            return jsonify({'error': f'reactions[{i}] needs an integer post_id, a type of like or bookmark and a boolean on'}), 400
+        reactions.append((item['type'], item['post_id'], item['on']))
+
+    changed, missing = apply_reactions(user_id, reactions)
     db.session.commit()
-    return jsonify({'success': True})
+    reactions_committed(user_id, changed)
+    known = {post_id for _, post_id, _ in reactions} - missing
+    return jsonify({
+        'success': True,
+        'posts': list(post_counts(known).values()),
+        'not_found': sorted(missing),
+    })
 
 @social_bp.route('/api/posts/bookmarked')
+@conditional_get('feed')
 def get_bookmarked_posts():
+    """The user's bookmarked posts, most recently bookmarked first, paged like the feed."""
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({'error': 'Unauthorized'}), 401
-    bookmarks = Bookmark.query.filter_by(user_id=user_id).all()
-    posts = [bm.post for bm in bookmarks]
-    result = []
-    for post in posts:
-        post_data = {
-            'id': post.id,
-            'username': post.user.username,
-            'content': post.content,
-            'timestamp': post.created_at.strftime('%Y-%m-%d %H:%M'),
-            'likes': len(post.likes),
-            'comments': [{
-                'username': comment.user.username,
-                'text': comment.content
-            } for comment in post.comments],
-            'bookmarks': len(post.bookmarks),
-            'is_liked': any(like.user_id == user_id for like in post.likes),
-            'is_bookmarked': True
-        }
-        result.append(post_data)
-    return jsonify(result)
\ No newline at end of file
+    try:
+        limit, cursor = page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Walks ix_bookmarks_user_id_created_at; the join skips bookmarks of deleted posts
+    query = (
+        db.session.query(Bookmark.post_id.label('id'), Bookmark.created_at)
+        .join(Post, Post.id == Bookmark.post_id)
+        .filter(Bookmark.user_id == user_id)
+    )
+    page, next_cursor = keyset_page(query, (Bookmark.created_at, Bookmark.post_id), limit, cursor)
+    posts = render_posts([row.id for row in page], user_id)
+    return jsonify({'posts': posts, 'next_cursor': next_cursor})
+
+@social_bp.route('/api/timeline')
+@conditional_get('feed')
+def get_home_timeline():
+    """Posts by the user and the people they follow, newest first, paged like the feed."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        limit, cursor = page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    rows = timeline.home_timeline(user_id, limit + 1, cursor)
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    posts = render_posts([row.id for row in rows[:limit]], user_id)
+    return jsonify({'posts': posts, 'next_cursor': next_cursor})
+
+@social_bp.route('/api/users/<int:user_id>/follow', methods=['PUT', 'DELETE'])
+def follow_user(user_id):
+    """PUT follows the user and DELETE unfollows them; repeating either changes nothing."""
+    follower_id = session.get('user_id')
+    if not follower_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if user_id == follower_id:
+        return jsonify({'error': 'You cannot follow yourself'}), 400
+    followee = db.session.get(User, user_id)
+    if followee is None:
+        return jsonify({'error': 'User not found'}), 404
+    following = request.method == 'PUT'
+    changed = timeline.set_follow(follower_id, user_id, following)
+    if changed:
+        bump_feed(follower_id, user_id)
+    db.session.commit()
+    return jsonify({
+        'success': True,
+        'changed': changed,
+        'following': following,
+        'follower_count': followee.follower_count,
+    })
@@ -0,0 +1,163 @@
+"""Home timelines: each user's own posts and those of the users they follow.
+
+Timelines are precomputed. When a post is created ``fan_out`` copies it into
+``timeline_entries`` for the author and every follower with one
+INSERT ... SELECT in the post's transaction, and a timeline page is a walk
+of ix_timeline_entries_user_id_created_at. Following someone copies their
+latest ``TIMELINE_BACKFILL_POSTS`` posts into the follower's timeline, and
+unfollowing removes all of their posts from it.
+
+An author with more than ``FANOUT_FOLLOWER_LIMIT`` followers would write
+that many rows per post, so their next post switches them to fan-out on read
+(``User.fanout_on_read``): their posts are only added to their own timeline
+and are merged into their followers' pages when those are read, from
+ix_posts_user_id_created_at. The flag stays set if they lose followers, so
+none of their posts drop out of timelines. ``flask social backfill-timelines``
+recomputes follower counts and flags and refills every timeline.
+"""
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, literal, select, tuple_, union, union_all, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Follow, Post, TimelineEntry, User
+
+# Followers above which an author's posts are merged on read instead of written to each timeline
+FANOUT_FOLLOWER_LIMIT = 1000
+# Latest posts per author copied into a timeline on follow and by the backfill
+TIMELINE_BACKFILL_POSTS = 50
+
+_ENTRY_COLUMNS = ['user_id', 'post_id', 'created_at']
+
+
+def fan_out(post):
+    """Add a flushed, new post to its author's and their followers' timelines; the caller commits.
+
+    Returns the number of timeline entries written.
+    """
+    entries = TimelineEntry.__table__
+    author = db.session.execute(
+        select(User.follower_count, User.fanout_on_read).where(User.id == post.user_id)
+    ).one()
+    db.session.execute(insert(entries).values(user_id=post.user_id, post_id=post.id, created_at=post.created_at))
+    if author.fanout_on_read or author.follower_count > FANOUT_FOLLOWER_LIMIT:
+        if not author.fanout_on_read:
+            db.session.execute(
+                update(User).where(User.id == post.user_id).values(fanout_on_read=True),
+                execution_options={'synchronize_session': False},
+            )
+        return 1
+    result = db.session.execute(insert(entries).from_select(
+        _ENTRY_COLUMNS,
+        select(Follow.follower_id, literal(post.id), literal(post.created_at, entries.c.created_at.type))
+        .where(Follow.followee_id == post.user_id),
+    ))
+    return 1 + result.rowcount
+
+
+def set_follow(follower_id, followee_id, on):
+    """Follow or unfollow a user and update the follower's timeline; the caller commits.
+
+    Like reactions, a follow is written with INSERT ... ON CONFLICT DO NOTHING
+    and removed with a DELETE whose RETURNING says whether anything changed, so
+    repeating a request is a no-op. Returns True if the follow changed.
+    """
+    follows = Follow.__table__
+    if on:
+        statement = (
+            sqlite_insert(follows)
+            .values(follower_id=follower_id, followee_id=followee_id, created_at=datetime.utcnow())
+            .on_conflict_do_nothing()
+        )
+    else:
+        statement = delete(follows).where(follows.c.follower_id == follower_id, follows.c.followee_id == followee_id)
+    if db.session.execute(statement.returning(follows.c.followee_id)).first() is None:
+        return False
+
+    db.session.execute(
+        update(User).where(User.id == followee_id)
+        .values(follower_count=User.follower_count + (1 if on else -1)),
+        execution_options={'synchronize_session': False},
+    )
+    if not on:
+        db.session.execute(delete(TimelineEntry).where(
+            TimelineEntry.user_id == follower_id,
+            TimelineEntry.post_id.in_(select(Post.id).where(Post.user_id == followee_id)),
+        ))
+    elif not db.session.scalar(select(User.fanout_on_read).where(User.id == followee_id)):
+        latest = (
+            select(literal(follower_id), Post.id, Post.created_at)
+            .where(Post.user_id == followee_id)
+            .order_by(Post.created_at.desc(), Post.id.desc())
+            .limit(TIMELINE_BACKFILL_POSTS)
+        )
+        db.session.execute(insert(TimelineEntry).prefix_with('OR IGNORE').from_select(_ENTRY_COLUMNS, latest))
+    return True
+
+
+def _newest(query, columns, limit, cursor):
+    if cursor:
+        query = query.where(tuple_(*columns) < tuple_(*cursor))
+    return query.order_by(*(column.desc() for column in columns)).limit(limit)
+
+
+def home_timeline(user_id, limit, cursor=None):
+    """Up to ``limit`` (id, created_at) rows of a home timeline, newest first, after ``cursor``.
+
+    The precomputed entries are merged with the posts of followed authors who
+    are fanned out on read; each source is read newest first from its index
+    and stops after ``limit`` rows. Costs two queries.
+    """
+    pulled = db.session.scalars(
+        select(Follow.followee_id)
+        .join(User, User.id == Follow.followee_id)
+        .where(Follow.follower_id == user_id, User.fanout_on_read)
+    ).all()
+    entries = _newest(
+        select(TimelineEntry.post_id.label('id'), TimelineEntry.created_at).where(TimelineEntry.user_id == user_id),
+        (TimelineEntry.created_at, TimelineEntry.post_id), limit, cursor)
+    if not pulled:
+        return db.session.execute(entries).all()
+
+    sources = [entries] + [
+        _newest(select(Post.id, Post.created_at).where(Post.user_id == author_id),
+                (Post.created_at, Post.id), limit, cursor)
+        for author_id in pulled
+    ]
+    # UNION drops posts that are in both, written before their author switched to fan-out on read
+    merged = union(*(select(source.subquery()) for source in sources)).subquery()
+    return db.session.execute(
+        select(merged).order_by(merged.c.created_at.desc(), merged.c.id.desc()).limit(limit)
+    ).all()
+
+
+def rebuild_timelines():
+    """Recompute follower counts and fan-out modes, then refill every timeline; the caller commits.
+
+    Each timeline gets the latest ``TIMELINE_BACKFILL_POSTS`` posts of its
+    owner and of every followed author who is fanned out on write. Returns
+    the number of entries written.
+    """
+    followers = select(func.count()).where(Follow.followee_id == User.id).scalar_subquery()
+    db.session.execute(update(User).values(follower_count=followers),
+                       execution_options={'synchronize_session': False})
+    db.session.execute(update(User).values(fanout_on_read=User.follower_count > FANOUT_FOLLOWER_LIMIT),
+                       execution_options={'synchronize_session': False})
+    db.session.execute(delete(TimelineEntry))
+
+    ranked = select(
+        Post.id, Post.user_id, Post.created_at,
+        func.row_number().over(
+            partition_by=Post.user_id, order_by=(Post.created_at.desc(), Post.id.desc()),
+        ).label('position'),
+    ).subquery()
+    latest = select(ranked).where(ranked.c.position <= TIMELINE_BACKFILL_POSTS).subquery()
+    own = select(latest.c.user_id, latest.c.id, latest.c.created_at)
+    followed = (
+        select(Follow.follower_id, latest.c.id, latest.c.created_at)
+        .join(latest, latest.c.user_id == Follow.followee_id)
+        .join(User, User.id == Follow.followee_id)
+        .where(~User.fanout_on_read)
+    )
+    result = db.session.execute(insert(TimelineEntry).from_select(_ENTRY_COLUMNS, union_all(own, followed)))
+    return result.rowcount
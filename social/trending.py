@@ -0,0 +1,118 @@
+"""Trending posts: a time-decayed hot score stored on each post.
+
+A post's score sums one term per event, the post itself and every like,
+comment and bookmark on it: ``WEIGHTS[kind] * 2 ** ((t - EPOCH) / HALF_LIFE)``
+where ``t`` is when the event happened. Removing a like or bookmark subtracts
+the term it added. An event counts half as much as one a ``HALF_LIFE``
+later, and since every stored score would decay by the same factor, leaving
+them undecayed ranks posts exactly as decaying all of them would: writes
+only add their own term and nothing is ever rescored. Scores are kept as
+natural logs so they grow by about 1.4 a day instead of overflowing.
+
+The terms are added in SQL, like the counters, through the ``hot_add`` and
+``hot_subtract`` functions registered on every SQLite connection.
+``GET /api/posts/trending`` reads the top posts from ix_posts_hot_score, and
+``flask social reconcile-counts`` recomputes every score from the source
+tables.
+"""
+import math
+import sqlite3
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, event, func, select, update
+from sqlalchemy.engine import Engine
+
+from models import db, Bookmark, Comment, Like, Post
+
+HALF_LIFE = timedelta(hours=12)
+# Any fixed instant works; it only keeps the stored logs small
+EPOCH = datetime(2024, 1, 1)
+WEIGHTS = {'post': 1.0, 'like': 1.0, 'comment': 2.0, 'bookmark': 2.0}
+
+
+def term(kind, at):
+    """The natural log of what one ``kind`` event at ``at`` adds to a post's score."""
+    return math.log(WEIGHTS[kind]) + (at - EPOCH) / HALF_LIFE * math.log(2)
+
+
+def hot_add(score, value):
+    """log(exp(score) + exp(value)), computed without overflow; None stands for no term."""
+    if value is None:
+        return score
+    if score is None:
+        return value
+    high, low = max(score, value), min(score, value)
+    return high + math.log1p(math.exp(low - high))
+
+
+def hot_subtract(score, value):
+    """log(exp(score) - exp(value)), for a term that is part of ``score``."""
+    if value is None or score is None:
+        return score
+    # When the rest of the score is under 2 ** -52 of the term (it is ~26 days
+    # older), float cannot resolve it; it is then taken to be that small
+    ratio = min(math.exp(value - score), 1 - 2 ** -52)
+    return score + math.log1p(-ratio)
+
+
+def combine(terms):
+    """One term equal to the sum of ``terms``, or None for none."""
+    total = None
+    for value in terms:
+        total = hot_add(total, value)
+    return total
+
+
+@event.listens_for(Engine, 'connect')
+def _register_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('hot_add', 2, hot_add, deterministic=True)
+        dbapi_connection.create_function('hot_subtract', 2, hot_subtract, deterministic=True)
+
+
+def scored(added=None, removed=None):
+    """The SQL for Post.hot_score after adding and removing the given terms."""
+    score = Post.hot_score
+    if removed is not None:
+        score = func.hot_subtract(score, removed)
+    if added is not None:
+        score = func.hot_add(score, added)
+    return score
+
+
+def record(post_id, kind, at):
+    """Add one event's term to a post's score; the caller commits."""
+    db.session.execute(
+        update(Post).where(Post.id == post_id).values(hot_score=scored(added=term(kind, at))),
+        execution_options={'synchronize_session': False},
+    )
+
+
+def rebuild_hot_scores():
+    """Recompute every post's score from its likes, comments and bookmarks; the caller commits.
+
+    Returns the number of posts whose score changed.
+    """
+    scores = {
+        post_id: term('post', created_at)
+        for post_id, created_at in db.session.execute(select(Post.id, Post.created_at))
+    }
+    for kind, model in (('like', Like), ('comment', Comment), ('bookmark', Bookmark)):
+        rows = db.session.execute(
+            select(model.post_id, func.coalesce(model.created_at, Post.created_at, type_=Post.created_at.type))
+            .join(Post, Post.id == model.post_id)
+        )
+        for post_id, at in rows:
+            scores[post_id] = hot_add(scores[post_id], term(kind, at))
+    changed = [
+        {'post': post_id, 'score': scores[post_id]}
+        for post_id, current in db.session.execute(select(Post.id, Post.hot_score))
+        if current is None or not math.isclose(current, scores[post_id], abs_tol=1e-9)
+    ]
+    if changed:
+        posts = Post.__table__
+        db.session.execute(
+            update(posts).where(posts.c.id == bindparam('post')).values(hot_score=bindparam('score')),
+            changed,
+        )
+    return len(changed)
@@ -0,0 +1,139 @@
+"""Per-user workout streaks.
+
+``user_streaks`` stores each user's current streak (the run of consecutive
+active days ending at ``last_active_date``), longest streak and last active
+date. The row is updated inside the same flush as the workout records: a new
+day right after ``last_active_date`` extends the streak, a later day starts a
+new one, and anything else (backfilled days, deleted records) recomputes the
+user's streaks from the distinct dates in ``workout_daily_rollups``.
+``repair_streaks`` recomputes every user the same way.
+"""
+from datetime import date, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, UserStreak, WorkoutDailyRollup
+from rollup import rollup_flushed
+
+
+def streaks_from_dates(dates):
+    """Return (current, longest, last_active) for an ascending list of distinct dates."""
+    if not dates:
+        return 0, 0, None
+    current = longest = 1
+    for prev, day in zip(dates, dates[1:]):
+        current = current + 1 if day - prev == timedelta(days=1) else 1
+        longest = max(longest, current)
+    return current, longest, dates[-1]
+
+
+def _save(connection, streaks):
+    """Write {user_id: (current, longest, last_active)}; users without activity lose their row."""
+    table = UserStreak.__table__
+    idle = [user_id for user_id, (_, _, last_active) in streaks.items() if last_active is None]
+    if idle:
+        connection.execute(table.delete().where(table.c.user_id.in_(idle)))
+    rows = [
+        {'user_id': user_id, 'current_streak': current, 'longest_streak': longest, 'last_active_date': last_active}
+        for user_id, (current, longest, last_active) in streaks.items()
+        if last_active is not None
+    ]
+    if not rows:
+        return
+    stmt = insert(table)
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id],
+        set_={
+            'current_streak': stmt.excluded.current_streak,
+            'longest_streak': stmt.excluded.longest_streak,
+            'last_active_date': stmt.excluded.last_active_date,
+        },
+    ), rows)
+
+
+def repair_user_streaks(connection, user_ids):
+    """Recompute the given users' streaks from the distinct dates in the rollup."""
+    rollup = WorkoutDailyRollup.__table__
+    user_ids = list(user_ids)
+    by_user = {user_id: [] for user_id in user_ids}
+    # Chunked to stay under SQLite's bound parameter limit
+    for i in range(0, len(user_ids), 500):
+        rows = connection.execute(
+            select(rollup.c.user_id, rollup.c.date)
+            .where(rollup.c.user_id.in_(user_ids[i:i + 500]))
+            .group_by(rollup.c.user_id, rollup.c.date)
+            .order_by(rollup.c.user_id, rollup.c.date)
+        )
+        for user_id, day in rows:
+            by_user[user_id].append(day)
+    _save(connection, {user_id: streaks_from_dates(dates) for user_id, dates in by_user.items()})
+
+
+@rollup_flushed.connect
+def _update_streaks(sender, connection, deltas):
+    added, repair = {}, set()
+    for (user_id, day, _category_id), (_minutes, _calories, _difficulty, count) in deltas.items():
+        if count > 0:
+            added.setdefault(user_id, set()).add(day)
+        elif count < 0:
+            repair.add(user_id)
+
+    table = UserStreak.__table__
+    extended = {}
+    for user_id, days in added.items():
+        if user_id in repair:
+            continue
+        row = connection.execute(select(table).where(table.c.user_id == user_id)).first()
+        if row is None or min(days) < row.last_active_date:
+            repair.add(user_id)
+            continue
+        current, longest, last_active = row.current_streak, row.longest_streak, row.last_active_date
+        for day in sorted(days):
+            if day == last_active:
+                continue
+            current = current + 1 if day - last_active == timedelta(days=1) else 1
+            longest = max(longest, current)
+            last_active = day
+        extended[user_id] = (current, longest, last_active)
+    _save(connection, extended)
+
+    if repair:
+        repair_user_streaks(connection, repair)
+
+
+def repair_streaks():
+    """Recompute every user's streaks from the rollup. Returns the number of users."""
+    rollup = WorkoutDailyRollup.__table__
+    rows = db.session.execute(
+        select(rollup.c.user_id, rollup.c.date)
+        .group_by(rollup.c.user_id, rollup.c.date)
+        .order_by(rollup.c.user_id, rollup.c.date)
+    ).all()
+    by_user = {}
+    for user_id, day in rows:
+        by_user.setdefault(user_id, []).append(day)
+
+    values = []
+    for user_id, dates in by_user.items():
+        current, longest, last_active = streaks_from_dates(dates)
+        values.append({
+            'user_id': user_id,
+            'current_streak': current,
+            'longest_streak': longest,
+            'last_active_date': last_active,
+        })
+    db.session.execute(UserStreak.__table__.delete())
+    if values:
+        db.session.execute(UserStreak.__table__.insert(), values)
+    db.session.commit()
+    return len(by_user)
+
+
+def current_streak(user_id, today=None):
+    """Return (current, longest) where current is 0 unless the user was active today."""
+    row = db.session.get(UserStreak, user_id)
+    if row is None:
+        return 0, 0
+    current = row.current_streak if row.last_active_date == (today or date.today()) else 0
+    return current, row.longest_streak
@@ -0,0 +1,15 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from app import db
+
+@contextmanager
+def count_queries():
+    """Collect the SQL statements executed inside the block."""
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
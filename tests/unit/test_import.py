@@ -0,0 +1,142 @@
+import io
+import os
+import unittest
+from app import app, db
+from models import User, UserStreak, WorkoutPlan, WorkoutRecord, WorkoutDailyRollup, SportsCategory
+from datetime import datetime, date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class TestImport(unittest.TestCase):
+    def setUp(self):
+        app.config.update({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'WTF_CSRF_ENABLED': False,
+            'SECRET_KEY': 'test-key'
+        })
+        self.client = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.running = SportsCategory(name='Running', met_value=9.8)
+        self.cycling = SportsCategory(name='Cycling', met_value=7.5)
+        self.swimming = SportsCategory(name='Swimming', met_value=8.0)
+        db.session.add_all([self.running, self.cycling, self.swimming])
+        timestamp = datetime.now().timestamp()
+        self.user = User(username=f'importer_{timestamp}', email=f'importer_{timestamp}@example.com',
+                         password_hash='hash')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def login(self):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.user.id
+
+    def upload(self, kind, filename, content):
+        return self.client.post(f'/api/import/{kind}', data={'file': (io.BytesIO(content), filename)},
+                                content_type='multipart/form-data')
+
+    def test_csv_records_import(self):
+        """Valid rows are imported into records, rollup and streaks; bad rows are reported"""
+        today, yesterday = date.today(), date.today() - timedelta(days=1)
+        content = (
+            'date,category,duration_min,difficulty,calories_burn\n'
+            f'{yesterday},running,30,3,300\n'
+            f'{today},Cycling,45.0,,250.5\n'
+            f'{today},Cycling,15,2,\n'
+            f'{today},Rowing,20,2,100\n'
+            f'{today},Running,-5,2,100\n'
+            'not-a-date,Running,20,2,100\n'
+            ',,,,\n'
+        ).encode()
+        self.login()
+        result = self.upload('records', 'history.csv', content).json
+
+        self.assertEqual((result['imported'], result['failed']), (3, 3))
+        self.assertEqual([e['row'] for e in result['errors']], [5, 6, 7])
+        self.assertIn('Rowing', result['errors'][0]['error'])
+        self.assertEqual(WorkoutRecord.query.filter_by(user_id=self.user.id).count(), 3)
+
+        cycling = db.session.get(WorkoutDailyRollup, (self.user.id, today, self.cycling.id))
+        self.assertEqual((cycling.total_min, cycling.total_calories, cycling.difficulty_sum, cycling.record_count),
+                         (60, 250.5, 3, 2))
+        streak = db.session.get(UserStreak, self.user.id)
+        self.assertEqual((streak.current_streak, streak.last_active_date), (2, today))
+
+        metrics = self.client.get('/api/record/metrics').json
+        self.assertEqual(metrics['total_hours'], 1.5)
+
+    def test_non_finite_numbers_are_row_errors(self):
+        """inf and NaN cells fail their own row without aborting the import or its batch"""
+        today = date.today()
+        content = (
+            'date,category,duration_min,calories_burn\n'
+            f'{today},Running,30,300\n'
+            f'{today},Running,inf,300\n'
+            f'{today},Running,1e400,300\n'
+            f'{today},Running,20,nan\n'
+            f'{today},Cycling,40,200\n'
+        ).encode()
+        self.login()
+        result = self.upload('records', 'history.csv', content).json
+
+        self.assertEqual((result['imported'], result['failed']), (2, 3))
+        self.assertEqual([e['row'] for e in result['errors']], [3, 4, 5])
+        self.assertIn('finite', result['errors'][2]['error'])
+        self.assertEqual(db.session.query(db.func.sum(WorkoutDailyRollup.total_calories)).scalar(), 500)
+
+    def test_csv_plans_round_trip(self):
+        """Plans accept the API's free-text activities and store offset times as naive UTC"""
+        self.login()
+        self.client.post('/api/my_plan', json={
+            'activity': 'Stretching', 'start_time': '2025-03-01T07:00', 'end_time': '2025-03-01T07:30'})
+        exported = self.client.get('/api/my_plan').json
+        content = 'activity,start_time,end_time\n' + ''.join(
+            f"{p['activity']},{p['start_time']},{p['end_time']}\n" for p in exported
+        ) + 'Running,2025-03-02T09:00+02:00,2025-03-02T10:00+02:00\n,2025-03-02T09:00,2025-03-02T10:00\n'
+        result = self.upload('plans', 'plans.csv', content.encode()).json
+
+        self.assertEqual((result['imported'], result['failed']), (2, 1))
+        plans = WorkoutPlan.query.filter_by(user_id=self.user.id).order_by(WorkoutPlan.start_time).all()
+        self.assertEqual([(p.activity, p.start_time, p.end_time) for p in plans], [
+            ('Stretching', datetime(2025, 3, 1, 7), datetime(2025, 3, 1, 7, 30)),
+            ('Stretching', datetime(2025, 3, 1, 7), datetime(2025, 3, 1, 7, 30)),
+            ('Running', datetime(2025, 3, 2, 7), datetime(2025, 3, 2, 8)),
+        ])
+        stored = db.session.execute(db.text('SELECT DISTINCT start_time FROM workout_plans WHERE activity = :a'),
+                                    {'a': 'Stretching'}).scalars().all()
+        self.assertEqual(stored, ['2025-03-01 07:00:00.000000'])
+
+    def test_rejects_bad_files(self):
+        """Unknown types, extensions and missing columns are rejected before anything is written"""
+        self.login()
+        self.assertEqual(self.upload('records', 'history.txt', b'date\n').status_code, 400)
+        response = self.upload('records', 'history.csv', b'day,minutes\n2025-01-01,30\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date', response.json['error'])
+        self.assertEqual(self.upload('friends', 'x.csv', b'a\n').status_code, 404)
+        self.assertEqual(WorkoutRecord.query.count(), 0)
+
+    def test_cli_imports_shipped_spreadsheets(self):
+        """The CLI reads the migration spreadsheets, mapping user_id and category_id columns"""
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['import', 'plans', os.path.join(ROOT, 'migration_1_plans 1.xlsx'),
+                                     '--user-id', str(self.user.id)])
+        self.assertIn('Imported 10 plans, 0 rows failed', result.output)
+        self.assertEqual(WorkoutPlan.query.filter_by(user_id=self.user.id).count(), 10)
+
+        result = runner.invoke(args=['import', 'records', os.path.join(ROOT, 'migration_2_records 1.xlsx')])
+        # Only the user created in setUp exists, so rows for other user ids are reported
+        imported = WorkoutRecord.query.count()
+        self.assertIn(f'Imported {imported} records', result.output)
+        self.assertEqual(db.session.query(db.func.sum(WorkoutDailyRollup.record_count)).scalar() or 0, imported)
+
+if __name__ == '__main__':
+    unittest.main()
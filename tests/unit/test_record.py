@@ -0,0 +1,655 @@
+import unittest
+from app import app, db
+from models import User, UserStreak, WorkoutRecord, WorkoutDailyRollup, SportsCategory
+from rollup import rebuild_rollups
+from streaks import repair_streaks
+from record import global_aggregates, parse_workout
+from versions import bump
+from datetime import datetime, date, timedelta
+from werkzeug.datastructures import MultiDict
+from .helpers import count_queries
+
+class TestRecord(unittest.TestCase):
+    def setUp(self):
+        app.config.update({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'WTF_CSRF_ENABLED': False,
+            'SECRET_KEY': 'test-key'
+        })
+        self.client = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.running = SportsCategory(name='Running', met_value=9.8)
+        self.yoga = SportsCategory(name='Yoga', met_value=3.0)
+        db.session.add_all([self.running, self.yoga])
+        db.session.commit()
+
+        timestamp = datetime.now().timestamp()
+        self.users = []
+        for i in range(3):
+            u = User(
+                username=f'user{i}_{timestamp}',
+                email=f'user{i}_{timestamp}@example.com',
+                password_hash='hash'
+            )
+            db.session.add(u)
+            self.users.append(u)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def login(self, user):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user.id
+
+    def add_record(self, user, category, days_ago=0, minutes=60, calories=500, difficulty=3):
+        record = WorkoutRecord(
+            user_id=user.id,
+            category_id=category.id,
+            date=date.today() - timedelta(days=days_ago),
+            duration_min=minutes,
+            difficulty=difficulty,
+            calories_burn=calories
+        )
+        db.session.add(record)
+        db.session.commit()
+        return record
+
+    def test_rollup_tracks_inserts_and_deletes(self):
+        """Rollup rows follow record inserts and deletes in the same transaction"""
+        self.login(self.users[0])
+        self.client.post('/api/log_cardio', data=MultiDict([
+            ('activity', 'Running'), ('duration', '30'), ('calories', '300')
+        ]))
+        record = self.add_record(self.users[0], self.running, minutes=45, calories=200, difficulty=4)
+
+        row = db.session.get(WorkoutDailyRollup, (self.users[0].id, date.today(), self.running.id))
+        self.assertEqual(row.total_min, 75)
+        self.assertEqual(row.total_calories, 500)
+        self.assertEqual(row.difficulty_sum, 5)
+        self.assertEqual(row.record_count, 2)
+
+        db.session.delete(record)
+        db.session.commit()
+        db.session.refresh(row)
+        self.assertEqual(row.total_min, 30)
+        self.assertEqual(row.record_count, 1)
+
+    def test_rebuild_rollups(self):
+        """Rebuilding the rollup reproduces the incrementally maintained rows"""
+        self.add_record(self.users[0], self.running, days_ago=1)
+        self.add_record(self.users[0], self.running, days_ago=1, minutes=15)
+        self.add_record(self.users[1], self.yoga, days_ago=3)
+        before = sorted(
+            (r.user_id, r.date, r.category_id, r.total_min, r.record_count)
+            for r in WorkoutDailyRollup.query.all()
+        )
+        db.session.execute(WorkoutDailyRollup.__table__.delete())
+        db.session.commit()
+
+        self.assertEqual(rebuild_rollups(), 2)
+        after = sorted(
+            (r.user_id, r.date, r.category_id, r.total_min, r.record_count)
+            for r in WorkoutDailyRollup.query.all()
+        )
+        self.assertEqual(before, after)
+
+    def test_dashboard_reads_rollup(self):
+        """Dashboard endpoints aggregate from the rollup"""
+        self.add_record(self.users[0], self.running, minutes=60, calories=600, difficulty=4)
+        self.add_record(self.users[0], self.yoga, days_ago=1, minutes=30, calories=100, difficulty=2)
+        self.add_record(self.users[1], self.running, minutes=120, calories=900, difficulty=2)
+        self.login(self.users[0])
+
+        metrics = self.client.get('/api/record/metrics').json
+        self.assertEqual(metrics['current_streak'], 2)
+        self.assertEqual(metrics['total_calories'], 700.0)
+        self.assertEqual(metrics['total_hours'], 1.5)
+        self.assertEqual(metrics['percentile'], 50)
+
+        aero = self.client.get('/api/record/aeroAnaerobic').json
+        self.assertEqual(aero, {'aerobic': 1.0, 'anaerobic': 0.5})
+
+        comparison = self.client.get('/api/record/categoryComparison').json
+        self.assertEqual(comparison['categories'], ['Running', 'Yoga'])
+        self.assertEqual(comparison['you'], [4.0, 2.0])
+        self.assertEqual(comparison['average'], [3.0, 2.0])
+
+        board = self.client.get('/api/record/leaderboard').json
+        self.assertEqual([row['username'] for row in board[:2]],
+                         [self.users[1].username, self.users[0].username])
+        self.assertEqual(board[0]['total_hours'], 2.0)
+        self.assertEqual(len(board), 3)
+
+    def test_trend_single_query(self):
+        """Trend returns both series from one grouped query, zero-filling empty days"""
+        self.add_record(self.users[0], self.running, minutes=90)
+        self.add_record(self.users[1], self.running, days_ago=2, minutes=180)
+        self.login(self.users[0])
+
+        with count_queries() as statements:
+            response = self.client.get('/api/record/trend?range=month')
+        self.assertEqual(response.status_code, 200)
+        # The ETag's data version read, then the trend
+        self.assertEqual(len(statements), 2)
+
+        data = response.json
+        self.assertEqual(len(data['labels']), 31)
+        self.assertEqual(data['you'][-1], 1.5)
+        self.assertEqual(data['you'][-3], 0)
+        self.assertEqual(data['average'][-1], 0.5)
+        self.assertEqual(data['average'][-3], 1.0)
+        self.assertEqual(data['average'][0], 0)
+
+    def test_leaderboard_updates_on_log(self):
+        """Logging a workout moves the user up the in-memory leaderboard"""
+        self.add_record(self.users[0], self.running, calories=300)
+        self.add_record(self.users[1], self.running, calories=500)
+        self.login(self.users[0])
+
+        board = self.client.get('/api/record/leaderboard?limit=2').json
+        self.assertEqual([row['username'] for row in board],
+                         [self.users[1].username, self.users[0].username])
+        self.assertEqual(self.client.get('/api/record/leaderboard/rank').json['rank'], 2)
+
+        self.client.post('/api/log_cardio', data=MultiDict([
+            ('activity', 'Running'), ('duration', '30'), ('calories', '400')
+        ]))
+        with count_queries() as statements:
+            rank = self.client.get('/api/record/leaderboard/rank').json
+        # Only the ETag's data version read; the rank comes from memory
+        self.assertEqual(len(statements), 1)
+        self.assertIn('FROM data_versions', statements[0])
+        self.assertEqual(rank, {'rank': 1, 'total_calories': 700.0, 'total_hours': 1.5})
+
+    def test_leaderboard_day_rollover(self):
+        """Contributions expire once their day leaves the window"""
+        from record import leaderboards
+        self.add_record(self.users[0], self.running, days_ago=7, calories=900)
+        self.add_record(self.users[1], self.running, days_ago=0, calories=100)
+        board = leaderboards['week']
+
+        self.assertEqual([uid for uid, _, _ in board.top(10)], [self.users[0].id, self.users[1].id])
+        tomorrow = date.today() + timedelta(days=1)
+        self.assertEqual(board.top(10, today=tomorrow), [(self.users[1].id, 100, 60)])
+        self.assertEqual(board.rank(self.users[0].id, today=tomorrow), (2, 0, 0))
+
+    def test_leaderboard_skips_deltas_the_load_included(self):
+        """A delta delivered after a load that already read its commit is not counted twice"""
+        from record import leaderboards
+        from rollup import rollup_changed
+        board = leaderboards['week']
+        board.reload()
+        seen = []
+        def capture(sender, deltas, version):
+            seen.append((deltas, version))
+        rollup_changed.connect(capture)
+        try:
+            self.add_record(self.users[0], self.running, calories=300)
+        finally:
+            rollup_changed.disconnect(capture)
+        deltas, version = seen[0]
+        self.assertIsNotNone(version)
+
+        # The load runs after the commit but before its signal reaches the board
+        board.reload()
+        board.apply(deltas, version)
+        self.assertEqual(board.top(10), [(self.users[0].id, 300, 60)])
+        # A commit the load did not see is still folded in
+        board.apply(deltas, version + 1)
+        self.assertEqual(board.top(10), [(self.users[0].id, 600, 120)])
+
+    def test_leaderboard_excludes_future_days(self):
+        """Like the SQL ranges, boards end today; later rows count once their day arrives"""
+        from record import leaderboards
+        board = leaderboards['week']
+        self.add_record(self.users[0], self.running, days_ago=-1, calories=900)
+        self.add_record(self.users[1], self.running, days_ago=0, calories=100)
+        self.assertEqual(board.top(10), [(self.users[1].id, 100, 60)])
+        # Deltas for later days are held aside as well
+        self.add_record(self.users[0], self.running, days_ago=-2, calories=50)
+        self.assertEqual(board.rank(self.users[0].id), (2, 0, 0))
+
+        self.login(self.users[0])
+        today = date.today()
+        week = self.client.get(f'/api/record/leaderboard?from={today - timedelta(days=7)}&to={today}').json
+        self.assertEqual(week[0]['username'], self.users[1].username)
+        self.assertEqual(week[0], self.client.get('/api/record/leaderboard').json[0])
+
+        tomorrow = today + timedelta(days=1)
+        self.assertEqual(board.top(10, today=tomorrow), [(self.users[0].id, 900, 60), (self.users[1].id, 100, 60)])
+        self.assertEqual(board.top(1, today=tomorrow + timedelta(days=1)), [(self.users[0].id, 950, 120)])
+
+    def test_percentile_histogram_bound(self):
+        """Histogram ranks stay within the documented per-bucket error"""
+        import random
+        from bisect import bisect_left
+        from percentile import MinutesHistogram
+        rng = random.Random(1)
+        minutes = [rng.randint(1, 3000) for _ in range(2000)]
+        hist = MinutesHistogram(max_minutes=8 * 24 * 60)
+        for m in minutes:
+            hist.add(m)
+        ordered = sorted(minutes)
+        for m in minutes[:200]:
+            exact = bisect_left(ordered, m)
+            in_bucket = hist._counts[hist._bucket(m)]
+            self.assertLessEqual(abs(hist.count_below(m) - exact), in_bucket - 1)
+
+    def test_percentile_ties(self):
+        """Users tied on hours share the same percentile"""
+        self.add_record(self.users[0], self.running, minutes=60)
+        self.add_record(self.users[1], self.running, minutes=60)
+        for user in self.users[:2]:
+            self.login(user)
+            self.assertEqual(self.client.get('/api/record/metrics').json['percentile'], 50)
+        self.login(self.users[2])
+        self.assertEqual(self.client.get('/api/record/metrics').json['percentile'], 0)
+
+    def test_dashboard_matches_individual_endpoints(self):
+        """The combined dashboard returns the same payloads as the separate endpoints"""
+        self.add_record(self.users[0], self.running, minutes=60, calories=600, difficulty=4)
+        self.add_record(self.users[0], self.yoga, days_ago=2, minutes=30, calories=100, difficulty=2)
+        self.add_record(self.users[1], self.running, days_ago=1, minutes=120, calories=900, difficulty=2)
+        self.login(self.users[0])
+
+        dashboard = self.client.get('/api/record/dashboard?range=month').json
+        self.assertEqual(dashboard['range'], 'month')
+        for section, url in [
+            ('metrics', '/api/record/metrics'),
+            ('trend', '/api/record/trend'),
+            ('aeroAnaerobic', '/api/record/aeroAnaerobic'),
+            ('categoryComparison', '/api/record/categoryComparison'),
+            ('leaderboard', '/api/record/leaderboard'),
+        ]:
+            self.assertEqual(dashboard[section], self.client.get(url + '?range=month').json, section)
+
+        partial = self.client.get('/api/record/dashboard?sections=metrics,leaderboard').json
+        self.assertEqual(set(partial) - {'range', 'from', 'to', 'bucket', 'snapshot_age'}, {'metrics', 'leaderboard'})
+        response = self.client.get('/api/record/dashboard?sections=bogus')
+        self.assertEqual(response.status_code, 400)
+
+    def test_streak_longer_than_range(self):
+        """Streaks are stored per user and are not capped by the selected range"""
+        for days_ago in range(40, -1, -1):
+            self.add_record(self.users[0], self.running, days_ago=days_ago)
+        self.login(self.users[0])
+        metrics = self.client.get('/api/record/metrics?range=week').json
+        self.assertEqual(metrics['current_streak'], 41)
+        self.assertEqual(metrics['longest_streak'], 41)
+
+    def test_streak_backfill_and_delete(self):
+        """Backfilled and deleted days trigger a repair of the user's streak"""
+        self.add_record(self.users[0], self.running, days_ago=0)
+        self.add_record(self.users[0], self.running, days_ago=2)
+        gap = db.session.get(UserStreak, self.users[0].id)
+        self.assertEqual((gap.current_streak, gap.longest_streak), (1, 1))
+
+        middle = self.add_record(self.users[0], self.running, days_ago=1)
+        db.session.refresh(gap)
+        self.assertEqual((gap.current_streak, gap.longest_streak), (3, 3))
+
+        db.session.delete(middle)
+        db.session.commit()
+        db.session.refresh(gap)
+        self.assertEqual((gap.current_streak, gap.longest_streak), (1, 1))
+
+        db.session.execute(UserStreak.__table__.delete())
+        db.session.commit()
+        self.assertEqual(repair_streaks(), 1)
+        repaired = db.session.get(UserStreak, self.users[0].id)
+        self.assertEqual((repaired.current_streak, repaired.last_active_date), (1, date.today()))
+
+    def test_category_comparison_cached_globals(self):
+        """Category comparison is one grouped query and caches the global half until records change"""
+        self.add_record(self.users[0], self.running, difficulty=4)
+        self.add_record(self.users[1], self.running, difficulty=2)
+        self.add_record(self.users[1], self.yoga, difficulty=1)
+        self.login(self.users[0])
+
+        with count_queries() as statements:
+            first = self.client.get('/api/record/categoryComparison').json
+        grouped = [s for s in statements if 'workout_daily_rollups' in s]
+        self.assertEqual(len(grouped), 1)
+        self.assertEqual(first['you'], [4.0, 0])
+        self.assertEqual(first['average'], [3.0, 1.0])
+
+        with count_queries() as statements:
+            self.client.get('/api/record/categoryComparison')
+        grouped = [s for s in statements if 'workout_daily_rollups' in s]
+        self.assertEqual(len(grouped), 1)
+        self.assertIn('user_id', grouped[0].split('WHERE')[1])
+
+        self.add_record(self.users[2], self.yoga, difficulty=5)
+        refreshed = self.client.get('/api/record/categoryComparison').json
+        self.assertEqual(refreshed['average'], [3.0, 3.0])
+
+    def test_long_ranges_are_bucketed(self):
+        """Year and custom ranges come back as bounded weekly/monthly buckets from one query"""
+        self.add_record(self.users[0], self.running, days_ago=0, minutes=60)
+        self.add_record(self.users[0], self.running, days_ago=200, minutes=120)
+        self.add_record(self.users[1], self.yoga, days_ago=200, minutes=240)
+        self.login(self.users[0])
+
+        with count_queries() as statements:
+            year = self.client.get('/api/record/trend?range=year').json
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(year['bucket'], 'month')
+        self.assertLessEqual(len(year['labels']), 13)
+        self.assertEqual(sum(year['you']), 3.0)
+        self.assertAlmostEqual(sum(year['average']), 7 / 3, places=1)
+
+        start = (date.today() - timedelta(days=90)).isoformat()
+        custom = self.client.get(f'/api/record/trend?from={start}').json
+        self.assertEqual(custom['bucket'], 'week')
+        self.assertEqual(custom['you'][-1], 1.0)
+        self.assertEqual(sum(custom['you']), 1.0)
+
+        metrics = self.client.get('/api/record/metrics?range=year').json
+        self.assertEqual(metrics['total_hours'], 3.0)
+        self.assertEqual(metrics['percentile'], 50)
+        board = self.client.get('/api/record/leaderboard?range=year').json
+        self.assertEqual(board[0]['username'], self.users[0].username)
+        rank = self.client.get(f'/api/record/leaderboard/rank?from={start}').json
+        self.assertEqual(rank['rank'], 1)
+
+        self.assertEqual(self.client.get('/api/record/trend?from=2024-13-01').status_code, 400)
+        self.assertEqual(self.client.get('/api/record/trend?from=2030-01-01&to=2029-01-01').status_code, 400)
+
+    def test_numpy_backend_matches_sql(self):
+        """The NumPy analytics engine returns the same dashboard as the SQL backend"""
+        from analytics import engine
+        self.add_record(self.users[0], self.running, days_ago=0, minutes=60, calories=600, difficulty=4)
+        self.add_record(self.users[0], self.yoga, days_ago=40, minutes=30, calories=100, difficulty=2)
+        self.add_record(self.users[1], self.running, days_ago=100, minutes=120, calories=900, difficulty=2)
+        self.login(self.users[0])
+        urls = ['/api/record/dashboard?range=year', '/api/record/trend?range=half_year',
+                '/api/record/categoryComparison?range=month', '/api/record/leaderboard?range=year']
+
+        expected = [self.client.get(url).json for url in urls]
+        app.config['ANALYTICS_BACKEND'] = 'numpy'
+        try:
+            self.assertEqual([self.client.get(url).json for url in urls], expected)
+            self.assertEqual(engine.size, 3)
+
+            # New rows are appended by id; edits and deletes are applied in place by id
+            last = self.add_record(self.users[2], self.yoga, days_ago=5)
+            self.client.get(urls[0])
+            self.assertEqual((engine.size, engine.last_id), (4, last.id))
+            first = WorkoutRecord.query.order_by(WorkoutRecord.id).first()
+            first.duration_min = 90
+            db.session.commit()
+            self.assertEqual(engine.refresh(), 1)
+            self.assertEqual(engine.column('duration').tolist(), [90, 30, 120, 60])
+            db.session.delete(last)
+            db.session.commit()
+            self.assertEqual(engine.refresh(), 1)
+            self.assertEqual((engine.size, engine.column('id').tolist()[-1]), (3, last.id - 1))
+            app.config.pop('ANALYTICS_BACKEND')
+            expected = [self.client.get(url).json for url in urls]
+            app.config['ANALYTICS_BACKEND'] = 'numpy'
+            self.assertEqual([self.client.get(url).json for url in urls], expected)
+        finally:
+            app.config.pop('ANALYTICS_BACKEND')
+
+    def test_numpy_reads_during_refresh(self):
+        """Reads hold the engine lock, so a concurrent refresh cannot change the columns under them"""
+        import threading
+        from analytics import WorkoutAnalytics
+        from ranges import named_range
+        engine = WorkoutAnalytics()
+        rng = named_range('year')
+        day = date.today()
+        rows = [(i, i % 7 + 1, i % 3 + 1, day, 30, 100, 2) for i in range(1, 2001)]
+        errors, done = [], threading.Event()
+
+        def write():
+            # Grow and shrink the columns like appends and in-place deletes do
+            for _ in range(200):
+                with engine._lock:
+                    engine._append(rows[:1000])
+                    engine.size -= 500
+            done.set()
+
+        def read():
+            try:
+                while not done.is_set():
+                    engine.user_totals(rng)
+                    engine.category_difficulty(1, rng)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_etag_not_modified_until_records_change(self):
+        """A matching If-None-Match returns 304 after one version read until a workout is logged"""
+        self.add_record(self.users[0], self.running)
+        self.login(self.users[0])
+        first = self.client.get('/api/record/dashboard')
+        etag = first.headers['ETag']
+
+        with count_queries() as statements:
+            cached = self.client.get('/api/record/dashboard', headers={'If-None-Match': etag})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(len(statements), 1)
+        self.assertIn('FROM data_versions', statements[0])
+        other_range = self.client.get('/api/record/dashboard?range=month', headers={'If-None-Match': etag})
+        self.assertEqual(other_range.status_code, 200)
+
+        self.add_record(self.users[1], self.yoga)
+        changed = self.client.get('/api/record/dashboard', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+
+        self.login(self.users[1])
+        other_user = self.client.get('/api/record/dashboard', headers={'If-None-Match': changed.headers['ETag']})
+        self.assertEqual(other_user.status_code, 200)
+
+        # Versions live in the database, so a write committed elsewhere (another worker, a CLI import) counts too
+        etag = other_user.headers['ETag']
+        self.assertEqual(self.client.get('/api/record/dashboard', headers={'If-None-Match': etag}).status_code, 304)
+        with db.engine.begin() as connection:
+            bump('record', self.users[1].id, connection=connection)
+        self.assertEqual(self.client.get('/api/record/dashboard', headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_refresher_serves_precomputed_snapshots(self):
+        """After a refresh, global aggregates come from snapshots and report their age"""
+        from record import refresher, precomputed
+        self.add_record(self.users[0], self.running, days_ago=100, calories=300)
+        self.add_record(self.users[1], self.running, days_ago=100, calories=900, difficulty=5)
+        self.login(self.users[0])
+        inline = self.client.get('/api/record/dashboard?range=year').json
+        self.assertEqual(inline['snapshot_age'], {'trend': 0, 'categoryComparison': 0, 'leaderboard': 0})
+
+        refresher.run_once()
+        try:
+            with count_queries() as statements:
+                response = self.client.get('/api/record/leaderboard?range=year')
+            self.assertEqual(response.headers['X-Snapshot-Age'], '0')
+            self.assertFalse([s for s in statements if 'workout_daily_rollups' in s])
+            dashboard = self.client.get('/api/record/dashboard?range=year').json
+            self.assertEqual({k: v for k, v in dashboard.items() if k != 'snapshot_age'},
+                             {k: v for k, v in inline.items() if k != 'snapshot_age'})
+
+            # Snapshots are not cleared by writes; the next refresh picks the change up
+            self.add_record(self.users[2], self.running, days_ago=100, calories=2000, difficulty=2)
+            stale = self.client.get('/api/record/leaderboard?range=year').json
+            self.assertEqual(stale[0]['username'], self.users[1].username)
+            etag = self.client.get('/api/record/leaderboard?range=year').headers['ETag']
+            refresher.run_once()
+            fresh = self.client.get('/api/record/leaderboard?range=year', headers={'If-None-Match': etag})
+            self.assertEqual(fresh.status_code, 200)
+            self.assertEqual(fresh.json[0]['username'], self.users[2].username)
+            comparison = self.client.get('/api/record/categoryComparison?range=year').json
+            self.assertEqual(comparison['average'], [3.33, 0])
+        finally:
+            precomputed.invalidate()
+
+    def test_refresher_starts_on_first_request(self):
+        """Serving processes start the refresher themselves; tests and a disabled flag do not"""
+        from record import refresher, precomputed, start_aggregate_refresher
+        self.client.get('/api/sport_categories')
+        self.assertFalse(refresher.running)
+        app.config.update({'TESTING': False, 'AGGREGATE_REFRESHER': False})
+        try:
+            self.client.get('/api/sport_categories')
+            self.assertFalse(refresher.running)
+            app.config['AGGREGATE_REFRESHER'] = True
+            self.client.get('/api/sport_categories')
+            self.assertTrue(refresher.running)
+
+            # Concurrent first requests start one thread between them
+            import threading
+            refresher.stop()
+            barrier = threading.Barrier(4)
+            def first_request():
+                barrier.wait()
+                start_aggregate_refresher(app)
+            requests = [threading.Thread(target=first_request) for _ in range(4)]
+            for thread in requests:
+                thread.start()
+            for thread in requests:
+                thread.join()
+            self.assertEqual(
+                [t for t in threading.enumerate() if t.name == 'aggregate-refresher'], [refresher._thread])
+        finally:
+            refresher.stop()
+            precomputed.invalidate()
+            app.config.update({'TESTING': True, 'AGGREGATE_REFRESHER': True})
+
+    def test_log_workouts_batch_is_idempotent(self):
+        """A synced batch is written once; resending it reports every item as a duplicate"""
+        yesterday = (date.today() - timedelta(days=1)).isoformat()
+        workouts = [
+            {'client_key': 'a1', 'activity': 'Running', 'duration': 30, 'calories': 300, 'date': yesterday},
+            {'client_key': 'a2', 'activity': 'Yoga', 'duration': '45', 'calories': '120', 'difficulty': 2},
+            {'client_key': 'a2', 'activity': 'Yoga', 'duration': 45, 'calories': 120},
+            {'client_key': 'a3', 'activity': 'Rowing', 'duration': 20, 'calories': 100},
+            {'activity': 'Running', 'duration': 20, 'calories': 100},
+        ]
+        self.login(self.users[0])
+        first = self.client.post('/api/log_workouts', json={'workouts': workouts}).json
+        self.assertEqual([r['status'] for r in first['results']],
+                         ['created', 'created', 'duplicate', 'error', 'error'])
+        self.assertEqual((first['created'], first['duplicates'], first['failed']), (2, 1, 2))
+        self.assertEqual(first['results'][2]['id'], first['results'][1]['id'])
+
+        again = self.client.post('/api/log_workouts', json={'workouts': workouts[:2]}).json
+        self.assertEqual([r['status'] for r in again['results']], ['duplicate', 'duplicate'])
+        self.assertEqual([r['id'] for r in again['results']], [r['id'] for r in first['results'][:2]])
+        self.assertEqual(WorkoutRecord.query.filter_by(user_id=self.users[0].id).count(), 2)
+
+        metrics = self.client.get('/api/record/metrics').json
+        self.assertEqual((metrics['total_calories'], metrics['current_streak']), (420.0, 2))
+        self.assertEqual(self.client.post('/api/log_workouts', json={'workouts': []}).status_code, 400)
+
+        # Keys are per user
+        self.login(self.users[1])
+        other = self.client.post('/api/log_workouts', json={'workouts': workouts[:1]}).json
+        self.assertEqual(other['created'], 1)
+
+    def test_log_workouts_rejects_non_finite_numbers(self):
+        """"inf" and "nan" durations or calories are item errors, not server errors"""
+        by_name = {'Running': self.running}
+        for field, value in [('duration', 'inf'), ('duration', '-inf'), ('duration', 'nan'),
+                             ('calories', 'nan'), ('calories', 'inf')]:
+            item = {'activity': 'Running', 'duration': 30, 'calories': 100, field: value}
+            with self.subTest(field=field, value=value):
+                with self.assertRaisesRegex(ValueError, 'Invalid field value'):
+                    parse_workout(item, by_name)
+
+        self.login(self.users[0])
+        response = self.client.post('/api/log_workouts', json={'workouts': [
+            {'activity': 'Running', 'duration': 'inf', 'calories': 1},
+            {'activity': 'Running', 'duration': 30, 'calories': 'nan'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.json['results']], ['error', 'error'])
+        self.assertEqual(WorkoutRecord.query.count(), 0)
+
+    def test_log_workouts_rejects_dates_outside_window(self):
+        """Future dates and dates older than the sync window are item errors"""
+        from record import BATCH_LOG_MAX_AGE_DAYS
+        today = date.today()
+        by_name = {'Running': self.running}
+        for day in [today + timedelta(days=1), date(2099, 1, 1), today - timedelta(days=BATCH_LOG_MAX_AGE_DAYS + 1)]:
+            item = {'activity': 'Running', 'duration': 30, 'calories': 100, 'date': day.isoformat()}
+            with self.subTest(day=day):
+                with self.assertRaisesRegex(ValueError, 'Field value out of range'):
+                    parse_workout(item, by_name)
+        oldest = today - timedelta(days=BATCH_LOG_MAX_AGE_DAYS)
+        item = {'activity': 'Running', 'duration': 30, 'calories': 100, 'date': oldest.isoformat()}
+        self.assertEqual(parse_workout(item, by_name)['date'], oldest)
+
+        self.login(self.users[0])
+        response = self.client.post('/api/log_workouts', json={'workouts': [
+            {'client_key': 'future', 'activity': 'Running', 'duration': 30, 'calories': 1e9, 'date': '2099-01-01'},
+            {'client_key': 'today', 'activity': 'Running', 'duration': 30, 'calories': 100},
+        ]})
+        self.assertEqual([r['status'] for r in response.json['results']], ['error', 'created'])
+        self.assertEqual(self.client.get('/api/record/leaderboard/rank').json['total_calories'], 100)
+        streak = db.session.get(UserStreak, self.users[0].id)
+        self.assertEqual((streak.current_streak, streak.last_active_date), (1, today))
+
+    def test_global_aggregate_cache_invalidation(self):
+        """Commits drop only the cached windows they touch, and stale computations are not stored"""
+        today = date.today()
+        current = ('leaderboard', today - timedelta(days=7), today, 10)
+        last_week = ('leaderboard', today - timedelta(days=14), today - timedelta(days=7), 10)
+        global_aggregates.put(current, ['current'])
+        global_aggregates.put(last_week, ['last week'])
+        _, generation = global_aggregates.lookup(current)
+        _, other_generation = global_aggregates.lookup(last_week)
+
+        self.add_record(self.users[0], self.running)
+        self.assertIsNone(global_aggregates.get(current))
+        self.assertEqual(global_aggregates.get(last_week), ['last week'])
+        # Computed before the commit: must not be served afterwards
+        global_aggregates.put(current, ['stale'], generation)
+        self.assertIsNone(global_aggregates.get(current))
+        global_aggregates.put(last_week, ['recomputed'], other_generation)
+        self.assertEqual(global_aggregates.get(last_week), ['recomputed'])
+
+        _, generation = global_aggregates.lookup(current)
+        global_aggregates.put(current, ['fresh'], generation)
+        self.assertEqual(global_aggregates.get(current), ['fresh'])
+        rebuild_rollups()
+        self.assertIsNone(global_aggregates.get(last_week))
+
+    def test_category_registry(self):
+        """Category lookups come from the in-memory registry, which reloads after a category commit"""
+        self.login(self.users[0])
+        self.client.get('/api/sport_categories')
+        with count_queries() as statements:
+            self.client.post('/api/log_cardio', data={'activity': 'Running', 'duration': '60', 'calories': '500'})
+            aero = self.client.get('/api/record/aeroAnaerobic').json
+        self.assertFalse([s for s in statements if 'sports_categories' in s])
+        self.assertEqual(aero, {'aerobic': 1.0, 'anaerobic': 0})
+
+        response = self.client.get('/api/sport_categories')
+        self.assertEqual([c['name'] for c in response.json], ['Running', 'Yoga'])
+        self.assertEqual(response.cache_control.max_age, 24 * 60 * 60)
+        cached = self.client.get('/api/sport_categories', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+
+        etag = self.client.get('/api/record/aeroAnaerobic').headers['ETag']
+        self.running.met_value = 5.0
+        db.session.commit()
+        reclassified = self.client.get('/api/record/aeroAnaerobic', headers={'If-None-Match': etag})
+        self.assertEqual(reclassified.json, {'aerobic': 0, 'anaerobic': 1.0})
+        changed = self.client.get('/api/sport_categories', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(changed.status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
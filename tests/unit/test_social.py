@@ -0,0 +1,587 @@
+import json
+import unittest
+from unittest import mock
+from sqlalchemy import text
+from app import app, db
+from models import User, Post, Comment, Like, Bookmark, Follow, TimelineEntry
+from social.social import reconcile_post_counts, fragments, overlays
+from social.feed_cache import LRUCache
+from social.feed_events import FeedEventLog
+from social.search import rebuild_search_index
+from social import search
+from social import timeline, trending
+from datetime import datetime, timedelta
+from versions import bump
+from .helpers import count_queries
+
+class TestSocial(unittest.TestCase):
+    def setUp(self):
+        app.config.update({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'WTF_CSRF_ENABLED': False,
+            'SECRET_KEY': 'test-key'
+        })
+        self.client = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        timestamp = datetime.now().timestamp()
+        self.users = []
+        for i in range(3):
+            u = User(
+                username=f'user{i}_{timestamp}',
+                email=f'user{i}_{timestamp}@example.com',
+                password_hash='hash'
+            )
+            db.session.add(u)
+            self.users.append(u)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def login(self, user):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user.id
+
+    def add_post(self, user, content='Morning run', minutes_ago=0):
+        post = Post(user_id=user.id, content=content,
+                    created_at=datetime.utcnow() - timedelta(minutes=minutes_ago))
+        db.session.add(post)
+        db.session.commit()
+        return post
+
+    def test_feed_etag(self):
+        """The feed answers 304 until a social write bumps the feed version"""
+        post = self.add_post(self.users[1])
+        self.login(self.users[0])
+        etag = self.client.get('/api/posts').headers['ETag']
+
+        with count_queries() as statements:
+            cached = self.client.get('/api/posts', headers={'If-None-Match': etag})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(len(statements), 1)
+        self.assertIn('FROM data_versions', statements[0])
+
+        self.client.post(f'/api/posts/{post.id}/like')
+        fresh = self.client.get('/api/posts', headers={'If-None-Match': etag})
+        self.assertEqual(fresh.status_code, 200)
+        self.assertTrue(fresh.json['posts'][0]['is_liked'])
+
+    def test_feed_keyset_pagination(self):
+        """The feed pages newest first by (created_at, id) and ends with a null cursor"""
+        same_time = datetime.utcnow() - timedelta(minutes=30)
+        posts = [self.add_post(self.users[i % 3], f'Post {i}', minutes_ago=i) for i in range(5)]
+        # Two posts sharing a timestamp are ordered by id
+        for i in range(2):
+            tied = Post(user_id=self.users[0].id, content=f'Tied {i}', created_at=same_time)
+            db.session.add(tied)
+            posts.append(tied)
+        db.session.commit()
+        expected = [p.id for p in posts[:5]] + [posts[6].id, posts[5].id]
+
+        seen, cursor = [], None
+        while True:
+            url = '/api/posts?limit=3' + (f'&cursor={cursor}' if cursor else '')
+            page = self.client.get(url).json
+            self.assertLessEqual(len(page['posts']), 3)
+            seen.extend(p['id'] for p in page['posts'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+        # A post written while paging does not shift later pages
+        first = self.client.get('/api/posts?limit=3').json
+        self.add_post(self.users[1], 'Brand new')
+        second = self.client.get(f"/api/posts?limit=3&cursor={first['next_cursor']}").json
+        self.assertEqual([p['id'] for p in second['posts']], expected[3:6])
+
+        self.assertEqual(self.client.get('/api/posts?cursor=not-a-cursor').status_code, 400)
+        self.assertEqual(len(self.client.get('/api/posts?limit=1000').json['posts']), len(expected) + 1)
+
+    def populate(self, count):
+        """Add posts that every user has liked, bookmarked and commented on."""
+        for i in range(count):
+            post = self.add_post(self.users[i % 3], f'Post {i}', minutes_ago=i)
+            for user in self.users:
+                db.session.add_all([
+                    Like(user_id=user.id, post_id=post.id),
+                    Bookmark(user_id=user.id, post_id=post.id),
+                    Comment(user_id=user.id, post_id=post.id, content=f'Nice {i}'),
+                ])
+        db.session.commit()
+        reconcile_post_counts()
+
+    def test_feed_query_count_is_constant(self):
+        """A feed page costs the same number of queries however many posts it holds"""
+        self.login(self.users[0])
+        self.populate(2)
+        # Measure cold caches: every fragment and the overlay come from the database
+        with count_queries() as small:
+            small_page = self.client.get('/api/posts').json['posts']
+        self.populate(18)
+        overlays.clear()
+        with count_queries() as large:
+            large_page = self.client.get('/api/posts').json['posts']
+        fragments.clear()
+        with count_queries() as bookmarked:
+            saved = self.client.get('/api/posts/bookmarked').json['posts']
+
+        self.assertEqual(len(small_page), 2)
+        self.assertEqual(len(large_page), 20)
+        self.assertEqual(len(saved), 20)
+        # Data versions, page ids, posts with authors, comments with authors, the viewer's overlay
+        self.assertLessEqual(len(large), 5)
+        self.assertEqual(len(small), len(large))
+        self.assertLessEqual(len(bookmarked), 5)
+
+        post = large_page[0]
+        self.assertEqual((post['likes'], post['bookmarks'], len(post['comments'])), (3, 3, 3))
+        self.assertTrue(post['is_liked'] and post['is_bookmarked'])
+        self.assertEqual({c['username'] for c in post['comments']}, {u.username for u in self.users})
+
+    def test_post_counters(self):
+        """Endpoints keep the post counters in step and reconcile repairs drift"""
+        post = self.add_post(self.users[1])
+        for user in self.users:
+            self.login(user)
+            self.client.post(f'/api/posts/{post.id}/like')
+            self.client.post(f'/api/posts/{post.id}/bookmark')
+            self.client.post(f'/api/posts/{post.id}/comments', json={'text': 'Go!'})
+        self.login(self.users[0])
+        self.client.post(f'/api/posts/{post.id}/like')
+        db.session.refresh(post)
+        self.assertEqual((post.like_count, post.comment_count, post.bookmark_count), (2, 3, 3))
+
+        with count_queries() as statements:
+            feed = self.client.get('/api/posts').json['posts'][0]
+        self.assertEqual((feed['likes'], feed['comment_count'], feed['bookmarks']), (2, 3, 3))
+        self.assertFalse(any('count(' in s.lower() for s in statements))
+
+        self.assertEqual(self.client.post('/api/posts/9999/like').status_code, 404)
+        self.assertEqual(Like.query.filter_by(post_id=9999).count(), 0)
+
+        post.like_count, post.bookmark_count = 40, 0
+        db.session.commit()
+        self.assertEqual(reconcile_post_counts(), 1)
+        db.session.refresh(post)
+        self.assertEqual((post.like_count, post.comment_count, post.bookmark_count), (2, 3, 3))
+        self.assertEqual(reconcile_post_counts(), 0)
+
+    def test_feed_cache_layers(self):
+        """Fragments are shared between viewers and only the written post is reloaded"""
+        self.populate(3)
+        liked = self.add_post(self.users[2], 'Liked later', minutes_ago=-1)
+        self.login(self.users[0])
+        self.client.get('/api/posts')
+        before = fragments.stats()
+
+        self.login(self.users[1])
+        with count_queries() as statements:
+            page = self.client.get('/api/posts').json['posts']
+        after = fragments.stats()
+        self.assertEqual(after['hits'] - before['hits'], 4)
+        self.assertEqual(after['misses'], before['misses'])
+        # Data versions, page ids and user1's overlay
+        self.assertEqual(len(statements), 3)
+        self.assertTrue(page[1]['is_liked'])
+        self.assertFalse(page[0]['is_liked'])
+
+        self.client.post(f'/api/posts/{liked.id}/like')
+        page = self.client.get('/api/posts').json['posts']
+        self.assertEqual(fragments.stats()['misses'], after['misses'] + 1)
+        self.assertEqual((page[0]['likes'], page[0]['is_liked']), (1, True))
+
+        # Another viewer's overlay is untouched by user1's like
+        self.login(self.users[0])
+        overlay_hits = overlays.stats()['hits']
+        self.assertFalse(self.client.get('/api/posts').json['posts'][0]['is_liked'])
+        self.assertEqual(overlays.stats()['hits'], overlay_hits + 1)
+
+        # A like written by another process is seen through the feed data version
+        with db.engine.begin() as connection:
+            connection.execute(text('INSERT INTO likes (user_id, post_id) VALUES (:user, :post)'),
+                               {'user': self.users[0].id, 'post': liked.id})
+            connection.execute(text('UPDATE posts SET like_count = like_count + 1 WHERE id = :post'),
+                               {'post': liked.id})
+            bump('feed', self.users[0].id, connection=connection)
+        # Requests here share the test's session; a server request would start with a fresh one
+        db.session.expire_all()
+        page = self.client.get('/api/posts').json['posts']
+        self.assertEqual((page[0]['likes'], page[0]['is_liked']), (2, True))
+
+    def test_comment_previews_and_paging(self):
+        """The feed embeds the newest comments and the comments endpoint pages through the rest"""
+        post = self.add_post(self.users[1])
+        self.login(self.users[0])
+        for i in range(8):
+            self.client.post(f'/api/posts/{post.id}/comments', json={'text': f'Comment {i}'})
+
+        feed_post = self.client.get('/api/posts').json['posts'][0]
+        self.assertEqual(feed_post['comment_count'], 8)
+        self.assertEqual([c['text'] for c in feed_post['comments']], ['Comment 5', 'Comment 6', 'Comment 7'])
+
+        texts, cursor = [], feed_post['comments_cursor']
+        while cursor:
+            page = self.client.get(f'/api/posts/{post.id}/comments?limit=2&cursor={cursor}').json
+            texts.extend(c['text'] for c in page['comments'])
+            cursor = page['next_cursor']
+        self.assertEqual(texts, [f'Comment {i}' for i in range(4, -1, -1)])
+
+        newest = self.client.get(f'/api/posts/{post.id}/comments').json
+        self.assertEqual(len(newest['comments']), 8)
+        self.assertIsNone(newest['next_cursor'])
+        self.assertEqual(self.client.get('/api/posts/9999/comments').status_code, 404)
+
+        quiet = self.add_post(self.users[2], minutes_ago=5)
+        self.assertIsNone(self.client.get('/api/posts').json['posts'][1]['comments_cursor'])
+        self.assertEqual(quiet.comment_count, 0)
+
+    def open_stream(self, last_event_id=None):
+        headers = {'Last-Event-ID': last_event_id} if last_event_id else {}
+        response = self.client.get('/api/posts/stream', headers=headers, buffered=False)
+        self.addCleanup(response.close)
+        chunks = iter(response.response)
+        self.assertTrue(next(chunks).startswith(b'retry:'))
+        return chunks
+
+    def next_event(self, chunks):
+        """Parse the next SSE message into (id, event, data)."""
+        fields = dict(line.split(': ', 1) for line in next(chunks).decode().strip().split('\n'))
+        return fields['id'], fields['event'], json.loads(fields['data'])
+
+    def test_feed_stream(self):
+        """The stream pushes counter and comment deltas and resumes from Last-Event-ID"""
+        post = self.add_post(self.users[1])
+        chunks = self.open_stream()
+        self.login(self.users[0])
+        self.client.post(f'/api/posts/{post.id}/like')
+        self.client.post(f'/api/posts/{post.id}/comments', json={'text': 'Nice pace'})
+        self.client.post('/api/posts', json={'content': 'Rest day'})
+
+        like_id, kind, data = self.next_event(chunks)
+        self.assertEqual((kind, data['post_id'], data['likes'], data['comment_count']), ('counts', post.id, 1, 0))
+        _, kind, data = self.next_event(chunks)
+        self.assertEqual((kind, data['comment']['text'], data['comment_count']), ('comment', 'Nice pace', 1))
+        _, kind, data = self.next_event(chunks)
+        self.assertEqual((kind, data['content'], data['likes']), ('post', 'Rest day', 0))
+
+        # A reconnecting client only gets what came after its last event
+        resumed = self.open_stream(like_id)
+        self.assertEqual(self.next_event(resumed)[1], 'comment')
+        self.assertEqual(self.next_event(resumed)[1], 'post')
+        self.assertEqual(self.next_event(self.open_stream('0-1'))[1], 'reset')
+
+    def test_feed_event_log_overflow(self):
+        """Clients that fell behind the retained log are told to reset"""
+        log = FeedEventLog(max_events=2)
+        first = log.publish('counts', {})
+        for _ in range(3):
+            log.publish('counts', {})
+        self.assertIsNone(log.position(log.event_id(first)))
+        self.assertEqual(log.position(log.event_id(first + 1)), first + 1)
+        self.assertIsNone(log.wait(first, timeout=0))
+        self.assertEqual([seq for seq, _, _ in log.wait(first + 2, timeout=0)], [first + 3])
+        self.assertEqual(log.wait(first + 3, timeout=0), [])
+
+    def test_search(self):
+        """Search ranks posts and comments with FTS5, pages by cursor and follows deletes"""
+        river = self.add_post(self.users[0], 'Running by the river this morning')
+        swim = self.add_post(self.users[1], 'Evening swim, 2km', minutes_ago=5)
+        self.add_post(self.users[2], 'Rest day', minutes_ago=10)
+        db.session.add(Comment(user_id=self.users[2].id, post_id=swim.id, content='Great run yesterday too'))
+        db.session.commit()
+
+        results = self.client.get('/api/posts/search?q=run').json['results']
+        self.assertEqual({r['id'] for r in results}, {river.id, swim.id})
+        by_id = {r['id']: r for r in results}
+        self.assertEqual(by_id[swim.id]['matched'], 'comment')
+        self.assertIn('<mark>Running</mark>', by_id[river.id]['snippet'])
+
+        first = self.client.get('/api/posts/search?q=run&limit=1').json
+        second = self.client.get(f"/api/posts/search?q=run&limit=1&cursor={first['next_cursor']}").json
+        self.assertEqual([r['id'] for r in first['results'] + second['results']], [r['id'] for r in results])
+        self.assertIsNone(second['next_cursor'])
+
+        # FTS5 syntax typed by users is searched as plain words
+        self.assertEqual(self.client.get('/api/posts/search?q="river OR (').status_code, 200)
+        self.assertEqual(len(self.client.get('/api/posts/search?q="river OR (').json['results']), 0)
+        self.assertEqual(len(self.client.get('/api/posts/search?q=rivers').json['results']), 1)
+        self.assertEqual(self.client.get('/api/posts/search?q=').status_code, 400)
+
+        db.session.delete(river)
+        db.session.commit()
+        self.assertEqual([r['id'] for r in self.client.get('/api/posts/search?q=run').json['results']], [swim.id])
+
+        connection = db.session.connection()
+        connection.exec_driver_sql('DELETE FROM search_index')
+        self.assertEqual(rebuild_search_index(connection), 3)
+        db.session.commit()
+        self.assertEqual(len(self.client.get('/api/posts/search?q=swim').json['results']), 1)
+
+    def test_search_pages_survive_writes(self):
+        """Writes between pages move every BM25 score; later pages still follow the first page's ranking"""
+        river = self.add_post(self.users[0], 'Running by the river this morning')
+        for i in range(6):
+            self.add_post(self.users[i % 3], f'Run number {i}, a long and easy run', minutes_ago=20 + i)
+        first = self.client.get('/api/posts/search?q=run&limit=3').json
+        ranked = [r['id'] for r in self.client.get('/api/posts/search?q=run').json['results']]
+        self.assertEqual([r['id'] for r in first['results']], ranked[:3])
+        new_post = self.add_post(self.users[0], 'Run run run, the shortest run')
+        db.session.add(Comment(user_id=self.users[1].id, post_id=river.id, content='run run run'))
+        db.session.commit()
+        seen, cursor = [r['id'] for r in first['results']], first['next_cursor']
+        while cursor:
+            page = self.client.get(f'/api/posts/search?q=run&limit=3&cursor={cursor}').json
+            seen.extend(r['id'] for r in page['results'])
+            cursor = page['next_cursor']
+        self.assertEqual(seen, ranked)
+        self.assertNotIn(new_post.id, seen)
+        # Without the cached list the window is ranked again, still without the newer rows
+        search._results.clear()
+        page = self.client.get(f"/api/posts/search?q=run&limit=3&cursor={first['next_cursor']}").json
+        self.assertNotIn(new_post.id, [r['id'] for r in page['results']])
+        self.assertEqual(len(page['results']), 3)
+
+    def test_idempotent_reactions(self):
+        """PUT and DELETE set and clear reactions, and repeating them changes nothing"""
+        post = self.add_post(self.users[1])
+        self.login(self.users[0])
+        first = self.client.put(f'/api/posts/{post.id}/like').json
+        again = self.client.put(f'/api/posts/{post.id}/like').json
+        self.assertEqual((first['changed'], first['likes']), (True, 1))
+        self.assertEqual((again['changed'], again['likes']), (False, 1))
+        self.assertEqual(Like.query.filter_by(post_id=post.id).count(), 1)
+
+        self.client.put(f'/api/posts/{post.id}/bookmark')
+        for _ in range(2):
+            cleared = self.client.delete(f'/api/posts/{post.id}/like').json
+        self.assertEqual((cleared['changed'], cleared['likes'], cleared['bookmarks']), (False, 0, 1))
+        self.assertEqual(self.client.put('/api/posts/9999/like').status_code, 404)
+        self.assertEqual(self.client.get('/api/posts').json['posts'][0]['is_bookmarked'], True)
+
+    def test_bulk_reactions(self):
+        """A burst of reactions is applied in one request, last write per post winning"""
+        posts = [self.add_post(self.users[1], f'Post {i}', minutes_ago=i) for i in range(3)]
+        self.login(self.users[0])
+        burst = [
+            {'post_id': posts[0].id, 'type': 'like', 'on': True},
+            {'post_id': posts[0].id, 'type': 'bookmark', 'on': True},
+            {'post_id': posts[1].id, 'type': 'like', 'on': True},
+            {'post_id': posts[1].id, 'type': 'like', 'on': False},
+            {'post_id': posts[2].id, 'type': 'like', 'on': True},
+            {'post_id': 9999, 'type': 'like', 'on': True},
+        ]
+        with count_queries() as statements:
+            result = self.client.post('/api/reactions', json={'reactions': burst}).json
+        counts = {p['post_id']: (p['likes'], p['bookmarks']) for p in result['posts']}
+        self.assertEqual(counts, {posts[0].id: (1, 1), posts[1].id: (0, 0), posts[2].id: (1, 0)})
+        self.assertEqual(result['not_found'], [9999])
+        # Known posts, like inserts and deletes, bookmark inserts, counter updates,
+        # then the counters read for the live events and for the response
+        self.assertLessEqual(len(statements), 8)
+
+        repeat = self.client.post('/api/reactions', json={'reactions': burst}).json
+        self.assertEqual(repeat['posts'], result['posts'])
+        self.assertEqual(Like.query.filter_by(user_id=self.users[0].id).count(), 2)
+
+        bad = {'reactions': [{'post_id': posts[0].id, 'type': 'clap', 'on': True}]}
+        self.assertEqual(self.client.post('/api/reactions', json=bad).status_code, 400)
+        self.assertEqual(self.client.post('/api/reactions', json={'reactions': []}).status_code, 400)
+
+    def test_bookmarked_posts_pagination(self):
+        """Bookmarks page newest bookmark first at a cost independent of how many there are"""
+        posts = [self.add_post(self.users[1], f'Post {i}', minutes_ago=i) for i in range(30)]
+        user = self.users[0]
+        now = datetime.utcnow()
+        # Bookmarked in the reverse of posting order
+        for i, post in enumerate(posts):
+            db.session.add(Bookmark(user_id=user.id, post_id=post.id, created_at=now - timedelta(minutes=30 - i)))
+        db.session.commit()
+        reconcile_post_counts()
+        self.login(user)
+
+        seen, cursor = [], None
+        while True:
+            url = '/api/posts/bookmarked?limit=7' + (f'&cursor={cursor}' if cursor else '')
+            with count_queries() as statements:
+                page = self.client.get(url).json
+            self.assertLessEqual(len(statements), 5)
+            seen.extend(p['id'] for p in page['posts'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, [p.id for p in reversed(posts)])
+        self.assertTrue(all(p['is_bookmarked'] and p['bookmarks'] == 1 for p in page['posts']))
+
+        plan = ' '.join(row[-1] for row in db.session.execute(text(
+            'EXPLAIN QUERY PLAN SELECT post_id FROM bookmarks WHERE user_id = 1 '
+            'ORDER BY created_at DESC, post_id DESC LIMIT 8')))
+        self.assertIn('ix_bookmarks_user_id_created_at', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def timeline_ids(self, limit=50):
+        seen, cursor = [], None
+        while True:
+            url = f'/api/timeline?limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+            page = self.client.get(url).json
+            seen.extend(p['id'] for p in page['posts'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                return seen
+
+    def test_follow_and_home_timeline(self):
+        """Posts fan out to followers' timelines; following backfills and unfollowing removes"""
+        reader, author, other = self.users
+        old = self.add_post(author, 'Before the follow', minutes_ago=5)
+        self.add_post(other, 'Not followed', minutes_ago=4)
+        self.login(reader)
+        response = self.client.put(f'/api/users/{author.id}/follow')
+        self.assertEqual(response.json, {'success': True, 'changed': True, 'following': True, 'follower_count': 1})
+        self.assertFalse(self.client.put(f'/api/users/{author.id}/follow').json['changed'])
+        self.assertEqual(self.client.put(f'/api/users/{reader.id}/follow').status_code, 400)
+        self.assertEqual(self.client.put('/api/users/999/follow').status_code, 404)
+        self.assertEqual(self.timeline_ids(), [old.id])
+
+        self.login(author)
+        self.client.post('/api/posts', json={'content': 'Fresh run'})
+        self.login(reader)
+        self.client.post('/api/posts', json={'content': 'My own run'})
+        self.assertEqual(TimelineEntry.query.count(), 4)
+        timeline_posts = self.client.get('/api/timeline').json['posts']
+        self.assertEqual([p['content'] for p in timeline_posts], ['My own run', 'Fresh run', 'Before the follow'])
+        self.assertEqual(timeline_posts[1]['user_id'], author.id)
+
+        response = self.client.delete(f'/api/users/{author.id}/follow')
+        self.assertEqual(response.json['follower_count'], 0)
+        self.assertEqual([p['content'] for p in self.client.get('/api/timeline').json['posts']], ['My own run'])
+        with self.client.session_transaction() as sess:
+            sess.clear()
+        self.assertEqual(self.client.get('/api/timeline').status_code, 401)
+
+    def test_fan_out_on_read(self):
+        """Authors over the follower limit are merged into timelines on read, without duplicates"""
+        reader, celebrity, friend = self.users
+        for user in (celebrity, friend):
+            db.session.add(Follow(follower_id=reader.id, followee_id=user.id))
+        db.session.commit()
+        # Written before the switch, so they are in the entries and on the read path
+        early = [self.add_post(celebrity, f'Early {i}', minutes_ago=100 + i) for i in range(3)]
+        self.assertEqual(timeline.rebuild_timelines(), 3 + 3)
+        db.session.commit()
+        self.assertEqual(db.session.get(User, celebrity.id).follower_count, 1)
+
+        with mock.patch.object(timeline, 'FANOUT_FOLLOWER_LIMIT', 0):
+            for i in range(10):
+                for author in (celebrity, friend):
+                    self.login(author)
+                    self.client.post('/api/posts', json={'content': f'{author.username} {i}'})
+            self.assertTrue(db.session.get(User, celebrity.id).fanout_on_read)
+            self.assertTrue(db.session.get(User, friend.id).fanout_on_read)
+            # Each post only went to its author's own timeline
+            self.assertEqual(TimelineEntry.query.filter_by(user_id=reader.id).count(), 3)
+
+            self.login(reader)
+            expected = [p.id for p in Post.query.order_by(Post.created_at.desc(), Post.id.desc())]
+            self.assertEqual(self.timeline_ids(limit=4), expected)
+            self.assertEqual(len(expected), 23)
+            with count_queries() as statements:
+                self.client.get('/api/timeline?limit=5')
+            self.assertLessEqual(len(statements), 5)
+
+            self.assertEqual(timeline.rebuild_timelines(), 3 + 10 + 10)
+            db.session.commit()
+            self.assertEqual(self.timeline_ids(limit=7), expected)
+
+        plan = ' '.join(row[-1] for row in db.session.execute(text(
+            'EXPLAIN QUERY PLAN SELECT post_id FROM timeline_entries WHERE user_id = 1 '
+            'ORDER BY created_at DESC, post_id DESC LIMIT 21')))
+        self.assertIn('ix_timeline_entries_user_id_created_at', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_trending(self):
+        """Hot scores follow reactions incrementally and decay with age; the top is read from the index"""
+        old = self.add_post(self.users[0], 'Two days ago', minutes_ago=48 * 60)
+        mid = self.add_post(self.users[0], 'An hour ago', minutes_ago=60)
+        new = self.add_post(self.users[0], 'Just now')
+        reconcile_post_counts()
+        self.login(self.users[1])
+
+        def trending_ids():
+            return [p['id'] for p in self.client.get('/api/posts/trending?limit=3').json['posts']]
+        self.assertEqual(trending_ids(), [new.id, mid.id, old.id])
+
+        for user in self.users:
+            self.login(user)
+            self.client.put(f'/api/posts/{old.id}/like')
+        self.client.post('/api/reactions', json={'reactions': [
+            {'post_id': mid.id, 'type': 'bookmark', 'on': True},
+            {'post_id': new.id, 'type': 'like', 'on': True},
+        ]})
+        self.assertEqual(trending_ids(), [old.id, mid.id, new.id])
+        # Incremental updates agree with a full rescore
+        self.assertEqual(trending.rebuild_hot_scores(), 0)
+
+        for user in self.users:
+            self.login(user)
+            self.client.delete(f'/api/posts/{old.id}/like')
+        self.client.post(f'/api/posts/{new.id}/comments', json={'text': 'Nice'})
+        self.assertEqual(trending_ids(), [new.id, mid.id, old.id])
+        self.assertEqual(trending.rebuild_hot_scores(), 0)
+
+        self.assertAlmostEqual(trending.hot_subtract(trending.hot_add(2.0, 1.5), 1.5), 2.0)
+        plan = ' '.join(row[-1] for row in db.session.execute(text(
+            'EXPLAIN QUERY PLAN SELECT id FROM posts ORDER BY hot_score DESC, id DESC LIMIT 20')))
+        self.assertIn('ix_posts_hot_score', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_lru_cache(self):
+        """LRUCache evicts the least recently used entry and ignores stale puts"""
+        cache = LRUCache(2)
+        _, generation = cache.get_many([1, 2])
+        cache.put_many({1: 'a', 2: 'b'}, generation)
+        cache.get_many([1])
+        _, generation = cache.get_many([3])
+        cache.put_many({3: 'c'}, generation)
+        self.assertEqual(cache.get_many([1, 2, 3])[0], {1: 'a', 3: 'c'})
+
+        # Only the keys invalidated during a fill are dropped from it
+        _, generation = cache.get_many([4, 5])
+        cache.invalidate(4)
+        cache.invalidate(1)
+        cache.put_many({4: 'stale', 5: 'e'}, generation)
+        self.assertEqual(cache.get_many([1, 4, 5])[0], {5: 'e'})
+        self.assertEqual(cache.stats(), {'hits': 4, 'misses': 8, 'size': 2, 'max_entries': 2})
+
+        # Once invalidations older than a fill are forgotten, the whole fill is dropped
+        _, generation = cache.get_many([6])
+        cache.invalidate(7, 8, 9)
+        cache.put_many({6: 'f'}, generation)
+        self.assertEqual(cache.get_many([6])[0], {})
+        _, generation = cache.get_many([6])
+        cache.put_many({6: 'f'}, generation)
+        self.assertEqual(cache.get_many([6])[0], {6: 'f'})
+
+        _, generation = cache.get_many([1])
+        cache.clear()
+        cache.put_many({1: 'stale'}, generation)
+        self.assertEqual(cache.stats()['size'], 0)
+
+        # Data versions noted by this process keep the entries; any other version clears them
+        cache.sync(3)
+        cache.put_many({1: 'a'}, cache.get_many([1])[1])
+        cache.note(4)
+        cache.note(5)
+        cache.sync(5)
+        self.assertEqual(cache.get_many([1])[0], {1: 'a'})
+        cache.note(7)
+        cache.sync(7)
+        self.assertEqual(cache.get_many([1])[0], {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""Data versions and conditional GETs for the record and social read endpoints.
+
+Each user has a version counter, and each shared scope ('record' for the
+dashboard and leaderboard, 'feed' for posts) has a global one. The counters
+are rows of ``data_versions``, bumped in the same transaction as the write
+they describe: record versions from ``rollup_staged``, which ORM flushes and
+bulk imports both send, and social writes by calling ``bump`` before their
+commit. Every worker process, CLI command and import sharing the database
+sees the same counters, and a write never commits without its bump.
+
+``conditional_get`` builds an ETag from those counters, the database epoch
+(a random number written when the tables are created, so a recreated
+database never matches older tags), the caller's id, today's date (named
+ranges slide daily) and the request URL. A request whose ``If-None-Match``
+matches gets a 304 after one primary-key read of ``data_versions``, before
+the view runs any other query. The view can reuse the versions read there
+through ``read_version``.
+"""
+import secrets
+import zlib
+from datetime import date
+from functools import wraps
+
+from flask import g, make_response, request, session
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, DataVersion
+from rollup import rollup_rebuilt, rollup_staged
+
+EPOCH_KEY = 'epoch'
+
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+
+def bump(scope, *user_ids, connection=None):
+    """Record a write to a shared scope, touching the given users' data.
+
+    Runs in the current transaction of ``connection`` or the session; the
+    caller commits, so the new versions become visible with the write.
+    Returns {key: new version}.
+    """
+    table = DataVersion.__table__
+    keys = [scope] + [user_key(user_id) for user_id in sorted(set(user_ids))]
+    stmt = insert(table).values([{'key': key, 'version': 1} for key in keys])
+    stmt = stmt.on_conflict_do_update(index_elements=[table.c.key], set_={'version': table.c.version + 1})
+    return dict((connection or db.session).execute(stmt.returning(table.c.key, table.c.version)).all())
+
+
+def committed_version(scope):
+    """Scalar subquery for the version of ``scope``, to read it in the same statement as the data it covers."""
+    return select(DataVersion.version).where(DataVersion.key == scope).scalar_subquery()
+
+
+@rollup_staged.connect
+def _bump_record_versions(sender, connection, deltas):
+    # The returned version travels with the deltas to rollup_changed receivers
+    return bump('record', *{user_id for user_id, _, _ in deltas}, connection=connection)['record']
+
+
+@rollup_rebuilt.connect
+def _bump_record_rebuilt(sender):
+    # Recreated tables start a new epoch instead (see _new_epoch)
+    if sender is db.metadata:
+        return
+    # rebuild_rollups has already committed the rebuilt table
+    bump('record')
+    db.session.commit()
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _new_epoch(target, connection, **kw):
+    table = DataVersion.__table__
+    connection.execute(
+        insert(table).values(key=EPOCH_KEY, version=secrets.randbits(31)).on_conflict_do_nothing()
+    )
+
+
+def read_version(scope):
+    """The committed version of ``scope``, reusing the one read for the request's ETag if there was one."""
+    found = g.get('data_versions')
+    if found is not None and scope in found:
+        return found[scope]
+    return db.session.scalar(select(DataVersion.version).where(DataVersion.key == scope)) or 0
+
+
+def current_etag(scopes, user_id):
+    keys = [EPOCH_KEY, *scopes] + ([user_key(user_id)] if user_id else [])
+    table = DataVersion.__table__
+    found = dict(db.session.execute(select(table.c.key, table.c.version).where(table.c.key.in_(keys))).all())
+    g.data_versions = {key: found.get(key, 0) for key in keys}
+    versions = '.'.join(str(found.get(scope, 0)) for scope in scopes)
+    user_version = found.get(user_key(user_id), 0) if user_id else 0
+    url = zlib.crc32(request.full_path.encode())
+    return f'{found.get(EPOCH_KEY, 0):x}-{date.today().isoformat()}-{user_id or 0}.{user_version}-{versions}-{url:x}'
+
+
+def conditional_get(*scopes):
+    """Answer GETs with 304 when the client's ETag still matches the data versions."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+            # Read the versions before the view so a concurrent write can only make the tag stale
+            etag = current_etag(scopes, session.get('user_id'))
+            try:
+                if request.if_none_match.contains(etag):
+                    response = make_response('', 304)
+                    response.set_etag(etag)
+                    return response
+                response = make_response(view(*args, **kwargs))
+            finally:
+                # g can outlive the request when an app context was already pushed
+                g.pop('data_versions', None)
+            if response.status_code == 200:
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator